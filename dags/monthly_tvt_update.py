@@ -1,7 +1,15 @@
+import sys
+
 from airflow import DAG
+from airflow.decorators import task
+from airflow.models.param import Param
 from airflow.operators.bash import BashOperator
 from datetime import datetime
 
+# Steps go through the warm worker (scripts/tvt_worker.py), which runs them in one long-lived process
+# with the libraries already imported; without a worker on this host they run cold as before
+RUN = 'python /opt/airflow/scripts/tvt_worker.py run'
+
 default_args = {
     'owner': 'you',
     'depends_on_past': False,
@@ -12,9 +20,14 @@ with DAG(
     dag_id='monthly_tvt_update',
     default_args=default_args,
     start_date=datetime(2025, 7, 1),
-    schedule_interval='@monthly',
+    schedule_interval=None,  # triggered by tvt_release_watch when FHWA publishes a new release
     catchup=False,
     tags=['tvt','monthly'],
+    params={
+        # e.g. 2004-01:2004-12 re-extracts only those report months and recomputes the months they revise
+        'backfill': Param('', type='string', pattern=r'^(\d{4}-\d{2}(:\d{4}-\d{2})?)?$',
+                          description='Report-month range YYYY-MM:YYYY-MM to backfill; empty for a full run'),
+    },
 ) as dag:
 
     t0 = BashOperator(
@@ -28,46 +41,109 @@ with DAG(
         """
     )
 
+    # Starts the warm worker unless one is running; never fails (steps fall back to cold runs)
+    warm_worker = BashOperator(
+        task_id='warm_worker',
+        bash_command='python /opt/airflow/scripts/tvt_worker.py start'
+    )
+
+    # FHWA workbooks and the BEA/BLS series, fetched concurrently in one process
     t1 = BashOperator(
-        task_id='download_and_prepare',
-        bash_command='python /opt/airflow/scripts/data_prep.py'
+        task_id='ingest_sources',
+        bash_command=f'{RUN} tvt_ingest.py'
+    )
+
+    @task
+    def list_report_years(params=None) -> list:
+        """Report years with workbooks in the raw dir; one mapped extract task per year."""
+        if params and params.get('backfill'):
+            return []  # A backfill extracts its own range inside the merge tasks
+        # Same discovery as the scripts (directory listing, or the raw store manifest)
+        sys.path.insert(0, '/opt/airflow/scripts')
+        from tvt_partials import report_years as years_with_workbooks
+        return years_with_workbooks()
+
+    report_years = list_report_years()
+
+    # Workbook parsing is sharded by report year across the Celery workers; each mapped task opens
+    # every workbook of its year once, runs all registered table extractors over it (tvt_extract.py)
+    # and writes one partial per table that the merge tasks below reduce and publish
+    extract_tables = BashOperator.partial(task_id='extract_tables').expand(
+        bash_command=report_years.map(
+            lambda year: f'{RUN} tvt_extract.py --extract-year {year}'
+        )
+    )
+
+    # The snapshot current before the merges publish; a blocking anomaly gate rolls back to it
+    base_snapshot = BashOperator(
+        task_id='base_snapshot',
+        bash_command='python /opt/airflow/scripts/tvt_snapshot.py current',
     )
 
+    merge_mode = "{{ '--backfill ' ~ params.backfill if params.backfill else '--reduce' }}"
+
     t2 = BashOperator(
         task_id='merge_state_miles',
-        bash_command='python /opt/airflow/scripts/merge_tvt_page456.py'
+        bash_command=f'{RUN} merge_tvt_page456.py {merge_mode}',
+        trigger_rule='none_failed',  # the mapped extracts are skipped during a backfill
     )
 
     t3 = BashOperator(
         task_id='merge_national_vmt',
-        bash_command='python /opt/airflow/scripts/merge_tvt_data.py'
+        bash_command=f'{RUN} merge_tvt_data.py {merge_mode}',
+        trigger_rule='none_failed',
     )
 
-    t4 = BashOperator(
-        task_id='fetch_gdp',
-        bash_command='python /opt/airflow/scripts/GDP_All_Year.py'
+    # Functional-class and regional VMT, from the same partials
+    merge_tables = BashOperator(
+        task_id='merge_tvt_tables',
+        bash_command=f'{RUN} merge_tvt_tables.py {merge_mode}',
+        trigger_rule='none_failed',
     )
 
-    t5 = BashOperator(
-        task_id='fetch_labor_participation',
-        bash_command='python /opt/airflow/scripts/Labor_Participation_Rate_1948_present.py'
+    # Scores the newest month of every state series; with TVT_ANOMALY_GATE=block an unreviewed
+    # anomaly fails this task, rolls `current` back to the pre-merge snapshot and nothing downstream
+    # is published
+    base = "{{ ti.xcom_pull(task_ids='base_snapshot') or '' }}"
+    anomaly_check = BashOperator(
+        task_id='anomaly_check',
+        bash_command=f'{RUN} tvt_anomaly.py --base "{base}"',
+        retries=0,  # after a rollback a retry would score the previous month and pass
     )
 
-    t6 = BashOperator(
-        task_id='fetch_cpi',
-        bash_command='python /opt/airflow/scripts/CPI_1913_present.py'
+    # State-month gap report and the state table on a complete month grid (TVT_GAP_IMPUTE fills short gaps)
+    gaps = BashOperator(
+        task_id='gap_check',
+        bash_command=f'{RUN} tvt_gaps.py'
     )
 
-    t7 = BashOperator(
-        task_id='fetch_unemployment',
-        bash_command='python /opt/airflow/scripts/Unemployment_Rate_1948_present.py'
+    # Derived stage: seasonally adjusted state and national series (cached factors, trailing months recomputed)
+    seasonal = BashOperator(
+        task_id='seasonal_adjust',
+        bash_command=f'{RUN} tvt_seasonal.py'
     )
 
-    t8 = BashOperator(
+    t4 = BashOperator(
         task_id='build_master_db',
-        bash_command='python /opt/airflow/scripts/tvt_db.py'
+        bash_command=f'{RUN} tvt_db.py'
+    )
+
+    # Next-month nowcast of every series, with CPI/unemployment from the master DB as regressors
+    nowcast = BashOperator(
+        task_id='nowcast',
+        bash_command=f'{RUN} tvt_nowcast.py'
+    )
+
+    t5 = BashOperator(
+        task_id='build_change_feed',
+        bash_command=f'{RUN} tvt_change_feed.py'
     )
 
     # Define dependencies
-    t0 >> t1 >> t2 >> t3 >> t4 >> t5 >> t6 >> t7 >> t8
+    t0 >> warm_worker >> t1 >> report_years
+    # The merges run side by side: each commits only the months it changed (tvt_commit.py), and
+    # publishes are serialized by the publish lock, so no snapshot drops another merge's output
+    extract_tables >> [t2, t3, merge_tables] >> anomaly_check
+    t1 >> base_snapshot >> [t2, t3, merge_tables]
+    anomaly_check >> gaps >> seasonal >> t4 >> nowcast >> t5
     
\ No newline at end of file
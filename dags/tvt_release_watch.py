@@ -0,0 +1,37 @@
+from airflow import DAG
+from airflow.operators.trigger_dagrun import TriggerDagRunOperator
+from datetime import datetime, timedelta
+
+from tvt_release import TvtReleaseSensor
+
+default_args = {
+    'owner': 'you',
+    'depends_on_past': False,
+    'retries': 1,
+}
+
+# Replaces the @monthly schedule of monthly_tvt_update: the sensor waits (deferred, in the
+# triggerer) until FHWA links a TVT workbook we have not downloaded, then starts the pipeline.
+with DAG(
+    dag_id='tvt_release_watch',
+    default_args=default_args,
+    start_date=datetime(2025, 7, 1),
+    schedule_interval='@daily',
+    catchup=False,
+    max_active_runs=1,
+    tags=['tvt','sensor'],
+) as dag:
+
+    wait = TvtReleaseSensor(
+        task_id='wait_for_tvt_release',
+        timeout=int(timedelta(hours=23).total_seconds()),
+        soft_fail=True,  # nothing new today: skip the trigger instead of failing
+    )
+
+    trigger = TriggerDagRunOperator(
+        task_id='trigger_monthly_tvt_update',
+        trigger_dag_id='monthly_tvt_update',
+        conf={'releases': "{{ ti.xcom_pull(task_ids='wait_for_tvt_release') }}"},
+    )
+
+    wait >> trigger
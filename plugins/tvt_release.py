@@ -0,0 +1,231 @@
+# Release detection for the FHWA Traffic Volume Trends page.
+# TvtReleaseSensor defers to TvtReleaseTrigger, which polls the TVT page from the triggerer: it hashes
+# the list of workbook links (tvt<mon><yy> as published, or <yy><mon>tvt) and only diffs the list when the
+# hash changes, firing as soon as a link appears that has no workbook in the raw data directory yet. No
+# worker slot is held while waiting. A page without any workbook link (a layout change, an error page)
+# is reported instead of being read as "nothing new".
+#
+# Try it against the local stand-in page (scripts/tvt_standin.py --port 8000; file:// URLs work too):
+#   python plugins/tvt_release.py --url http://127.0.0.1:8000/tvt.cfm --raw-dir /tmp/empty --once
+
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+import hashlib
+from datetime import timedelta
+from html.parser import HTMLParser
+from urllib.parse import urlsplit
+from urllib.request import url2pathname
+
+import requests
+
+BASE_PAGE = os.getenv('TVT_BASE_PAGE', 'https://www.fhwa.dot.gov/policyinformation/travel_monitoring/tvt.cfm')
+RAW_DIR = os.getenv('TVT_RAW_DIR', '/opt/airflow/data/tvt/raw')
+# Manifest of the content-addressed raw store (scripts/tvt_raw_store.py); its workbooks count as known too
+STORE_MANIFEST = os.path.join(os.getenv('TVT_STORE_DIR', '/opt/airflow/data/tvt/store'), 'manifest.json')
+# Seconds between page checks while deferred
+POLL_INTERVAL = float(os.getenv('TVT_RELEASE_POLL_INTERVAL', '3600'))
+
+# Names as published (tvtapr25.xlsx) and as data_prep.py renames them (25aprtvt.xlsx); links may use either
+LINK_RE = re.compile(r'^tvt(?P<mon>[a-z]{3,4})(?P<yy>\d{2})\.xlsx?$', re.IGNORECASE)
+RAW_RE = re.compile(r'^(?P<yy>\d{2})(?P<mon>[a-z]{3,4})tvt\.xlsx?$', re.IGNORECASE)
+
+
+class NoReleaseLinks(ValueError):
+    """The page links no TVT workbook at all."""
+
+
+def release_id(mon: str, yy: str) -> str:
+    """Canonical id of a monthly release, e.g. 'tvtapr25' (tvtsept24 → 'tvtsep24')."""
+    return f'tvt{mon.lower()[:3]}{yy}'
+
+
+class _LinkParser(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.hrefs = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            href = dict(attrs).get('href')
+            if href:
+                self.hrefs.append(href.strip())
+
+
+def parse_release(name: str) -> str | None:
+    """Release id of a workbook file name in either naming, or None for other files."""
+    m = LINK_RE.match(name) or RAW_RE.match(name)
+    return release_id(m.group('mon'), m.group('yy')) if m else None
+
+
+def release_links(html: str) -> list:
+    """Sorted release ids of every tvt<mon><yy> / <yy><mon>tvt .xls/.xlsx link on the page."""
+    parser = _LinkParser()
+    parser.feed(html)
+    releases = {parse_release(os.path.basename(urlsplit(href).path)) for href in parser.hrefs}
+    return sorted(releases - {None})
+
+
+def links_hash(releases: list) -> str:
+    return hashlib.sha256('\n'.join(releases).encode()).hexdigest()
+
+
+def known_releases(raw_dir: str = RAW_DIR, store_manifest: str = STORE_MANIFEST) -> list:
+    """Release ids that already have a workbook in the raw directory or the raw store."""
+    names = os.listdir(raw_dir) if os.path.isdir(raw_dir) else []
+    if os.path.exists(store_manifest):
+        with open(store_manifest) as f:
+            names += [e['name'] for e in json.load(f)['entries'].values()]
+    return sorted({parse_release(name) for name in names} - {None})
+
+
+def fetch_page(url: str, timeout: float = 30) -> str:
+    """GET the release page; file:// URLs are read from disk (local stand-in pages)."""
+    parts = urlsplit(url)
+    if parts.scheme == 'file':
+        with open(url2pathname(parts.path), encoding='utf-8', errors='replace') as f:
+            return f.read()
+    resp = requests.get(url, timeout=timeout)
+    resp.raise_for_status()
+    return resp.text
+
+
+def check(url: str, known: list) -> dict:
+    """
+    One synchronous check: the page's release list, its hash and the releases not in `known`.
+    Raises NoReleaseLinks when the page links no workbook.
+    """
+    releases = release_links(fetch_page(url))
+    if not releases:
+        raise NoReleaseLinks(f'{url} links no TVT workbooks (tvt<mon><yy> or <yy><mon>tvt .xls/.xlsx)')
+    return {
+        'url': url,
+        'hash': links_hash(releases),
+        'releases': releases,
+        'new': sorted(set(releases) - set(known)),
+    }
+
+
+try:
+    from airflow.sensors.base import BaseSensorOperator, PokeReturnValue
+    from airflow.triggers.base import BaseTrigger, TriggerEvent
+except ImportError:  # Outside Airflow only the helpers and the CLI check are available
+    BaseSensorOperator = PokeReturnValue = BaseTrigger = TriggerEvent = None
+
+
+if BaseTrigger is not None:
+
+    class TvtReleaseTrigger(BaseTrigger):
+        """Poll the TVT page from the triggerer until a release not in `known` is linked."""
+
+        def __init__(self, url: str, known: list, poll_interval: float = POLL_INTERVAL,
+                     last_hash: str | None = None):
+            super().__init__()
+            self.url = url
+            self.known = list(known)
+            self.poll_interval = poll_interval
+            self.last_hash = last_hash
+
+        def serialize(self):
+            return ('tvt_release.TvtReleaseTrigger', {
+                'url': self.url,
+                'known': self.known,
+                'poll_interval': self.poll_interval,
+                'last_hash': self.last_hash,
+            })
+
+        async def run(self):
+            while True:
+                try:
+                    html = await asyncio.to_thread(fetch_page, self.url)
+                except Exception as e:  # The page being briefly unreachable is not a failure
+                    self.log.warning('TVT page check failed: %s', e)
+                else:
+                    releases = release_links(html)
+                    if not releases:
+                        self.log.warning('TVT page %s links no workbooks; layout changed?', self.url)
+                        await asyncio.sleep(self.poll_interval)
+                        continue
+                    digest = links_hash(releases)
+                    if digest != self.last_hash:
+                        new = sorted(set(releases) - set(self.known))
+                        if new:
+                            yield TriggerEvent({
+                                'url': self.url, 'hash': digest, 'releases': releases, 'new': new,
+                            })
+                            return
+                        self.last_hash = digest
+                await asyncio.sleep(self.poll_interval)
+
+    class TvtReleaseSensor(BaseSensorOperator):
+        """
+        Wait until the TVT page links a release that has no workbook in `raw_dir`.
+
+        Deferrable by default. Either way the new release ids are the task's return value (XCom
+        `return_value`).
+        """
+
+        template_fields = ('url', 'raw_dir')
+
+        def __init__(self, *, url: str = BASE_PAGE, raw_dir: str = RAW_DIR,
+                     poll_interval: float = POLL_INTERVAL, deferrable: bool = True, **kwargs):
+            kwargs.setdefault('poke_interval', poll_interval)
+            super().__init__(**kwargs)
+            self.url = url
+            self.raw_dir = raw_dir
+            self.poll_interval = poll_interval
+            self.deferrable = deferrable
+
+        def poke(self, context) -> PokeReturnValue:
+            new = check(self.url, known_releases(self.raw_dir))['new']
+            if new:
+                self.log.info('New TVT releases: %s', new)
+            return PokeReturnValue(is_done=bool(new), xcom_value=new)
+
+        def execute(self, context):
+            if not self.deferrable:
+                return super().execute(context)
+            known = known_releases(self.raw_dir)
+            result = check(self.url, known)
+            if result['new']:
+                self.log.info('New TVT releases: %s', result['new'])
+                return result['new']
+            self.defer(
+                trigger=TvtReleaseTrigger(self.url, known, self.poll_interval, last_hash=result['hash']),
+                method_name='execute_complete',
+                timeout=timedelta(seconds=self.timeout),
+            )
+
+        def execute_complete(self, context, event=None):
+            self.log.info('New TVT releases: %s', event['new'])
+            return event['new']
+
+
+def main() -> None:
+    import argparse
+    parser = argparse.ArgumentParser(description='Check the TVT page for releases not yet downloaded.')
+    parser.add_argument('--url', default=BASE_PAGE)
+    parser.add_argument('--raw-dir', default=RAW_DIR)
+    parser.add_argument('--once', action='store_true', help='check once instead of polling')
+    parser.add_argument('--interval', type=float, default=POLL_INTERVAL)
+    args = parser.parse_args()
+
+    known = known_releases(args.raw_dir)
+    while True:
+        try:
+            result = check(args.url, known)
+        except NoReleaseLinks as e:
+            print(f'✖ {e}')
+            sys.exit(2)
+        print(f"{len(result['releases'])} releases linked (hash {result['hash'][:12]}), "
+              f"{len(known)} downloaded, new: {', '.join(result['new']) or 'none'}")
+        if result['new'] or args.once:
+            sys.exit(0 if result['new'] else 1)
+        time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    main()
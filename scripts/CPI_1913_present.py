@@ -1,12 +1,16 @@
 import os
-import requests
 import json
 import pandas as pd
 
-API_KEY    = ""
+import tvt_http
+import tvt_profile
+from tvt_metrics import RunMetrics
+
+API_KEY    = os.getenv("API_KEY_BLS", "")
 SERIES_ID  = "CUUR0000SA0"
 START_YEAR = "1913"
 END_YEAR   = "2025"
+BLS_API_URL = os.getenv("BLS_API_URL", "https://api.bls.gov/publicAPI/v2/timeseries/data/")
 
 # Use Airflow's data directory inside the container
 BASE_DIR = os.getenv('AIRFLOW_HOME', '/opt/airflow')
@@ -14,27 +18,10 @@ DATA_DIR = os.path.join(BASE_DIR, 'data')
 OUTPUT_DIR = os.getenv('CPI_DIR', os.path.join(DATA_DIR, 'bls', 'cpi'))
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 CSV_PATH = os.path.join(OUTPUT_DIR, "cpiu_1913_2025.csv")
+RAW_PATH = os.path.join(OUTPUT_DIR, "cpiu_raw.json")
+
+metrics = RunMetrics('fetch_cpi')
 
-# 1) Fetch from BLS
-payload = {
-    "seriesid": [SERIES_ID],
-    "startyear": START_YEAR,
-    "endyear": END_YEAR,
-    "registrationKey": API_KEY
-}
-resp = requests.post(
-    "https://api.bls.gov/publicAPI/v2/timeseries/data/",
-    json=payload,
-    headers={"Content-Type": "application/json"}
-)
-resp.raise_for_status()
-data = resp.json()
-
-# (Optional) save raw JSON
-with open(os.path.join(OUTPUT_DIR, "cpiu_raw.json"), "w") as f:
-    json.dump(data, f, indent=2)
-
-# 2) Parse & sort the data
 month_map = {
     "January": 1,  "February": 2,  "March":     3,
     "April":   4,  "May":      5,  "June":      6,
@@ -42,30 +29,84 @@ month_map = {
     "October":10,  "November":11,  "December": 12
 }
 
-series = data["Results"]["series"][0]["data"]
-# sort ascending year → month
-series.sort(key=lambda r: (int(r["year"]), month_map[r["periodName"]]))
-
-# Build DataFrame
-records = []
-for rec in series:
-    y = int(rec["year"])
-    m = month_map[rec["periodName"]]
-    cpi = float(rec["value"])
-    records.append({"year": y, "month": m, "cpi": cpi})
-
-df = pd.DataFrame(records)
-df["Date"] = pd.to_datetime(df[["year", "month"]].assign(day=1))
-df = df.sort_values("Date")
-
-# Compute inflation vs. same month last year
-df["Inflation"] = df["cpi"].pct_change(periods=12) * 100
-
-# Format columns
-df["Monthn"] = df["month"]
-df["Year"] = df["year"]
-df["CPI"] = df["cpi"]
-
-final = df[["Date", "Monthn", "Year", "CPI", "Inflation"]]
-final.to_csv(CSV_PATH, index=False)
-print(f"Done! CSV written to: {CSV_PATH}")
+
+def request() -> dict:
+    """The BLS public API request for the series (tvt_http splits the years into windows BLS accepts)."""
+    payload = {
+        "seriesid": [SERIES_ID],
+        "startyear": START_YEAR,
+        "endyear": END_YEAR,
+        "registrationKey": API_KEY
+    }
+    return {
+        "api": "bls",
+        "method": "POST",
+        "url": BLS_API_URL,
+        "json": payload,
+        "headers": {"Content-Type": "application/json"},
+    }
+
+
+def fetch() -> dict:
+    """Fetch the series from the BLS public API."""
+    resp = tvt_http.request(**request())
+    metrics.incr('cache_hits' if resp.from_cache else 'bytes_fetched', 1 if resp.from_cache else len(resp.content))
+    return resp.json()
+
+
+def transform(data: dict) -> pd.DataFrame:
+    """Parse & sort the BLS records, then derive year-over-year inflation."""
+    series = data["Results"]["series"][0]["data"]
+    # sort ascending year → month
+    series.sort(key=lambda r: (int(r["year"]), month_map[r["periodName"]]))
+
+    # Build DataFrame
+    records = []
+    for rec in series:
+        y = int(rec["year"])
+        m = month_map[rec["periodName"]]
+        cpi = float(rec["value"])
+        records.append({"year": y, "month": m, "cpi": cpi})
+
+    df = pd.DataFrame(records)
+    df["Date"] = pd.to_datetime(df[["year", "month"]].assign(day=1))
+    df = df.sort_values("Date")
+
+    # Compute inflation vs. same month last year
+    df["Inflation"] = df["cpi"].pct_change(periods=12) * 100
+
+    # Format columns
+    df["Monthn"] = df["month"]
+    df["Year"] = df["year"]
+    df["CPI"] = df["cpi"]
+
+    return df[["Date", "Monthn", "Year", "CPI", "Inflation"]]
+
+
+def save_raw(data: dict) -> None:
+    with open(RAW_PATH, "w") as f:
+        json.dump(data, f, indent=2)
+
+
+def process(data: dict) -> None:
+    """Build and write the CPI table from a raw BLS response."""
+    with metrics.phase('consolidate'):
+        final = transform(data)
+    with metrics.phase('write'):
+        final.to_csv(CSV_PATH, index=False)
+    metrics.incr('rows_out', len(final))
+    print(f"Done! CSV written to: {CSV_PATH}")
+
+
+def main() -> None:
+    with metrics.run():
+        with metrics.phase('fetch'):
+            data = fetch()
+
+        # (Optional) save raw JSON
+        with metrics.phase('write'):
+            save_raw(data)
+        process(data)
+
+if __name__ == '__main__':
+    tvt_profile.run(main)
@@ -1,66 +1,111 @@
 import os
-import requests
+import json
 import pandas as pd
 
+import tvt_http
+import tvt_profile
+from tvt_metrics import RunMetrics
+
 # 1) SETUP
 BEA_API_KEY = ""
-BASE_URL    = "https://apps.bea.gov/api/data/"
+BASE_URL    = os.getenv("BEA_API_URL", "https://apps.bea.gov/api/data/")
 
 BASE_DIR = os.getenv('AIRFLOW_HOME', '/opt/airflow')
 DATA_DIR = os.path.join(BASE_DIR, 'data')
 OUTPUT_DIR = os.getenv('GDP_DIR', os.path.join(DATA_DIR, 'bea', 'gdp'))
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 CSV_PATH = os.path.join(OUTPUT_DIR, "gdp_current_bil.csv")
+RAW_PATH = os.path.join(OUTPUT_DIR, "gdp_raw.json")
+
+metrics = RunMetrics('fetch_gdp')
+
+
+def request() -> dict:
+    """The BEA API request for the quarterly nominal GDP records (NIPA T10105)."""
+    params = {
+        "UserID":       BEA_API_KEY,
+        "method":       "GetData",
+        "DataSetName":  "NIPA",
+        "TableName":    "T10105",    # Gross Domestic Product, current dollars (millions)
+        "Frequency":    "Q",         # quarterly
+        "Year":         "ALL",       # all years
+        "ResultFormat": "JSON"
+    }
+    return {"api": "bea", "method": "GET", "url": BASE_URL, "params": params}
+
+
+def fetch() -> dict:
+    """Fetch the raw BEA response."""
+    resp = tvt_http.request(**request())
+    metrics.incr('cache_hits' if resp.from_cache else 'bytes_fetched', 1 if resp.from_cache else len(resp.content))
+    return resp.json()
+
+
+def save_raw(data: dict) -> None:
+    with open(RAW_PATH, "w") as f:
+        json.dump(data, f, indent=2)
+
+
+def transform(raw: list) -> pd.DataFrame:
+    """Turn the raw BEA records into the quarterly GDP table."""
+    # 3) LOAD into a DataFrame
+    df = pd.DataFrame(raw)
+
+    # 4) DROP duplicate quarters
+    df = df.drop_duplicates(subset="TimePeriod", keep="first")
+
+    # 5) CLEAN & TRANSFORM
+    # strip commas and cast to float
+    df["Millions"] = (
+        df["DataValue"]
+          .str.replace(",", "")
+          .astype(float)
+    )
+
+    # convert to billions & round to one decimal
+    df["Billions"] = (df["Millions"] / 1000).round(1)
+
+    # parse Year and Quarter
+    df["Year"]    = df["TimePeriod"].str[:4].astype(int)
+    df["QtrNum"]  = df["TimePeriod"].str[-1].astype(int)
+    df["Quarter"] = df["Year"].astype(str) + " Q" + df["QtrNum"].astype(str)
+
+    # map quarter to month abbrev and two-digit year
+    q2mon = {1: "Jan", 2: "Apr", 3: "Jul", 4: "Oct"}
+    df["MonAbbr"] = df["QtrNum"].map(q2mon)
+    df["YY"]      = df["Year"] % 100
+    df["Date"]    = df["MonAbbr"] + " " + df["YY"].apply(lambda x: f"{x:02d}")
+
+    # 6) SELECT the final table
+    final = df[["Quarter", "Date", "Billions"]]
+    final.columns = [
+        "Quarter",
+        "Date",
+        "GDP in billions of current dollars"
+    ]
+    return final
+
+
+def process(data: dict) -> None:
+    """Build and write the GDP table from a raw BEA response."""
+    raw = data["BEAAPI"]["Results"]["Data"]
+    metrics.incr('rows_in', len(raw))
+    with metrics.phase('consolidate'):
+        final = transform(raw)
+    with metrics.phase('write'):
+        final.to_csv(CSV_PATH, index=False)
+    metrics.incr('rows_out', len(final))
+    print(f"Done!  CSV written to: {CSV_PATH}")
+
+
+def main() -> None:
+    with metrics.run():
+        with metrics.phase('fetch'):
+            data = fetch()
+        with metrics.phase('write'):
+            save_raw(data)
+        process(data)
+
 
-# 2) FETCH the raw data
-params = {
-    "UserID":       BEA_API_KEY,
-    "method":       "GetData",
-    "DataSetName":  "NIPA",
-    "TableName":    "T10105",    # Gross Domestic Product, current dollars (millions)
-    "Frequency":    "Q",         # quarterly
-    "Year":         "ALL",       # all years
-    "ResultFormat": "JSON"
-}
-resp = requests.get(BASE_URL, params=params)
-resp.raise_for_status()
-raw = resp.json()["BEAAPI"]["Results"]["Data"]
-
-# 3) LOAD into a DataFrame
-df = pd.DataFrame(raw)
-
-# 4) DROP duplicate quarters
-df = df.drop_duplicates(subset="TimePeriod", keep="first")
-
-# 5) CLEAN & TRANSFORM
-# strip commas and cast to float
-df["Millions"] = (
-    df["DataValue"]
-      .str.replace(",", "")
-      .astype(float)
-)
-
-# convert to billions & round to one decimal
-df["Billions"] = (df["Millions"] / 1000).round(1)
-
-# parse Year and Quarter
-df["Year"]    = df["TimePeriod"].str[:4].astype(int)
-df["QtrNum"]  = df["TimePeriod"].str[-1].astype(int)
-df["Quarter"] = df["Year"].astype(str) + " Q" + df["QtrNum"].astype(str)
-
-# map quarter to month abbrev and two-digit year
-q2mon = {1: "Jan", 2: "Apr", 3: "Jul", 4: "Oct"}
-df["MonAbbr"] = df["QtrNum"].map(q2mon)
-df["YY"]      = df["Year"] % 100
-df["Date"]    = df["MonAbbr"] + " " + df["YY"].apply(lambda x: f"{x:02d}")
-
-# 6) SELECT & WRITE the final table
-final = df[["Quarter", "Date", "Billions"]]
-final.columns = [
-    "Quarter",
-    "Date",
-    "GDP in billions of current dollars"
-]
-
-final.to_csv(CSV_PATH, index=False)
-print(f"Done!  CSV written to: {CSV_PATH}")
+if __name__ == '__main__':
+    tvt_profile.run(main)
@@ -1,36 +1,24 @@
 import os
-import requests, json, csv
+import json, csv
 
-API_KEY    = ""
+import tvt_http
+import tvt_profile
+from tvt_metrics import RunMetrics
+
+API_KEY    = os.getenv("API_KEY_BLS", "")
 SERIES_ID  = "LNS11300000"
 START_YEAR = "1948"
 END_YEAR   = "2025"
+BLS_API_URL = os.getenv("BLS_API_URL", "https://api.bls.gov/publicAPI/v2/timeseries/data/")
 
 BASE_DIR = os.getenv('AIRFLOW_HOME', '/opt/airflow')
 DATA_DIR = os.path.join(BASE_DIR, 'data')
 OUTPUT_DIR = os.getenv('LFS_DIR', os.path.join(DATA_DIR, 'bls', 'labor_participation'))
 os.makedirs(OUTPUT_DIR, exist_ok=True)
+RAW_PATH = os.path.join(OUTPUT_DIR, "lfs_participation_raw.json")
+
+metrics = RunMetrics('fetch_labor_participation')
 
-# 1) Fetch from BLS via POST
-payload = {
-    "seriesid": [SERIES_ID],
-    "startyear": START_YEAR,
-    "endyear": END_YEAR,
-    "registrationKey": API_KEY
-}
-resp = requests.post(
-    "https://api.bls.gov/publicAPI/v2/timeseries/data/",
-    json=payload,
-    headers={"Content-Type": "application/json"}
-)
-resp.raise_for_status()
-data = resp.json()
-
-# (optional) save the raw JSON
-with open(os.path.join(OUTPUT_DIR, "lfs_participation_raw.json"), "w") as jf:
-    json.dump(data, jf, indent=2)
-
-# 2) Parse & sort
 month_map = {
     "January":   1, "February":  2, "March":     3,
     "April":     4, "May":       5, "June":      6,
@@ -38,25 +26,78 @@ month_map = {
     "October":  10, "November": 11, "December": 12
 }
 
-series = data["Results"]["series"][0]["data"]
-# sort by year, then month
-series.sort(key=lambda r: (int(r["year"]), month_map[r["periodName"]]))
-
-# 3) Write CSV
-csv_path = os.path.join(OUTPUT_DIR, "lfs_participation_1948_2025.csv")
-with open(csv_path, "w", newline="") as cf:
-    writer = csv.writer(cf)
-    writer.writerow([
-        "Date",
-        "Monthn",
-        "Year",
-        "Monthly Labor Participation Rate"
-    ])
-    for rec in series:
-        year = int(rec["year"])
-        m    = month_map[rec["periodName"]]
-        val  = float(rec["value"])
-        date = f"{year}-{m:02d}-01"
-        writer.writerow([date, m, year, val])
-
-print(f"Done. CSV written to:\n  {csv_path}")
+
+def request() -> dict:
+    """The BLS public API request for the series (tvt_http splits the years into windows BLS accepts)."""
+    payload = {
+        "seriesid": [SERIES_ID],
+        "startyear": START_YEAR,
+        "endyear": END_YEAR,
+        "registrationKey": API_KEY
+    }
+    return {
+        "api": "bls",
+        "method": "POST",
+        "url": BLS_API_URL,
+        "json": payload,
+        "headers": {"Content-Type": "application/json"},
+    }
+
+
+def fetch() -> dict:
+    """Fetch the series from the BLS public API."""
+    resp = tvt_http.request(**request())
+    metrics.incr('cache_hits' if resp.from_cache else 'bytes_fetched', 1 if resp.from_cache else len(resp.content))
+    return resp.json()
+
+
+def save_raw(data: dict) -> None:
+    with open(RAW_PATH, "w") as jf:
+        json.dump(data, jf, indent=2)
+
+
+def write_outputs(data: dict) -> str:
+    """Parse, sort and write the CSV; returns the CSV path."""
+    # 2) Parse & sort
+    series = data["Results"]["series"][0]["data"]
+    # sort by year, then month
+    series.sort(key=lambda r: (int(r["year"]), month_map[r["periodName"]]))
+
+    # 3) Write CSV
+    csv_path = os.path.join(OUTPUT_DIR, "lfs_participation_1948_2025.csv")
+    with open(csv_path, "w", newline="") as cf:
+        writer = csv.writer(cf)
+        writer.writerow([
+            "Date",
+            "Monthn",
+            "Year",
+            "Monthly Labor Participation Rate"
+        ])
+        for rec in series:
+            year = int(rec["year"])
+            m    = month_map[rec["periodName"]]
+            val  = float(rec["value"])
+            date = f"{year}-{m:02d}-01"
+            writer.writerow([date, m, year, val])
+    metrics.incr('rows_out', len(series))
+    return csv_path
+
+
+def process(data: dict) -> None:
+    with metrics.phase('write'):
+        csv_path = write_outputs(data)
+    print(f"Done. CSV written to:\n  {csv_path}")
+
+
+def main() -> None:
+    with metrics.run():
+        with metrics.phase('fetch'):
+            data = fetch()
+        # (optional) save the raw JSON
+        with metrics.phase('write'):
+            save_raw(data)
+        process(data)
+
+
+if __name__ == '__main__':
+    tvt_profile.run(main)
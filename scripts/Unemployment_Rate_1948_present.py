@@ -1,37 +1,24 @@
 import os
-import requests
 import json
 import csv
 
-API_KEY    = ""
+import tvt_http
+import tvt_profile
+from tvt_metrics import RunMetrics
+
+API_KEY    = os.getenv("API_KEY_BLS", "")
 SERIES_ID  = "LNS14000000"
 START_YEAR = "1948"
 END_YEAR   = "2025"
+BLS_API_URL = os.getenv("BLS_API_URL", "https://api.bls.gov/publicAPI/v2/timeseries/data/")
 
 BASE_DIR = os.getenv('AIRFLOW_HOME', '/opt/airflow')
 DATA_DIR = os.path.join(BASE_DIR, 'data')
 OUTPUT_DIR = os.getenv('UNEMP_DIR', os.path.join(DATA_DIR, 'bls', 'unemployment'))
 os.makedirs(OUTPUT_DIR, exist_ok=True)
+RAW_PATH = os.path.join(OUTPUT_DIR, "unemployment_rate.json")
 
-# 1) Fetch from BLS
-payload = {
-    "seriesid": [SERIES_ID],
-    "startyear": START_YEAR,
-    "endyear": END_YEAR,
-    "registrationKey": API_KEY
-}
-resp = requests.post(
-    "https://api.bls.gov/publicAPI/v2/timeseries/data/",
-    json=payload,
-    headers={"Content-Type": "application/json"}
-)
-resp.raise_for_status()
-data = resp.json()
-
-# save raw JSON
-json_path = os.path.join(OUTPUT_DIR, "unemployment_rate.json")
-with open(json_path, "w") as f:
-    json.dump(data, f, indent=2)
+metrics = RunMetrics('fetch_unemployment')
 
 # month name → number
 month_map = {
@@ -41,32 +28,84 @@ month_map = {
     "October":10,  "November":11,  "December": 12
 }
 
-# extract & sort
-series_data = data["Results"]["series"][0]["data"]
-series_data.sort(
-    key=lambda rec: (
-        int(rec["year"]),
-        month_map[rec["periodName"]]
+
+def request() -> dict:
+    """The BLS public API request for the series (tvt_http splits the years into windows BLS accepts)."""
+    payload = {
+        "seriesid": [SERIES_ID],
+        "startyear": START_YEAR,
+        "endyear": END_YEAR,
+        "registrationKey": API_KEY
+    }
+    return {
+        "api": "bls",
+        "method": "POST",
+        "url": BLS_API_URL,
+        "json": payload,
+        "headers": {"Content-Type": "application/json"},
+    }
+
+
+def fetch() -> dict:
+    """Fetch the series from the BLS public API."""
+    resp = tvt_http.request(**request())
+    metrics.incr('cache_hits' if resp.from_cache else 'bytes_fetched', 1 if resp.from_cache else len(resp.content))
+    return resp.json()
+
+
+def save_raw(data: dict) -> None:
+    with open(RAW_PATH, "w") as f:
+        json.dump(data, f, indent=2)
+
+
+def write_outputs(data: dict) -> str:
+    """Write the CSV; returns its path."""
+    # extract & sort
+    series_data = data["Results"]["series"][0]["data"]
+    series_data.sort(
+        key=lambda rec: (
+            int(rec["year"]),
+            month_map[rec["periodName"]]
+        )
     )
-)
-
-# write CSV
-csv_path = os.path.join(OUTPUT_DIR, "unemployment_rate.csv")
-with open(csv_path, "w", newline="") as f:
-    writer = csv.writer(f)
-    writer.writerow([
-        "Date",
-        "Monthn",
-        "Year",
-        "Monthly Unemployment rate",
-        "Monthly Unemployment in tenth"
-    ])
-    for rec in series_data:
-        year = int(rec["year"])
-        mnum = month_map[rec["periodName"]]
-        rate = float(rec["value"])
-        rate_tenth = int(round(rate * 10))
-        date = f"{year}-{mnum:02d}-01"
-        writer.writerow([date, mnum, year, rate, rate_tenth])
-
-print(f"Done. Files written to:\n  {json_path}\n  {csv_path}")
+
+    # write CSV
+    csv_path = os.path.join(OUTPUT_DIR, "unemployment_rate.csv")
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow([
+            "Date",
+            "Monthn",
+            "Year",
+            "Monthly Unemployment rate",
+            "Monthly Unemployment in tenth"
+        ])
+        for rec in series_data:
+            year = int(rec["year"])
+            mnum = month_map[rec["periodName"]]
+            rate = float(rec["value"])
+            rate_tenth = int(round(rate * 10))
+            date = f"{year}-{mnum:02d}-01"
+            writer.writerow([date, mnum, year, rate, rate_tenth])
+    metrics.incr('rows_out', len(series_data))
+    return csv_path
+
+
+def process(data: dict) -> None:
+    with metrics.phase('write'):
+        csv_path = write_outputs(data)
+    print(f"Done. Files written to:\n  {RAW_PATH}\n  {csv_path}")
+
+
+def main() -> None:
+    with metrics.run():
+        with metrics.phase('fetch'):
+            data = fetch()
+        # save raw JSON
+        with metrics.phase('write'):
+            save_raw(data)
+        process(data)
+
+
+if __name__ == '__main__':
+    tvt_profile.run(main)
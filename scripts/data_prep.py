@@ -8,11 +8,17 @@ from bs4 import BeautifulSoup
 from urllib.parse import urljoin
 import pandas as pd
 
+import tvt_profile
+import tvt_raw_store
+from tvt_metrics import RunMetrics
+
 # -- Configuration: adjust these paths/URLs if needed
-BASE_PAGE = 'https://www.fhwa.dot.gov/policyinformation/travel_monitoring/tvt.cfm'
+BASE_PAGE = os.getenv('TVT_BASE_PAGE', 'https://www.fhwa.dot.gov/policyinformation/travel_monitoring/tvt.cfm')
 BASE_DIR = os.getenv('AIRFLOW_HOME', '/opt/airflow')
 DATA_DIR = os.path.join(BASE_DIR, 'data')
 DOWNLOAD_DIR = os.getenv('TVT_RAW_DIR', os.path.join(DATA_DIR, 'tvt', 'raw'))
+# With TVT_RAW_SOURCE=store, prepared workbooks are added to the raw store; set this to delete the files afterwards
+PRUNE_RAW = os.getenv('TVT_STORE_PRUNE_RAW', '').lower() in ('1', 'true', 'yes')
 
 # Pattern to match names like tvt<mon><yy>.xls or .xlsx
 FILENAME_PATTERN = re.compile(
@@ -20,6 +26,8 @@ FILENAME_PATTERN = re.compile(
     re.IGNORECASE
 )
 
+metrics = RunMetrics('download_and_prepare')
+
 
 def ensure_dir(path: str) -> None:
     """
@@ -30,34 +38,75 @@ def ensure_dir(path: str) -> None:
         print(f'▶ Created directory: {path}')
 
 
-def download_files() -> None:
-    """
-    Download all .xls/.xlsx links from BASE_PAGE into DOWNLOAD_DIR.
-    """
-    ensure_dir(DOWNLOAD_DIR)
-    resp = requests.get(BASE_PAGE)
-    resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, 'html.parser')
+def renamed(filename: str) -> str | None:
+    """<yy><mon>tvt.<ext> name of a tvt<mon><yy> workbook, or None for other files."""
+    m = FILENAME_PATTERN.match(filename)
+    if not m:
+        return None
+    return f"{m.group('yy')}{m.group('mon').lower()}tvt.{m.group('ext').lower()}"
+
+
+def in_store(filename: str) -> bool:
+    """Whether a downloaded file name (tvt<mon><yy>.xls[x]) is already in the raw store."""
+    new_name = renamed(filename)
+    if tvt_raw_store.RAW_SOURCE != 'store' or not new_name:
+        return False
+    parsed = tvt_raw_store.parse_name(new_name)
+    return parsed is not None and tvt_raw_store.store().has(*parsed[:2])
 
+
+def workbook_links(html: str) -> list:
+    """(file name, absolute URL) of every .xls/.xlsx link on the TVT page."""
+    soup = BeautifulSoup(html, 'html.parser')
+    links = []
     for a in soup.find_all('a', href=True):
         href = a['href'].strip()
-        if not href.lower().endswith(('.xls', '.xlsx')):
-            continue
+        if href.lower().endswith(('.xls', '.xlsx')):
+            links.append((os.path.basename(href), urljoin(BASE_PAGE, href)))
+    return links
+
 
-        file_url = urljoin(BASE_PAGE, href)
-        filename = os.path.basename(href)
-        dest_path = os.path.join(DOWNLOAD_DIR, filename)
+def have_workbook(filename: str) -> bool:
+    """Whether a linked workbook was downloaded before (as is, renamed, or into the raw store)."""
+    new_name = renamed(filename)
+    return (
+        os.path.exists(os.path.join(DOWNLOAD_DIR, filename))
+        or (new_name is not None and os.path.exists(os.path.join(DOWNLOAD_DIR, new_name)))
+        or in_store(filename)
+    )
 
-        if os.path.exists(dest_path):
+
+def save_workbook(filename: str, content: bytes) -> None:
+    with open(os.path.join(DOWNLOAD_DIR, filename), 'wb') as f:
+        f.write(content)
+    metrics.incr('bytes_fetched', len(content))
+    metrics.incr('files_downloaded')
+    print(f'✔ Downloaded: {filename}')
+
+
+def download_files() -> None:
+    """
+    Download all .xls/.xlsx links from BASE_PAGE into DOWNLOAD_DIR.
+    """
+    ensure_dir(DOWNLOAD_DIR)
+    with metrics.phase('list'):
+        resp = requests.get(BASE_PAGE)
+        resp.raise_for_status()
+        metrics.incr('bytes_fetched', len(resp.content))
+        links = workbook_links(resp.text)
+
+    for filename, file_url in links:
+        if have_workbook(filename):
             print(f'⚠ Skipping download (exists): {filename}')
+            metrics.incr('cache_hits')
             continue
 
-        resp2 = requests.get(file_url)
+        with metrics.time_file(filename, phase='download'):
+            resp2 = requests.get(file_url)
         if resp2.status_code == 200:
-            with open(dest_path, 'wb') as f:
-                f.write(resp2.content)
-            print(f'✔ Downloaded: {filename}')
+            save_workbook(filename, resp2.content)
         else:
+            metrics.incr('files_failed')
             print(f'✖ Failed to download {filename}: HTTP {resp2.status_code}')
 
 
@@ -66,15 +115,11 @@ def rename_files() -> None:
     Rename files matching tvt<mon><yy> to <yy><mon>tvt (preserving extension).
     """
     for filename in os.listdir(DOWNLOAD_DIR):
-        m = FILENAME_PATTERN.match(filename)
-        if not m:
+        new_name = renamed(filename)
+        if not new_name:
             continue
 
-        mon = m.group('mon').lower()
-        yy = m.group('yy')
-        ext = m.group('ext').lower()
         old_path = os.path.join(DOWNLOAD_DIR, filename)
-        new_name = f"{yy}{mon}tvt.{ext}"
         new_path = os.path.join(DOWNLOAD_DIR, new_name)
 
         if os.path.exists(new_path):
@@ -101,20 +146,35 @@ def convert_xls_to_xlsx() -> None:
                 continue
 
             try:
-                sheets = pd.read_excel(xls_path, sheet_name=None, engine='xlrd')
-                with pd.ExcelWriter(xlsx_path, engine='openpyxl') as writer:
-                    for sheet_name, df in sheets.items():
-                        df.to_excel(writer, sheet_name=sheet_name, index=False)
+                with metrics.time_file(fname, phase='convert'):
+                    sheets = pd.read_excel(xls_path, sheet_name=None, engine='xlrd')
+                    with pd.ExcelWriter(xlsx_path, engine='openpyxl') as writer:
+                        for sheet_name, df in sheets.items():
+                            df.to_excel(writer, sheet_name=sheet_name, index=False)
+                metrics.incr('files_converted')
                 print(f'✔ Converted: {fname} → {xlsx_name}')
             except Exception as e:
+                metrics.incr('files_failed')
                 print(f'✖ Failed to convert {fname}: {e}')
 
 
-def main() -> None:
-    download_files()
-    rename_files()
+def prepare() -> None:
+    """Rename and convert the downloaded workbooks (and add them to the raw store in store mode)."""
+    with metrics.phase('rename'):
+        rename_files()
     convert_xls_to_xlsx()
+    if tvt_raw_store.RAW_SOURCE == 'store':
+        with metrics.phase('store'):
+            store = tvt_raw_store.ingest(DOWNLOAD_DIR, tvt_raw_store.store(), prune=PRUNE_RAW)
+        print(f'✔ Raw store has {len(store.entries)} workbooks → {store.root}')
+
+
+def main() -> None:
+    metrics.set_info(base_page=BASE_PAGE, download_dir=DOWNLOAD_DIR)
+    with metrics.run():
+        download_files()
+        prepare()
 
 
 if __name__ == '__main__':
-    main()
+    tvt_profile.run(main)
@@ -6,11 +6,23 @@
 
 import os
 import re
+import argparse
 import pandas as pd
 import logging
 from collections import defaultdict
 from datetime import datetime
-import numpy as np
+
+import tvt_commit
+import tvt_locks
+import tvt_profile
+import tvt_extract
+from tvt_dates import month_key, key_year, key_month, format_mdy, format_abbr
+from tvt_partials import report_years, write_partial, read_partials
+from tvt_backfill import WORKERS, parse_range, gather_frames, load_current
+import tvt_quarantine
+from tvt_raw_store import list_workbooks, open_workbook, source_name
+from tvt_schema import apply_schema, memory_bytes
+from tvt_metrics import RunMetrics
 
 BASE_DIR = os.getenv('AIRFLOW_HOME', '/opt/airflow')
 DATA_DIR = os.path.join(BASE_DIR, 'data')
@@ -18,6 +30,7 @@ INPUT_DIR = os.getenv('TVT_RAW_DIR', os.path.join(DATA_DIR, 'tvt', 'raw'))
 PROCESSED_DIR = os.getenv('TVT_PROC_DIR', os.path.join(DATA_DIR, 'tvt', 'processed'))
 os.makedirs(PROCESSED_DIR, exist_ok=True)
 OUTPUT_CSV = os.getenv('NATIONAL_VMT_CSV', os.path.join(PROCESSED_DIR, 'merged_tvt_data.csv'))
+JOB = 'national_vmt'
 
 # Regex to identify files named like '19apr t vt .xlsx':
 #   - yy  = two-digit report year (19–25)
@@ -34,8 +47,7 @@ MONTH_MAP = {
     'sep':  9, 'oct': 10, 'nov': 11, 'dec': 12
 }
 
-merged: dict[str, dict[str, float]] = {}
-
+@tvt_profile.tagged(lambda path, *args, **kwargs: source_name(path))
 def read_excel_data(path: str, year: int) -> pd.DataFrame:
     """Read Excel file based on year-specific format."""
     try:
@@ -53,7 +65,7 @@ def read_excel_data(path: str, year: int) -> pd.DataFrame:
             df['moving'] = float('nan')  # Add moving column as NaN
             
         elif year == 2003:
-            month = os.path.basename(path)[2:5].lower()  # Extract month from filename
+            month = source_name(path)[2:5].lower()  # Extract month from filename
             if month in ['may', 'jun']:
                 skiprows = 14  # start from row 15
                 nrows = 34     # read until row 48
@@ -74,7 +86,7 @@ def read_excel_data(path: str, year: int) -> pd.DataFrame:
             df['moving'] = float('nan')  # Add moving column as NaN
             
         elif year == 2004:
-            month = os.path.basename(path)[2:5].lower()
+            month = source_name(path)[2:5].lower()
             if month in ['apr', 'feb', 'jan', 'mar', 'may']:
                 df = pd.read_excel(
                     path,
@@ -121,7 +133,7 @@ def read_excel_data(path: str, year: int) -> pd.DataFrame:
                 )
 
         elif year == 2005:
-            month = os.path.basename(path)[2:5].lower()
+            month = source_name(path)[2:5].lower()
             if month == 'apr':
                 skiprows = 25  # start from row 26
                 nrows = 26     # read until row 51
@@ -141,7 +153,7 @@ def read_excel_data(path: str, year: int) -> pd.DataFrame:
             )
 
         elif year == 2006:
-            month = os.path.basename(path)[2:5].lower()
+            month = source_name(path)[2:5].lower()
             if month == 'dec':
                 skiprows = 15  # start from row 16
                 nrows = 26     # read until row 41
@@ -161,7 +173,7 @@ def read_excel_data(path: str, year: int) -> pd.DataFrame:
             )
 
         elif year == 2007:
-            month = os.path.basename(path)[2:5].lower()
+            month = source_name(path)[2:5].lower()
             if month == 'jan':
                 skiprows = 16  # start from row 17
                 nrows = 26     # read until row 42
@@ -200,50 +212,138 @@ def read_excel_data(path: str, year: int) -> pd.DataFrame:
         if 'moving' in df.columns:
             df['moving'] = pd.to_numeric(df['moving'], errors='coerce')
         
-        return df.dropna(subset=['year_record'])
+        return apply_schema(df.dropna(subset=['year_record']), 'national_extract')
         
     except Exception as e:
-        raise RuntimeError(f"Failed to read Excel file '{path}' for year {year}: {e}")
+        raise RuntimeError(f"Failed to read Excel file '{source_name(path)}' for year {year}: {e}")
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Error tracking
-stats = {
-    'total_files': 0,
-    'processed': 0,
-    'errors': defaultdict(list)
-}
-
-# Update the year range check in the main loop
-for fn in os.listdir(INPUT_DIR):
-    stats['total_files'] += 1
-    m = FNAME_RE.match(fn)
-    if not m:
-        stats['errors']['filename_format'].append(fn)
-        continue
-
-    yy = int(m.group('yy'))
-    if not (2 <= yy <= 25):
-        stats['errors']['year_range'].append(fn)
-        continue
-    
-    # Convert two-digit year to full year
-    full_year = 2000 + yy
-
-    # Get month from filename and convert to number
-    mon_code = m.group('mon').lower()
-    mon = MONTH_MAP.get(mon_code)
-    if mon is None:
-        stats['errors']['month_code'].append(fn)
-        continue
-
-    path = os.path.join(INPUT_DIR, fn)
-    try:
-        df = read_excel_data(path, full_year)
-        stats['processed'] += 1
+@tvt_extract.extractor(JOB)
+def extract_national(book, year: int, month: int) -> pd.DataFrame:
+    """Registered reader of the national table; read_excel_data takes the report month from the file name."""
+    return read_excel_data(book, year)
+
+def build_final_df(merged: dict) -> pd.DataFrame:
+    """Turn the {month_key: values} dict into the output table with derived change rates."""
+    # Convert merged dict into a DataFrame, sorted by month key to ensure correct calculations
+    out_df = pd.DataFrame.from_dict(
+        merged,
+        orient = 'index'
+    ).rename_axis('MonthKey').sort_index()
+
+    out_df['Date'] = format_mdy(out_df.index)     # e.g. '04/01/1970'
+    out_df['Month'] = format_abbr(out_df.index)   # e.g. 'Apr'
+    out_df['Year']  = key_year(out_df.index)      # e.g. 1970
+
+    # Calculate monthly change rate using 'moving' instead of 'total_vmt'
+    out_df['VMT_Change_Rate_Monthly'] = (
+        100 * (out_df['moving'] - out_df['moving'].shift(1)) / 
+        out_df['moving'].shift(1)
+    ).round(2)
+
+    # Calculate annual change rate using 'moving' instead of 'total_vmt'
+    out_df['VMT_Change_Rate_Annually'] = (
+        100 * (out_df['moving'] - out_df['moving'].shift(12)) / 
+        out_df['moving'].shift(12)
+    ).round(2)
+
+    # Update final_df creation to include new columns
+    final_df = out_df.loc[:, [
+        'Date',
+        'Month',
+        'Year',
+        'total_vmt',
+        'yearToDate',
+        'moving',
+        'VMT_Change_Rate_Monthly',
+        'VMT_Change_Rate_Annually'
+    ]].rename(columns={
+        'total_vmt': 'Total VMT (Million)',
+        'yearToDate': 'Year To Date VMT (Million)',
+        'moving': 'Moving 12-Month VMT (Million)',
+        'VMT_Change_Rate_Monthly': 'VMT Change Rate(Monthly)',
+        'VMT_Change_Rate_Annually': 'VMT Change Rate (Annually)'
+    })
+
+    # Missing rates stay NaN (written as empty CSV cells) so the columns keep a float dtype
+    return apply_schema(final_df, 'tvt_data')
+
+def print_summary(stats: dict, listing: list) -> None:
+    """Print the processing summary, per-file errors and workbooks missing from INPUT_DIR."""
+    print("\nProcessing Summary:")
+    print(f"Total files found: {stats['total_files']}")
+    print(f"Successfully processed: {stats['processed']}")
+    if stats['errors']:
+        print("\nErrors encountered:")
+        for error_type, files in stats['errors'].items():
+            print(f"\n{error_type}:")
+            for f in files:
+                if isinstance(f, tuple):
+                    print(f"  {f[0]}: {f[1]}")
+                else:
+                    print(f"  {f}")
+
+    print(f"\nExpected files:") 
+    for year in range(2002, 2026):
+        yy = str(year)[2:]
+        for month in MONTH_MAP.keys():
+            expected = f"{yy}{month}tvt.xlsx"
+            if not any(f.lower().startswith(f"{yy}{month}".lower()) for f in listing):
+                print(f"  Missing: {expected}")
+
+def extract_files(listing: list, stats: dict, metrics: RunMetrics, year: int | None = None) -> list:
+    """
+    Parse the workbooks in `listing` (optionally only report year `year`).
+
+    Returns [(report_key, file_name, DataFrame)]; names that are not valid workbooks are
+    recorded in `stats['errors']`.
+    """
+    frames = []
+    for fn in listing:
+        m = FNAME_RE.match(fn)
+        if year is not None and (not m or 2000 + int(m.group('yy')) != year):
+            continue
+        stats['total_files'] += 1
+        if not m:
+            stats['errors']['filename_format'].append(fn)
+            continue
+
+        yy = int(m.group('yy'))
+        if not (2 <= yy <= 25):
+            stats['errors']['year_range'].append(fn)
+            continue
         
+        # Convert two-digit year to full year
+        full_year = 2000 + yy
+
+        # Get month from filename and convert to number
+        mon_code = m.group('mon').lower()
+        mon = MONTH_MAP.get(mon_code)
+        if mon is None:
+            stats['errors']['month_code'].append(fn)
+            continue
+
+        try:
+            # In store mode this reads the blob; a missing or damaged one is a read error like any other
+            path = open_workbook(INPUT_DIR, fn)
+            with metrics.time_file(fn):
+                df = tvt_extract.extract_one(path, full_year, mon, JOB)
+            stats['processed'] += 1
+            metrics.incr('rows_in', len(df))
+            frames.append((month_key(full_year, mon), fn, df))
+        except Exception as e:
+            stats['errors']['read_error'].append((fn, str(e)))
+            continue
+    return frames
+
+def consolidate(frames: list) -> dict:
+    """Collect {month_key: values} from every report; newer reports override older ones."""
+    merged: dict[int, dict[str, float]] = {}
+    for report_key, _, df in sorted(frames, key=lambda item: item[0]):
+        mon = key_month(report_key)
         # Iterate over each row (each historic year) and update our merged dict
         for _, row in df.iterrows():
             # Skip rows with invalid numeric data
@@ -255,99 +355,185 @@ for fn in os.listdir(INPUT_DIR):
             ytd_vmt = float(row['yearToDate']) if not pd.isna(row['yearToDate']) else float('nan')
             mov_vmt = float(row['moving']) if not pd.isna(row['moving']) else float('nan')
 
-            key = f'{year_rec}-{mon:02d}'  # e.g. "2000-03" for March 2000
+            key = month_key(year_rec, mon)  # e.g. 24003 for March 2000
             merged[key] = {
                 'total_vmt': total_vmt,
                 'yearToDate': ytd_vmt,
                 'moving': mov_vmt
             }
-    except Exception as e:
-        stats['errors']['read_error'].append((fn, str(e)))
-        continue
-
-# Convert merged dict into a DataFrame
-out_df = pd.DataFrame.from_dict(
-    merged,
-    orient = 'index'
-).rename_axis('year_month').reset_index()
-
-# Split 'year_month' into separate 'Year' and 'Month_Num' columns
-out_df[['Year', 'Month_Num']] = out_df['year_month'].str.split('-', expand=True).astype(int)
-
+    return merged
+
+def run_extract(year: int) -> None:
+    """Shard mode: parse one report year's workbooks and save them as a partial."""
+    metrics = RunMetrics(f'extract_national_vmt_{year}')
+    metrics.set_info(input_dir=INPUT_DIR, report_year=year)
+    with metrics.run():
+        stats = {'total_files': 0, 'processed': 0, 'errors': defaultdict(list)}
+        with metrics.phase('list'):
+            listing = list_workbooks(INPUT_DIR)
+        frames = extract_files(listing, stats, metrics, year=year)
+        with metrics.phase('write'):
+            path = write_partial(JOB, year, frames, stats)
+        metrics.incr('files_processed', stats['processed'])
+        metrics.incr('files_failed', len(stats['errors'].get('read_error', [])))
+        print(f"Report year {year}: {stats['processed']} of {stats['total_files']} workbooks extracted")
+        for fn, err in stats['errors'].get('read_error', []):
+            print(f"  {fn}: {err}")
+        print(f'✅ Saved {len(frames)} extracts → {path}')
+
+def run_backfill(month_range: str | None, workers: int = WORKERS) -> None:
+    """
+    Re-extract the reports of `month_range` and recompute only the months they revise.
+
+    With no range, the quarantined workbooks are retried and folded into the current output.
+    """
+    quarantined = tvt_quarantine.load(JOB)
+    metrics = RunMetrics('backfill_national_vmt' if month_range else 'retry_national_vmt')
+    metrics.set_info(input_dir=INPUT_DIR, output=OUTPUT_CSV, backfill=month_range, retried=sorted(quarantined))
+    with metrics.run():
+        stats = {'total_files': 0, 'processed': 0, 'errors': defaultdict(list)}
+        with metrics.phase('list'):
+            listing = list_workbooks(INPUT_DIR)
+            reports = {}
+            for fn in listing:
+                m = FNAME_RE.match(fn)
+                mon = MONTH_MAP.get(m.group('mon').lower()) if m else None
+                if mon is not None and 2 <= int(m.group('yy')) <= 25:
+                    reports[month_key(2000 + int(m.group('yy')), mon)] = fn
+        # A quarantined workbook deleted since cannot be retried; it no longer makes the output incomplete
+        quarantine = tvt_quarantine.release_missing(JOB, listing)
+        if month_range:
+            start, end = parse_range(month_range)
+            range_files = {k: fn for k, fn in reports.items() if start <= k <= end}
+        else:
+            range_files = {k: fn for k, fn in reports.items() if fn in quarantine}
+        if not range_files:
+            print(f"No workbooks for report months {month_range}; nothing to backfill." if month_range
+                  else "No quarantined workbooks; nothing to retry.")
+            if len(quarantine) < len(quarantined):
+                current = load_current(OUTPUT_CSV)
+                tvt_commit.commit({OUTPUT_CSV: (current, current, 'tvt_data')}, metrics.job,
+                                  meta={'backfill': month_range or 'quarantine'},
+                                  file_meta={OUTPUT_CSV: tvt_quarantine.completeness(quarantine)})
+            return
+
+        # A report revises its calendar month in every historic year it lists, so the affected
+        # partitions are those calendar months, rebuilt from every report of the same month
+        months = {key_month(k) for k in range_files}
+        other_files = {k: fn for k, fn in reports.items() if k not in range_files and key_month(k) in months}
+        stats['total_files'] = len(range_files) + len(other_files)
+        scope = load_current(OUTPUT_CSV)['MonthKey']
+        # Overlapping backfills of the same calendar months queue here; anything else proceeds alongside
+        with tvt_locks.claim({OUTPUT_CSV: scope[key_month(scope).isin(months)]}, metrics.job):
+            frames = gather_frames(JOB, extract_files, range_files, other_files, stats, metrics, workers)
+            quarantine = tvt_quarantine.update(JOB, {fn for _, fn, _ in frames}, stats['errors'].get('read_error', []))
+            metrics.incr('files_processed', stats['processed'])
+            metrics.incr('files_failed', len(stats['errors'].get('read_error', [])))
+            for fn, err in stats['errors'].get('read_error', []):
+                print(f"  {fn}: {err}")
+
+            with metrics.phase('consolidate'):
+                current = load_current(OUTPUT_CSV)
+                affected = key_month(current['MonthKey']).isin(months)
+                kept = current[~affected].set_index('MonthKey')
+                merged = {
+                    key: {
+                        'total_vmt': row['Total VMT (Million)'],
+                        'yearToDate': row['Year To Date VMT (Million)'],
+                        'moving': row['Moving 12-Month VMT (Million)'],
+                    }
+                    for key, row in kept.iterrows()
+                }
+                recomputed = consolidate(frames)
+                merged.update(recomputed)
+                # Change rates are derived from neighbouring months, so they are recomputed over the whole table
+                final_df = build_final_df(merged)
+
+            with metrics.phase('write'):
+                snapshot, published, _ = tvt_commit.commit(
+                    {OUTPUT_CSV: (final_df, current, 'tvt_data')}, metrics.job,
+                    meta={'backfill': month_range or 'quarantine'},
+                    file_meta={OUTPUT_CSV: tvt_quarantine.completeness(quarantine)},
+                )
+        metrics.incr('rows_out', len(published[OUTPUT_CSV]))
+        metrics.set_info(snapshot=snapshot, months_recomputed=len(recomputed), complete=not quarantine)
+        print(f'✅ Recomputed {len(recomputed)} months from {len(frames)} reports; '
+              f'{len(kept)} of {len(current)} rows unchanged → {OUTPUT_CSV}')
+
+def main(argv: list | None = None) -> None:
+    parser = argparse.ArgumentParser(description='Merge TVT national VMT tables.')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--extract-year', type=int, metavar='YYYY',
+                      help='only parse this report year and save a partial extract')
+    mode.add_argument('--reduce', action='store_true',
+                      help='merge the partial extracts of every report year and publish')
+    mode.add_argument('--backfill', metavar='YYYY-MM:YYYY-MM',
+                      help='re-extract this range of report months and recompute only the months it revises')
+    mode.add_argument('--retry-quarantined', action='store_true',
+                      help='re-parse only the quarantined workbooks and fold them into the current output')
+    parser.add_argument('--workers', type=int, default=WORKERS,
+                        help='worker processes for --backfill (default: TVT_BACKFILL_WORKERS or CPU count)')
+    args = parser.parse_args(argv)
+    if args.extract_year:
+        return run_extract(args.extract_year)
+    if args.backfill or args.retry_quarantined:
+        return run_backfill(args.backfill, args.workers)
+
+    metrics = RunMetrics('merge_national_vmt')
+    metrics.set_info(input_dir=INPUT_DIR, output=OUTPUT_CSV, mode='reduce' if args.reduce else 'full')
+    with metrics.run():
+        # Error tracking
+        stats = {
+            'total_files': 0,
+            'processed': 0,
+            'errors': defaultdict(list)
+        }
+
+        # The published version this build starts from; the commit only writes the months that differ
+        base = tvt_commit.load_published(OUTPUT_CSV)
+
+        with metrics.phase('list'):
+            listing = list_workbooks(INPUT_DIR)
+
+        if args.reduce:
+            # Workbooks were parsed by the per-year shards; only the naming checks run here
+            stats['total_files'] = len(listing)
+            for fn in listing:
+                if not FNAME_RE.match(fn):
+                    stats['errors']['filename_format'].append(fn)
+            with metrics.phase('parse'):
+                frames, shard_stats = read_partials(JOB, report_years(INPUT_DIR))
+            stats['processed'] = shard_stats['processed']
+            for kind, files in shard_stats['errors'].items():
+                stats['errors'][kind].extend(files)
+        else:
+            frames = extract_files(listing, stats, metrics)
+
+        metrics.incr('files_processed', stats['processed'])
+        metrics.incr('files_failed', len(stats['errors'].get('read_error', [])))
+
+        # Workbooks that failed are quarantined; the output is flagged incomplete until they are retried
+        quarantine = tvt_quarantine.update(
+            JOB, {fn for _, fn, _ in frames}, stats['errors'].get('read_error', []), replace=True
+        )
+
+        with metrics.phase('consolidate'):
+            merged = consolidate(frames)
+            final_df = build_final_df(merged)
+
+        # Summary report
+        print_summary(stats, listing)
+
+        # Publish the changed months as a new snapshot (readers keep the previous one until the swap)
+        with metrics.phase('write'):
+            snapshot, published, _ = tvt_commit.commit(
+                {OUTPUT_CSV: (final_df, base, 'tvt_data')}, metrics.job,
+                file_meta={OUTPUT_CSV: tvt_quarantine.completeness(quarantine)},
+            )
+        metrics.incr('rows_out', len(published[OUTPUT_CSV]))
+        metrics.set_info(snapshot=snapshot, memory_bytes=memory_bytes(final_df), complete=not quarantine)
+        print(f'✅ Merged {len(final_df)} rows → {OUTPUT_CSV}')
 
-out_df['Date_TS'] = pd.to_datetime(
-    out_df['Year'].astype(str) + '-' +
-    out_df['Month_Num'].astype(str).str.zfill(2) + '-01'
-)
 
-out_df['Date'] = out_df['Date_TS'].dt.strftime('%#m/%#d/%Y')   # e.g. '4/1/1970'
-out_df['Month'] = out_df['Date_TS'].dt.strftime('%b')          # e.g. 'Apr'
-out_df['Year']  = out_df['Date_TS'].dt.year                    # e.g. 1970
-
-# Sort by date to ensure correct calculations
-out_df = out_df.sort_values('Date_TS')
-
-# Calculate monthly change rate using 'moving' instead of 'total_vmt'
-out_df['VMT_Change_Rate_Monthly'] = (
-    100 * (out_df['moving'] - out_df['moving'].shift(1)) / 
-    out_df['moving'].shift(1)
-).round(2)
-
-# Calculate annual change rate using 'moving' instead of 'total_vmt'
-out_df['VMT_Change_Rate_Annually'] = (
-    100 * (out_df['moving'] - out_df['moving'].shift(12)) / 
-    out_df['moving'].shift(12)
-).round(2)
-
-# Replace NaN values with empty string for better CSV output
-out_df['VMT_Change_Rate_Monthly'] = out_df['VMT_Change_Rate_Monthly'].replace({pd.NA: '', np.nan: ''})
-out_df['VMT_Change_Rate_Annually'] = out_df['VMT_Change_Rate_Annually'].replace({pd.NA: '', np.nan: ''})
-
-# Update final_df creation to include new columns
-final_df = out_df.loc[:, [
-    'Date',
-    'Month',
-    'Year',
-    'total_vmt',
-    'yearToDate',
-    'moving',
-    'VMT_Change_Rate_Monthly',
-    'VMT_Change_Rate_Annually'
-]].rename(columns={
-    'total_vmt': 'Total VMT (Million)',
-    'yearToDate': 'Year To Date VMT (Million)',
-    'moving': 'Moving 12-Month VMT (Million)',
-    'VMT_Change_Rate_Monthly': 'VMT Change Rate(Monthly)',
-    'VMT_Change_Rate_Annually': 'VMT Change Rate (Annually)'
-})
-
-# Summary report
-print("\nProcessing Summary:")
-print(f"Total files found: {stats['total_files']}")
-print(f"Successfully processed: {stats['processed']}")
-if stats['errors']:
-    print("\nErrors encountered:")
-    for error_type, files in stats['errors'].items():
-        print(f"\n{error_type}:")
-        for f in files:
-            if isinstance(f, tuple):
-                print(f"  {f[0]}: {f[1]}")
-            else:
-                print(f"  {f}")
-
-print(f"\nExpected files:") 
-for year in range(2002, 2026):
-    yy = str(year)[2:]
-    for month in MONTH_MAP.keys():
-        expected = f"{yy}{month}tvt.xlsx"
-        if not any(f.lower().startswith(f"{yy}{month}".lower()) for f in os.listdir(INPUT_DIR)):
-            print(f"  Missing: {expected}")
-
-# Sort by Date from oldest to newest
-final_df['Date'] = pd.to_datetime(final_df['Date'])
-final_df = final_df.sort_values('Date')
-final_df['Date'] = final_df['Date'].dt.strftime('%#m/%#d/%Y')
-
-# Save to CSV
-final_df.to_csv(OUTPUT_CSV, index=False)
-print(f'✅ Merged {len(final_df)} rows → {OUTPUT_CSV}')
+if __name__ == '__main__':
+    tvt_profile.run(main)
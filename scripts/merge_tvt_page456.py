@@ -5,18 +5,32 @@
 
 import os
 import re
+import argparse
 import pandas as pd
 import logging
 from collections import defaultdict
 from datetime import datetime
 from tqdm import tqdm
 
+import tvt_commit
+import tvt_locks
+import tvt_profile
+import tvt_extract
+from tvt_dates import month_key, key_year, key_month, format_mdy, format_abbr
+from tvt_partials import report_years, write_partial, read_partials
+from tvt_backfill import WORKERS, parse_range, gather_frames, load_current
+import tvt_quarantine
+from tvt_raw_store import list_workbooks, open_workbook, source_name
+from tvt_schema import apply_schema, memory_bytes
+from tvt_metrics import RunMetrics
+
 BASE_DIR = os.getenv('AIRFLOW_HOME', '/opt/airflow')
 DATA_DIR = os.path.join(BASE_DIR, 'data')
 INPUT_DIR = os.getenv('TVT_RAW_DIR', os.path.join(DATA_DIR, 'tvt', 'raw'))
 PROCESSED_DIR = os.getenv('TVT_PROC_DIR', os.path.join(DATA_DIR, 'tvt', 'processed'))
 os.makedirs(PROCESSED_DIR, exist_ok=True)
 OUTPUT_CSV = os.getenv('STATE_MILES_CSV', os.path.join(PROCESSED_DIR, 'merged_tvt_state_miles.csv'))
+JOB = 'state_miles'
 
 
 FNAME_RE = re.compile(
@@ -30,12 +44,6 @@ MONTH_MAP = {
     'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12
 }
 
-MONTH_NAMES = {
-    1: 'Jan', 2: 'Feb', 3: 'Mar', 4: 'Apr',
-    5: 'May', 6: 'Jun', 7: 'Jul', 8: 'Aug',
-    9: 'Sep', 10: 'Oct', 11: 'Nov', 12: 'Dec'
-}
-
 def get_excluded_rows(year: int) -> list:
     """Return rows to exclude based on year, adjusted for skiprows."""
     if year <= 2002:
@@ -47,8 +55,10 @@ def get_excluded_rows(year: int) -> list:
     else:  # 2008-present
         return [10, 11, 21, 22, 35, 36, 45, 46]
 
+@tvt_extract.extractor(JOB)
+@tvt_profile.tagged(lambda path, *args, **kwargs: source_name(path))
 def read_state_miles(path: str, year: int, month: int) -> pd.DataFrame:
-    """Read state mileage and station data from Excel file based on year-specific format."""
+    """Read state mileage and station data from an Excel file (path or open workbook) based on year-specific format."""
     excluded_rows = get_excluded_rows(year)
     
     if year <= 2003:
@@ -80,7 +90,7 @@ def read_state_miles(path: str, year: int, month: int) -> pd.DataFrame:
             'Rural_LastMonth_Stations',
             'Rural_LastMonth_Current', 'Rural_LastMonth_Previous'
         ]
-        return df
+        return apply_schema(df, 'state_miles_extract')
 
     else:  # 2004-2025
         sheets = [3, 4, 5]
@@ -120,14 +130,7 @@ def read_state_miles(path: str, year: int, month: int) -> pd.DataFrame:
             final_df = pd.merge(final_df, df, on='State', how='outer')
         final_df['Year'] = year
         final_df['Month'] = month
-        return final_df
-
-def get_previous_month_year(month: int, year: int) -> tuple:
-    """Get previous month and year given current month and year."""
-    if month == 1:
-        return 12, year - 1
-    else:
-        return month - 1, year
+        return apply_schema(final_df, 'state_miles_extract')
 
 def update_data_with_newer_values(consolidated_data: dict, new_df: pd.DataFrame, 
                                 current_year: int, current_month: int) -> dict:
@@ -145,8 +148,10 @@ def update_data_with_newer_values(consolidated_data: dict, new_df: pd.DataFrame,
     3. Updates February 2022 data (previous month previous year correction)
     """
     
-    # Get previous month info for monthly update
-    prev_month, prev_year = get_previous_month_year(current_month, current_year)
+    # Month keys of the report month, the month before it, and that month a year earlier
+    current_key = month_key(current_year, current_month)
+    prev_month_key = current_key - 1
+    prev_month_prev_year_key = current_key - 13
     
     # Process each state in the new data
     for _, row in new_df.iterrows():
@@ -159,7 +164,6 @@ def update_data_with_newer_values(consolidated_data: dict, new_df: pd.DataFrame,
             consolidated_data[state] = {}
         
         # Store current month data
-        current_key = (current_year, current_month)
         if current_key not in consolidated_data[state]:
             consolidated_data[state][current_key] = {}
         
@@ -171,10 +175,11 @@ def update_data_with_newer_values(consolidated_data: dict, new_df: pd.DataFrame,
                 consolidated_data[state][current_key][f'{col_type}_Stations'] = row[f'{col_type}_Stations']
         
         # MONTHLY UPDATE
-        prev_month_key = (prev_year, prev_month)
         if prev_month_key not in consolidated_data[state]:
             consolidated_data[state][prev_month_key] = {}
         
+        # Missing revisions (including '-' placeholders, missing since the extract schema) keep the
+        # month's earlier value
         for col_type in ['Rural', 'Urban', 'All']:
             if f'{col_type}_LastMonth_Current' in row and not pd.isna(row[f'{col_type}_LastMonth_Current']):
                 consolidated_data[state][prev_month_key][f'{col_type}_Current'] = row[f'{col_type}_LastMonth_Current']
@@ -182,7 +187,6 @@ def update_data_with_newer_values(consolidated_data: dict, new_df: pd.DataFrame,
                 consolidated_data[state][prev_month_key][f'{col_type}_Stations'] = row[f'{col_type}_LastMonth_Stations']
 
         # YEARLY UPDATE
-        prev_month_prev_year_key = (prev_year - 1, prev_month)  
         if prev_month_prev_year_key not in consolidated_data[state]:
             consolidated_data[state][prev_month_prev_year_key] = {}
         
@@ -196,78 +200,23 @@ def get_month_num(month_str: str) -> int:
     """Convert month string to number, handling both full and abbreviated names."""
     return MONTH_MAP.get(month_str.lower()[:3], 0)
 
-# Main processing logic
-consolidated_data = {}  # Structure: {state: {(year, month): {col_type_current: value, col_type_previous: value}}}
-stats = {'total_files': 0, 'processed': 0, 'errors': defaultdict(list)}
-
-# Get list of files and sort chronologically from 2002 to present
-files = [f for f in os.listdir(INPUT_DIR) if FNAME_RE.match(f)]
-files.sort(key=lambda x: (
-    int(FNAME_RE.match(x).group('yy')), 
-    MONTH_MAP[FNAME_RE.match(x).group('mon').lower()]
-))  # Remove reverse=True to process chronologically
-stats['total_files'] = len(files)
-
-print(f"Processing {len(files)} files chronologically from 2002 to present...")
-
-# Process files with progress bar
-for fn in tqdm(files, desc="Processing files", unit="file"):
-    m = FNAME_RE.match(fn)
-    yy = int(m.group('yy'))
-    if not (2 <= yy <= 25):
-        stats['errors']['year_range'].append(fn)
-        continue
-    
-    full_year = 2000 + yy
-    mon_code = m.group('mon').lower()
-    mon = MONTH_MAP.get(mon_code)
-    
-    if mon is None:
-        stats['errors']['month_code'].append(fn)
-        continue
+def list_input_files() -> list:
+    """Return TVT workbook names in INPUT_DIR sorted chronologically from 2002 to present."""
+    files = [f for f in list_workbooks(INPUT_DIR) if FNAME_RE.match(f)]
+    files.sort(key=lambda x: (
+        int(FNAME_RE.match(x).group('yy')),
+        MONTH_MAP[FNAME_RE.match(x).group('mon').lower()]
+    ))  # Remove reverse=True to process chronologically
+    return files
 
-    path = os.path.join(INPUT_DIR, fn)
-    try:
-        df = read_state_miles(path, full_year, mon)
-        
-        # Update consolidated data with newer values
-        consolidated_data = update_data_with_newer_values(
-            consolidated_data, df, full_year, mon
-        )
-        
-        stats['processed'] += 1
-    except Exception as e:
-        stats['errors']['read_error'].append((fn, str(e)))
-        continue
-
-# Print processing summary
-print("\nProcessing Summary:")
-print(f"Total files found: {stats['total_files']}")
-print(f"Successfully processed: {stats['processed']}")
-if stats['errors']:
-    print("\nErrors encountered:")
-    for error_type, files in stats['errors'].items():
-        print(f"\n{error_type}:")
-        for f in files:
-            if isinstance(f, tuple):
-                print(f"  {f[0]}: {f[1]}")
-            else:
-                print(f"  {f}")
-
-# Convert consolidated data to DataFrame
-if not consolidated_data:
-    print("\n❌ No data was successfully processed. No output CSV will be created.")
-    print("Please check the file paths and formats.")
-else:
-    # Build final DataFrame
+def build_final_df(consolidated_data: dict) -> pd.DataFrame:
+    """Flatten the consolidated {state: {month_key: values}} structure into the output table."""
     final_rows = []
     
     for state, date_data in consolidated_data.items():
-        for (year, month), values in date_data.items():
+        for key, values in date_data.items():
             row = {
-                'Date': f"{month}/1/{year}",
-                'Month': MONTH_NAMES[month], 
-                'Year': year,
+                'MonthKey': key,
                 'State': state
             }
             
@@ -327,29 +276,249 @@ else:
         'Other Miles', 'Other Stations'
     ]
     
-    # Convert Date to proper format
-    final_df['Date'] = pd.to_datetime(final_df['Date'])
-    final_df = final_df.sort_values(['Date', 'State'])
-    final_df['Date'] = final_df['Date'].dt.strftime('%#m/%#d/%Y')
+    # Sort on the integer month key; Date/Month/Year strings are only rendered for export
+    final_df = final_df.sort_values(['MonthKey', 'State'])
+    final_df['Date'] = format_mdy(final_df['MonthKey'])
+    final_df['Month'] = format_abbr(final_df['MonthKey'])
+    final_df['Year'] = key_year(final_df['MonthKey'])
     
     # Remove any rows where all mile values are NaN
     final_df = final_df.dropna(subset=['Rural Arterial Miles', 'Urban Arterial Miles', 'All Miles'], how='all')
     
-    # Reorder columns
-    final_df = final_df[column_order]
-    
-    # Save to CSV
-    final_df.to_csv(OUTPUT_CSV, index=False)
-    print(f'\n✅ Merged {len(final_df)} rows → {OUTPUT_CSV}')
-    
-    # Convert dates to datetime for accurate comparison
-    final_df['Date'] = pd.to_datetime(final_df['Date'])
-    min_date = final_df['Date'].min().strftime('%#m/%#d/%Y')
-    max_date = final_df['Date'].max().strftime('%#m/%#d/%Y')
-    print(f"Data spans from {min_date} to {max_date}")
-    
-    # Convert back to string format if needed for CSV
-    final_df['Date'] = final_df['Date'].dt.strftime('%#m/%#d/%Y')
-    
-    print(f"States included: {final_df['State'].nunique()}")
-    print(f"Unique year-month combinations: {final_df.groupby(['Year', 'Month']).ngroups}")
\ No newline at end of file
+    # Reorder columns; the month key stays on as the (unexported) index
+    return apply_schema(final_df.set_index('MonthKey')[column_order], 'state_miles')
+
+def print_summary(stats: dict) -> None:
+    """Print the per-run processing summary and any per-file errors."""
+    print("\nProcessing Summary:")
+    print(f"Total files found: {stats['total_files']}")
+    print(f"Successfully processed: {stats['processed']}")
+    if stats['errors']:
+        print("\nErrors encountered:")
+        for error_type, files in stats['errors'].items():
+            print(f"\n{error_type}:")
+            for f in files:
+                if isinstance(f, tuple):
+                    print(f"  {f[0]}: {f[1]}")
+                else:
+                    print(f"  {f}")
+
+def extract_files(files: list, stats: dict, metrics: RunMetrics) -> list:
+    """Parse workbooks; returns [(report_key, file_name, DataFrame)] in the order given."""
+    frames = []
+    for fn in tqdm(files, desc="Processing files", unit="file"):
+        m = FNAME_RE.match(fn)
+        yy = int(m.group('yy'))
+        if not (2 <= yy <= 25):
+            stats['errors']['year_range'].append(fn)
+            continue
+        
+        full_year = 2000 + yy
+        mon_code = m.group('mon').lower()
+        mon = MONTH_MAP.get(mon_code)
+        
+        if mon is None:
+            stats['errors']['month_code'].append(fn)
+            continue
+
+        try:
+            # In store mode this reads the blob; a missing or damaged one is a read error like any other
+            path = open_workbook(INPUT_DIR, fn)
+            with metrics.time_file(fn):
+                df = tvt_extract.extract_one(path, full_year, mon, JOB)
+            metrics.incr('rows_in', len(df))
+            frames.append((month_key(full_year, mon), fn, df))
+            stats['processed'] += 1
+        except Exception as e:
+            stats['errors']['read_error'].append((fn, str(e)))
+            continue
+    return frames
+
+def consolidate(frames: list) -> dict:
+    """Apply every report to the consolidated data, oldest report first."""
+    consolidated_data = {}  # Structure: {state: {month_key: {col_type_current: value, col_type_previous: value}}}
+    for key, _, df in sorted(frames, key=lambda item: item[0]):
+        consolidated_data = update_data_with_newer_values(
+            consolidated_data, df, key_year(key), key_month(key)
+        )
+    return consolidated_data
+
+def run_extract(year: int) -> None:
+    """Shard mode: parse one report year's workbooks and save them as a partial."""
+    metrics = RunMetrics(f'extract_state_miles_{year}')
+    metrics.set_info(input_dir=INPUT_DIR, report_year=year)
+    with metrics.run():
+        stats = {'total_files': 0, 'processed': 0, 'errors': defaultdict(list)}
+        with metrics.phase('list'):
+            files = [f for f in list_input_files() if 2000 + int(FNAME_RE.match(f).group('yy')) == year]
+        stats['total_files'] = len(files)
+        print(f"Extracting {len(files)} workbooks for report year {year}...")
+
+        frames = extract_files(files, stats, metrics)
+        with metrics.phase('write'):
+            path = write_partial(JOB, year, frames, stats)
+        metrics.incr('files_processed', stats['processed'])
+        metrics.incr('files_failed', sum(len(v) for v in stats['errors'].values()))
+        print_summary(stats)
+        print(f'\n✅ Saved {len(frames)} extracts → {path}')
+
+def run_backfill(month_range: str | None, workers: int = WORKERS) -> None:
+    """
+    Re-extract the reports of `month_range` and recompute only the months they revise.
+
+    With no range, the quarantined workbooks are retried and folded into the current output.
+    """
+    quarantined = tvt_quarantine.load(JOB)
+    metrics = RunMetrics('backfill_state_miles' if month_range else 'retry_state_miles')
+    metrics.set_info(input_dir=INPUT_DIR, output=OUTPUT_CSV, backfill=month_range, retried=sorted(quarantined))
+    with metrics.run():
+        stats = {'total_files': 0, 'processed': 0, 'errors': defaultdict(list)}
+        with metrics.phase('list'):
+            reports = {}
+            for fn in list_input_files():
+                m = FNAME_RE.match(fn)
+                reports[month_key(2000 + int(m.group('yy')), MONTH_MAP[m.group('mon').lower()])] = fn
+        # A quarantined workbook deleted since cannot be retried; it no longer makes the output incomplete
+        quarantine = tvt_quarantine.release_missing(JOB, list(reports.values()))
+        if month_range:
+            start, end = parse_range(month_range)
+            range_files = {k: fn for k, fn in reports.items() if start <= k <= end}
+        else:
+            range_files = {k: fn for k, fn in reports.items() if fn in quarantine}
+        if not range_files:
+            print(f"No workbooks for report months {month_range}; nothing to backfill." if month_range
+                  else "No quarantined workbooks; nothing to retry.")
+            if len(quarantine) < len(quarantined):
+                current = load_current(OUTPUT_CSV)
+                tvt_commit.commit({OUTPUT_CSV: (current, current, 'state_miles')}, metrics.job,
+                                  meta={'backfill': month_range or 'quarantine'},
+                                  file_meta={OUTPUT_CSV: tvt_quarantine.completeness(quarantine)})
+            return
+
+        # A report writes its own month, the month before and that month a year earlier, so those are
+        # the output months to recompute, from every report that writes any of them
+        affected = {k for r in range_files for k in (r, r - 1, r - 13)}
+        other_files = {
+            k: fn for k, fn in reports.items()
+            if k not in range_files and {k, k - 1, k - 13} & affected
+        }
+        stats['total_files'] = len(range_files) + len(other_files)
+        # Overlapping backfills of the same months queue here; anything else proceeds alongside
+        with tvt_locks.claim({OUTPUT_CSV: affected}, metrics.job):
+            frames = gather_frames(JOB, extract_files, range_files, other_files, stats, metrics, workers)
+            quarantine = tvt_quarantine.update(JOB, {fn for _, fn, _ in frames}, stats['errors'].get('read_error', []))
+            metrics.incr('files_processed', stats['processed'])
+            metrics.incr('files_failed', sum(len(v) for v in stats['errors'].values()))
+            print_summary(stats)
+
+            with metrics.phase('consolidate'):
+                consolidated_data = {
+                    state: {k: v for k, v in months.items() if k in affected}
+                    for state, months in consolidate(frames).items()
+                }
+                consolidated_data = {state: months for state, months in consolidated_data.items() if months}
+                current = load_current(OUTPUT_CSV)
+                kept = current[~current['MonthKey'].isin(affected)]
+                parts = [kept]
+                if consolidated_data:
+                    parts.append(build_final_df(consolidated_data).reset_index())
+                final_df = pd.concat(parts, ignore_index=True)
+                final_df['State'] = final_df['State'].astype(str)
+                final_df = final_df.sort_values(['MonthKey', 'State'])
+                final_df = apply_schema(final_df.set_index('MonthKey')[list(current.columns.drop('MonthKey'))],
+                                        'state_miles')
+
+            with metrics.phase('write'):
+                snapshot, published, _ = tvt_commit.commit(
+                    {OUTPUT_CSV: (final_df, current, 'state_miles')}, metrics.job,
+                    meta={'backfill': month_range or 'quarantine'},
+                    file_meta={OUTPUT_CSV: tvt_quarantine.completeness(quarantine)},
+                )
+        metrics.incr('rows_out', len(published[OUTPUT_CSV]))
+        metrics.set_info(snapshot=snapshot, months_recomputed=len(affected), complete=not quarantine)
+        print(f'\n✅ Recomputed {len(affected)} months from {len(frames)} reports; '
+              f'{len(kept)} of {len(current)} rows unchanged → {OUTPUT_CSV}')
+
+def main(argv: list | None = None) -> None:
+    parser = argparse.ArgumentParser(description='Merge TVT state mileage tables.')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--extract-year', type=int, metavar='YYYY',
+                      help='only parse this report year and save a partial extract')
+    mode.add_argument('--reduce', action='store_true',
+                      help='merge the partial extracts of every report year and publish')
+    mode.add_argument('--backfill', metavar='YYYY-MM:YYYY-MM',
+                      help='re-extract this range of report months and recompute only the months it revises')
+    mode.add_argument('--retry-quarantined', action='store_true',
+                      help='re-parse only the quarantined workbooks and fold them into the current output')
+    parser.add_argument('--workers', type=int, default=WORKERS,
+                        help='worker processes for --backfill (default: TVT_BACKFILL_WORKERS or CPU count)')
+    args = parser.parse_args(argv)
+    if args.extract_year:
+        return run_extract(args.extract_year)
+    if args.backfill or args.retry_quarantined:
+        return run_backfill(args.backfill, args.workers)
+
+    metrics = RunMetrics('merge_state_miles')
+    metrics.set_info(input_dir=INPUT_DIR, output=OUTPUT_CSV, mode='reduce' if args.reduce else 'full')
+    with metrics.run():
+        stats = {'total_files': 0, 'processed': 0, 'errors': defaultdict(list)}
+        # The published version this build starts from; the commit only writes the months that differ
+        base = tvt_commit.load_published(OUTPUT_CSV)
+
+        with metrics.phase('list'):
+            files = list_input_files()
+        stats['total_files'] = len(files)
+
+        if args.reduce:
+            # Extraction already ran in the per-year shards
+            with metrics.phase('parse'):
+                frames, shard_stats = read_partials(JOB, report_years(INPUT_DIR))
+            stats['processed'] = shard_stats['processed']
+            stats['errors'].update(shard_stats['errors'])
+            print(f"Merging {len(frames)} extracts from {len(files)} files...")
+        else:
+            print(f"Processing {len(files)} files chronologically from 2002 to present...")
+            frames = extract_files(files, stats, metrics)
+
+        with metrics.phase('consolidate'):
+            consolidated_data = consolidate(frames)
+
+        metrics.incr('files_processed', stats['processed'])
+        metrics.incr('files_failed', sum(len(v) for v in stats['errors'].values()))
+
+        # Workbooks that failed are quarantined; the output is flagged incomplete until they are retried
+        quarantine = tvt_quarantine.update(
+            JOB, {fn for _, fn, _ in frames}, stats['errors'].get('read_error', []), replace=True
+        )
+
+        # Print processing summary
+        print_summary(stats)
+
+        # Convert consolidated data to DataFrame
+        if not consolidated_data:
+            print("\n❌ No data was successfully processed. No output CSV will be created.")
+            print("Please check the file paths and formats.")
+            return
+
+        with metrics.phase('consolidate'):
+            final_df = build_final_df(consolidated_data)
+        
+        # Publish the changed months as a new snapshot (readers keep the previous one until the swap)
+        with metrics.phase('write'):
+            snapshot, published, _ = tvt_commit.commit(
+                {OUTPUT_CSV: (final_df, base, 'state_miles')}, metrics.job,
+                file_meta={OUTPUT_CSV: tvt_quarantine.completeness(quarantine)},
+            )
+        metrics.incr('rows_out', len(published[OUTPUT_CSV]))
+        metrics.set_info(snapshot=snapshot, memory_bytes=memory_bytes(final_df), complete=not quarantine)
+        print(f'\n✅ Merged {len(final_df)} rows → {OUTPUT_CSV}')
+        
+        min_date, max_date = format_mdy([final_df.index.min(), final_df.index.max()])
+        print(f"Data spans from {min_date} to {max_date}")
+        
+        print(f"States included: {final_df['State'].nunique()}")
+        print(f"Unique year-month combinations: {final_df.groupby(['Year', 'Month']).ngroups}")
+
+
+if __name__ == '__main__':
+    tvt_profile.run(main)
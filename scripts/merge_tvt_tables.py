@@ -0,0 +1,324 @@
+# Functional-class and regional VMT tables of the TVT workbooks.
+# Both tables come out of the workbook pass that already reads the state and national tables
+# (see tvt_extract.py), so they cost one more sheet read per workbook rather than another pass:
+#   functional_class  Table 1 ('Tables 1 & 2' up to 2003, 'Page 3' since): monthly VMT in billions for
+#                     the six functional systems and All Systems, for the report year and the year before
+#   regional_vmt      the region map of the first page (2004 on): report-month VMT in billions by FHWA
+#                     region and its change from the same month a year earlier
+# Both readers find their cells by label (month header tokens, section titles, region names), so the
+# row and column drift between layouts does not need a per-year offset table.
+# A month is taken from the newest report that lists it. Outputs (published together as one snapshot):
+#   merged_tvt_functional_class.csv  Date, Month, Year, <system> VMT (Billion) ...
+#   merged_tvt_regional_vmt.csv      Date, Month, Year, Region, VMT (Billion), Change From Last Year (%)
+#
+# Usage:
+#   python merge_tvt_tables.py                       # parse every workbook and publish
+#   python merge_tvt_tables.py --reduce              # merge the partials of tvt_extract.py --extract-year
+#   python merge_tvt_tables.py --backfill 2024-01:2024-06
+#   python merge_tvt_tables.py --retry-quarantined
+
+import os
+import re
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import tvt_commit
+import tvt_locks
+import tvt_profile
+import tvt_extract
+import tvt_quarantine
+from tvt_dates import MONTH_ABBRS, month_key, key_year, format_mdy, format_abbr
+from tvt_partials import report_years, read_partials, partial_path
+from tvt_backfill import parse_range
+from tvt_raw_store import source_name
+from tvt_schema import FUNCTIONAL_SYSTEMS, apply_schema, memory_bytes
+from tvt_metrics import RunMetrics
+
+BASE_DIR = os.getenv('AIRFLOW_HOME', '/opt/airflow')
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+INPUT_DIR = os.getenv('TVT_RAW_DIR', os.path.join(DATA_DIR, 'tvt', 'raw'))
+PROCESSED_DIR = os.getenv('TVT_PROC_DIR', os.path.join(DATA_DIR, 'tvt', 'processed'))
+os.makedirs(PROCESSED_DIR, exist_ok=True)
+FUNCTIONAL_CLASS_CSV = os.getenv('FUNCTIONAL_CLASS_CSV', os.path.join(PROCESSED_DIR, 'merged_tvt_functional_class.csv'))
+REGIONAL_VMT_CSV = os.getenv('REGIONAL_VMT_CSV', os.path.join(PROCESSED_DIR, 'merged_tvt_regional_vmt.csv'))
+FUNCTIONAL_CLASS = 'functional_class'
+REGIONAL_VMT = 'regional_vmt'
+TABLES = (FUNCTIONAL_CLASS, REGIONAL_VMT)
+
+# Table 1 is the third sheet in every layout
+TABLE1_SHEET = 2
+MONTH_TOKENS = {abbr.upper(): i + 1 for i, abbr in enumerate(MONTH_ABBRS)}  # 'APRIL', 'SEPT' match on [:3]
+SYSTEM_LABELS = {system.lower(): system for system in FUNCTIONAL_SYSTEMS}
+SECTION_RE = re.compile(r'\d{4}\s+Individual\s+Monthly', re.IGNORECASE)
+TABLE2_RE = re.compile(r'^Table\s*-?\s*2\b', re.IGNORECASE)
+
+# The region map starts with the 2004 layout; the 2002-03 cover page has none
+REGIONAL_FIRST_YEAR = 2004
+REGIONS = {
+    'WEST': 'West', 'NORTH CENTRAL': 'North Central', 'NORTHEAST': 'Northeast',
+    'SOUTH GULF': 'South Gulf', 'SOUTH ATLANTIC': 'South Atlantic',
+}
+# e.g. 'Estimated Vehicle-Miles of Travel by Region - June 2006 - (in Billions)'; it can lag the report month
+REGION_TITLE_RE = re.compile(r'by\s+Region\s*-\s*(?P<month>[A-Za-z]+)\.?\s+(?P<year>\d{4})', re.IGNORECASE)
+
+
+def _text(value) -> str:
+    return ' '.join(value.split()) if isinstance(value, str) else ''
+
+
+@tvt_extract.extractor(FUNCTIONAL_CLASS)
+@tvt_profile.tagged(lambda book, *args, **kwargs: source_name(book))
+def read_functional_class(book, year: int, month: int) -> pd.DataFrame:
+    """Long rows (Year, Month, System, VMT) of Table 1: every monthly value of both years it lists."""
+    cells = pd.read_excel(book, sheet_name=TABLE1_SHEET, header=None, engine='openpyxl').to_numpy(dtype=object)
+    # The two sections are the year before the report and the report year; their titles are only used
+    # to find them (03jan labels them 2001 and 2002)
+    section_years = iter((year - 1, year))
+    month_cols, section_year, rows = None, None, []
+    for row in cells:
+        texts = [(j, _text(v)) for j, v in enumerate(row) if _text(v)]
+        if not texts:
+            continue
+        label = texts[0][1]
+        if TABLE2_RE.match(label):
+            break
+        months = {j: MONTH_TOKENS.get(t.upper()[:3]) for j, t in texts if t.upper()[:3] in MONTH_TOKENS}
+        if len(set(months.values())) == 12:
+            month_cols = months  # header rows repeat inside some layouts; the latest one applies
+            continue
+        if SECTION_RE.search(label):
+            section_year = next(section_years, None)
+            continue
+        if 'percent change' in label.lower():
+            section_year = None
+            continue
+        system = SYSTEM_LABELS.get(label.lower())
+        if system is None or section_year is None or month_cols is None:
+            continue
+        for j, mon in month_cols.items():
+            rows.append((section_year, mon, system, row[j]))
+
+    df = pd.DataFrame(rows, columns=['Year', 'Month', 'System', 'VMT'])
+    df['VMT'] = pd.to_numeric(df['VMT'], errors='coerce')  # blanks (' ') mark months not reported yet
+    df = df.dropna(subset=['VMT'])
+    if df.empty:
+        raise ValueError(f'No Table 1 values found on sheet {TABLE1_SHEET}')
+    return apply_schema(df, 'functional_class_extract')
+
+
+def _percent(value) -> float:
+    """Change in percent: '-4.8%' strings since 2008, fractions behind a % format before."""
+    if isinstance(value, str):
+        return pd.to_numeric(value.strip().rstrip('%'), errors='coerce')
+    return float(value) * 100 if pd.notna(value) else np.nan
+
+
+@tvt_extract.extractor(REGIONAL_VMT)
+@tvt_profile.tagged(lambda book, *args, **kwargs: source_name(book))
+def read_regional_vmt(book, year: int, month: int) -> pd.DataFrame:
+    """Rows (Year, Month, Region, VMT, Change) of the first page's region map; empty before 2004 or if unfilled."""
+    if year < REGIONAL_FIRST_YEAR:
+        return apply_schema(pd.DataFrame(columns=['Year', 'Month', 'Region', 'VMT', 'Change']), 'regional_extract')
+    cells = pd.read_excel(book, sheet_name=0, header=None, engine='openpyxl').to_numpy(dtype=object)
+    table_year, table_month, rows = year, month, []
+    for i, j in zip(*np.nonzero(np.vectorize(lambda v: bool(_text(v)))(cells))):
+        text = _text(cells[i, j])
+        title = REGION_TITLE_RE.search(text)
+        if title and title.group('month').upper()[:3] in MONTH_TOKENS:
+            table_year, table_month = int(title.group('year')), MONTH_TOKENS[title.group('month').upper()[:3]]
+        elif text.upper() in REGIONS and i + 2 < len(cells):
+            # VMT in the cell below the name, the change below that
+            rows.append((REGIONS[text.upper()], pd.to_numeric(cells[i + 1, j], errors='coerce'),
+                         _percent(cells[i + 2, j])))
+    if not rows:
+        raise ValueError('No region map found on the first sheet')
+    # An unfilled map (10may: zeros and bare '%') leaves the month out rather than reporting zero travel
+    df = pd.DataFrame(rows, columns=['Region', 'VMT', 'Change'])
+    df = df[df['VMT'] > 0]
+    df.insert(0, 'Month', table_month)
+    df.insert(0, 'Year', table_year)
+    return apply_schema(df, 'regional_extract')
+
+
+def consolidate(frames: list, keys: list) -> pd.DataFrame:
+    """Rows of every report, the newest report's row kept for each of `keys`."""
+    parts = [df.astype({c: str for c in keys if df[c].dtype == 'category'})
+             for _, _, df in sorted(frames, key=lambda item: item[0]) if len(df)]
+    if not parts:
+        return pd.DataFrame(columns=[*keys, 'VMT'])
+    return pd.concat(parts, ignore_index=True).drop_duplicates(keys, keep='last')
+
+
+def build_functional_class(rows: pd.DataFrame) -> pd.DataFrame:
+    """One row per month, one VMT column per system."""
+    rows = rows.assign(MonthKey=month_key(rows['Year'].astype(int), rows['Month'].astype(int)))
+    wide = rows.pivot(index='MonthKey', columns='System', values='VMT').sort_index()
+    wide = wide.reindex(columns=list(FUNCTIONAL_SYSTEMS)).rename(columns=lambda s: f'{s} VMT (Billion)')
+    wide.columns.name = None
+    wide.insert(0, 'Year', key_year(wide.index))
+    wide.insert(0, 'Month', format_abbr(wide.index))
+    wide.insert(0, 'Date', format_mdy(wide.index))
+    return apply_schema(wide, 'functional_class')
+
+
+def build_regional_vmt(rows: pd.DataFrame) -> pd.DataFrame:
+    """One row per month and region."""
+    rows = rows.assign(MonthKey=month_key(rows['Year'].astype(int), rows['Month'].astype(int)))
+    out = rows.sort_values(['MonthKey', 'Region']).set_index('MonthKey')
+    out['Date'] = format_mdy(out.index)
+    out['Month'] = format_abbr(out.index)
+    out['Year'] = key_year(out.index)
+    out = out.rename(columns={'VMT': 'VMT (Billion)', 'Change': 'Change From Last Year (%)'})
+    return apply_schema(out[['Date', 'Month', 'Year', 'Region', 'VMT (Billion)', 'Change From Last Year (%)']],
+                        'regional_vmt')
+
+
+def print_summary(stats: dict, total: int) -> None:
+    """Per-table processed counts and read errors."""
+    print('\nProcessing Summary:')
+    for table in TABLES:
+        print(f"{table}: {stats[table]['processed']} of {total} workbooks")
+        for fn, err in stats[table]['errors'].get('read_error', []):
+            print(f'  ✖ {fn}: {err}')
+
+
+def gather(reports: list, reparse: set, metrics: RunMetrics) -> tuple:
+    """
+    Frames and stats of both tables for `reports`.
+
+    Report keys in `reparse` are parsed again; every other report comes from its year's partials
+    when they exist (and is parsed when they do not, or when its shard failed on it).
+    """
+    frames = {table: [] for table in TABLES}
+    stats = {table: {'processed': 0, 'errors': {'read_error': []}} for table in TABLES}
+    to_parse = [r for r in reports if r[0] in reparse]
+    by_year = {}
+    for report in reports:
+        if report[0] not in reparse:
+            by_year.setdefault(report[1], []).append(report)
+    for year, year_reports in sorted(by_year.items()):
+        if not all(os.path.exists(partial_path(table, year)) for table in TABLES):
+            to_parse += year_reports
+            continue
+        cached = {table: {item[0]: item for item in read_partials(table, [year])[0]} for table in TABLES}
+        for report in year_reports:
+            if all(report[0] in cached[table] for table in TABLES):
+                for table in TABLES:
+                    frames[table].append(cached[table][report[0]])
+                    stats[table]['processed'] += 1
+            else:
+                to_parse.append(report)
+
+    metrics.incr('reports_from_partials', len(frames[FUNCTIONAL_CLASS]))
+    print(f'Parsing {len(to_parse)} workbooks, {len(frames[FUNCTIONAL_CLASS])} reports reused from partials')
+    parsed, parsed_stats = tvt_extract.extract_reports(sorted(to_parse), list(TABLES), metrics)
+    for table in TABLES:
+        frames[table] += parsed[table]
+        stats[table]['processed'] += parsed_stats[table]['processed']
+        stats[table]['errors']['read_error'] += parsed_stats[table]['errors']['read_error']
+    return frames, stats
+
+
+def publish(frames: dict, stats: dict, base: dict, metrics: RunMetrics, replace: bool,
+            meta: dict | None = None) -> None:
+    """
+    Quarantine the failed workbooks of each table, rebuild both tables and publish them together.
+
+    `base` maps each output path to the published version the run started from; only the months
+    that differ from it are committed.
+    """
+    quarantine = {
+        table: tvt_quarantine.update(table, {fn for _, fn, _ in frames[table]},
+                                     stats[table]['errors']['read_error'], replace=replace)
+        for table in TABLES
+    }
+    with metrics.phase('consolidate'):
+        functional = build_functional_class(consolidate(frames[FUNCTIONAL_CLASS], ['Year', 'Month', 'System']))
+        regional = build_regional_vmt(consolidate(frames[REGIONAL_VMT], ['Year', 'Month', 'Region']))
+    if functional.empty and regional.empty:
+        print('\n❌ No data was successfully processed. No output CSV will be created.')
+        return
+
+    with metrics.phase('write'):
+        snapshot, published, _ = tvt_commit.commit(
+            {FUNCTIONAL_CLASS_CSV: (functional, base[FUNCTIONAL_CLASS_CSV], FUNCTIONAL_CLASS),
+             REGIONAL_VMT_CSV: (regional, base[REGIONAL_VMT_CSV], REGIONAL_VMT)}, metrics.job, meta=meta,
+            file_meta={FUNCTIONAL_CLASS_CSV: tvt_quarantine.completeness(quarantine[FUNCTIONAL_CLASS]),
+                       REGIONAL_VMT_CSV: tvt_quarantine.completeness(quarantine[REGIONAL_VMT])},
+        )
+    metrics.incr('rows_out', sum(len(df) for df in published.values()))
+    metrics.set_info(snapshot=snapshot, memory_bytes=memory_bytes(functional) + memory_bytes(regional),
+                     complete=not any(quarantine.values()))
+    print(f'\n✅ Merged {len(functional)} months → {FUNCTIONAL_CLASS_CSV}')
+    print(f'✅ Merged {len(regional)} region-months → {REGIONAL_VMT_CSV}')
+    if len(functional):
+        first, last = format_mdy([functional.index.min(), functional.index.max()])
+        print(f'Functional classes span {first} to {last}')
+
+
+def main(argv: list | None = None) -> None:
+    parser = argparse.ArgumentParser(description='Merge the TVT functional-class and regional VMT tables.')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--reduce', action='store_true',
+                      help='merge the partials of tvt_extract.py --extract-year and publish')
+    mode.add_argument('--backfill', metavar='YYYY-MM:YYYY-MM',
+                      help='re-extract this range of report months (the rest from partials) and publish')
+    mode.add_argument('--retry-quarantined', action='store_true',
+                      help='re-parse only the quarantined workbooks (the rest from partials) and publish')
+    args = parser.parse_args(argv)
+
+    metrics = RunMetrics('merge_tvt_tables')
+    mode_name = 'reduce' if args.reduce else 'backfill' if args.backfill else 'retry' if args.retry_quarantined else 'full'
+    metrics.set_info(input_dir=INPUT_DIR, outputs=[FUNCTIONAL_CLASS_CSV, REGIONAL_VMT_CSV], mode=mode_name)
+    with metrics.run():
+        with metrics.phase('list'):
+            reports = tvt_extract.report_files()
+
+        meta, reparse = None, set()
+        if args.backfill:
+            start, end = parse_range(args.backfill)
+            reparse = {r[0] for r in reports if start <= r[0] <= end}
+        elif args.retry_quarantined:
+            quarantined = set().union(*(tvt_quarantine.load(table) for table in TABLES))
+            reparse = {r[0] for r in reports if r[3] in quarantined}
+        if (args.backfill or args.retry_quarantined) and not reparse:
+            print(f'No workbooks for report months {args.backfill}; nothing to backfill.' if args.backfill
+                  else 'No quarantined workbooks; nothing to retry.')
+            return
+
+        # A report lists Table 1 for its year and the year before, and the region map for its own month;
+        # overlapping backfills of those months queue here, anything else proceeds alongside
+        claimed = {
+            FUNCTIONAL_CLASS_CSV: {month_key(y, m) for k in reparse for y in (key_year(k) - 1, key_year(k))
+                                   for m in range(1, 13)},
+            REGIONAL_VMT_CSV: reparse,
+        }
+        with tvt_locks.claim(claimed, metrics.job):
+            base = {path: tvt_commit.load_published(path) for path in (FUNCTIONAL_CLASS_CSV, REGIONAL_VMT_CSV)}
+            if args.reduce:
+                # Workbooks were parsed by the per-year shards of tvt_extract.py
+                frames, stats = {}, {}
+                with metrics.phase('parse'):
+                    for table in TABLES:
+                        frames[table], stats[table] = read_partials(table, report_years(INPUT_DIR))
+                        stats[table]['errors'].setdefault('read_error', [])
+                print(f"Merging {len(frames[FUNCTIONAL_CLASS])} extracts from {len(reports)} files...")
+            elif reparse:
+                # Both tables are small, so they are rebuilt whole from the re-parsed range plus the partials
+                frames, stats = gather(reports, reparse, metrics)
+                meta = {'backfill': args.backfill or 'quarantine'}
+            else:
+                print(f'Processing {len(reports)} files chronologically from 2002 to present...')
+                frames, stats = tvt_extract.extract_reports(reports, list(TABLES), metrics)
+
+            failed = {fn for table in TABLES for fn, _ in stats[table]['errors']['read_error']}
+            metrics.incr('files_processed', len(reports) - len(failed))
+            metrics.incr('files_failed', len(failed))
+            print_summary(stats, len(reports))
+            publish(frames, stats, base, metrics, replace=args.reduce or mode_name == 'full', meta=meta)
+
+
+if __name__ == '__main__':
+    tvt_profile.run(main)
@@ -0,0 +1,241 @@
+# Anomaly check of the newest report month.
+# Every state series (All / Rural Arterial / Urban Arterial Miles) and national Total VMT is scored in one
+# vectorized pass over the series × month matrix (see tvt_seasonal.load_matrix), using robust z-scores
+# (median / MAD, so past outliers do not mask new ones) of log changes:
+#   MoM z    this month's month-over-month change against the same calendar month's MoM change in
+#            earlier years (the seasonal swing Dec→Jan is large every year)
+#   YoY z    this month's year-over-year change against the same calendar month in earlier years
+#   cross z  this series' YoY change against all states' YoY changes for the same measure and month
+#            (a mis-shifted column, as in the December 2002 report, stands out here even in volatile years)
+# A series is flagged when its largest |z| reaches TVT_ANOMALY_Z. The ranked report is written to
+# data/tvt/processed/anomalies/<YYYY-MM>.csv.
+#
+# TVT_ANOMALY_GATE=block makes the task fail while unaccepted anomalies remain, which stops the DAG
+# before the seasonal, master DB and change-feed stages publish anything built from the month. The merges
+# have already swapped `current` by then, so with `--base` (the snapshot current before they ran) a
+# blocking gate also rolls `current` back to it and the month is not visible through the merged_*.csv
+# paths either. After review, `--accept` records the flagged series of the written report as accepted,
+# so the next run (which publishes the month again) passes.
+#
+# Usage:
+#   python tvt_anomaly.py [--month YYYY-MM] [--top N] [--base SNAPSHOT_ID]
+#   python tvt_anomaly.py --accept [--month YYYY-MM]
+
+import os
+import sys
+import json
+import warnings
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import tvt_profile
+import tvt_seasonal
+import tvt_snapshot
+from tvt_backfill import parse_range
+from tvt_metrics import RunMetrics
+from tvt_dates import key_year, key_month, format_abbr
+
+BASE_DIR = os.getenv('AIRFLOW_HOME', '/opt/airflow')
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+PROCESSED_DIR = os.getenv('TVT_PROC_DIR', os.path.join(DATA_DIR, 'tvt', 'processed'))
+ANOMALY_DIR = os.getenv('TVT_ANOMALY_DIR', os.path.join(PROCESSED_DIR, 'anomalies'))
+ACCEPTED_PATH = os.path.join(ANOMALY_DIR, 'accepted.json')
+# Largest |z| at which a series is flagged
+Z_LIMIT = float(os.getenv('TVT_ANOMALY_Z', '6'))
+# 'off': report only; 'block': exit non-zero while unaccepted anomalies remain
+GATE = os.getenv('TVT_ANOMALY_GATE', 'off').strip().lower()
+# Earlier years of the same calendar month that make up a series' own history
+HISTORY_YEARS = int(os.getenv('TVT_ANOMALY_HISTORY_YEARS', '15'))
+# Years of history a series needs before its MoM/YoY z-scores are reported
+MIN_HISTORY = 4
+# Floor on the MAD (log change): keeps very smooth series from flagging sub-percent moves
+MIN_SPREAD = 0.01
+# Scales the MAD to a standard deviation under normality
+MAD_SCALE = 1.4826
+
+GATES = ('off', 'block')
+
+
+def robust_z(x: np.ndarray, history: np.ndarray, min_count: int = MIN_HISTORY) -> np.ndarray:
+    """z-score of each row's x against the non-NaN values of the same row of history (median/MAD)."""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # rows without history give all-NaN slices
+        center = np.nanmedian(history, axis=1)
+        mad = np.nanmedian(np.abs(history - center[:, None]), axis=1)
+    spread = MAD_SCALE * np.maximum(mad, MIN_SPREAD)
+    z = (x - center) / spread
+    z[np.sum(~np.isnan(history), axis=1) < min_count] = np.nan
+    return z
+
+
+def score_month(labels: list, keys: np.ndarray, values: np.ndarray, month: int) -> pd.DataFrame:
+    """One row per series observed in `month`, with its changes, z-scores and overall score."""
+    t = int(month - keys[0])
+    if t < 12:
+        raise ValueError(f'{format_abbr([month])[0]} {key_year(month)} has less than a year of history')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        logs = np.where(values > 0, np.log(values), np.nan)
+    mom = np.full(logs.shape, np.nan)
+    mom[:, 1:] = logs[:, 1:] - logs[:, :-1]
+    yoy = np.full(logs.shape, np.nan)
+    yoy[:, 12:] = logs[:, 12:] - logs[:, :-12]
+
+    # The same calendar month in each earlier year (within the history window)
+    past = t - 12 * np.arange(1, HISTORY_YEARS + 1)
+    past = past[past >= 0]
+    mom_z = robust_z(mom[:, t], mom[:, past])
+    yoy_z = robust_z(yoy[:, t], yoy[:, past])
+
+    # Cross-section: each state's YoY change against all states' for the same measure
+    states = np.array([state for state, _ in labels])
+    measures = np.array([measure for _, measure in labels])
+    cross_z = np.full(len(labels), np.nan)
+    for measure in np.unique(measures[states != tvt_seasonal.NATIONAL]):
+        rows = np.flatnonzero((measures == measure) & (states != tvt_seasonal.NATIONAL))
+        cross_z[rows] = robust_z(yoy[rows, t], np.tile(yoy[rows, t], (len(rows), 1)))
+
+    with np.errstate(invalid='ignore'):
+        mom_pct, yoy_pct = np.expm1(mom[:, t]) * 100, np.expm1(yoy[:, t]) * 100
+    zs = np.abs(np.vstack([mom_z, yoy_z, cross_z]))
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        score = np.nanmax(zs, axis=0)
+    report = pd.DataFrame({
+        'State': np.where(states == tvt_seasonal.NATIONAL, 'United States', states),
+        'Measure': measures,
+        'Month': f'{key_year(month):04d}-{key_month(month):02d}',
+        'Value': values[:, t],
+        'Previous Month': values[:, t - 1],
+        'Previous Year': values[:, t - 12],
+        'MoM %': mom_pct.round(2),
+        'YoY %': yoy_pct.round(2),
+        'MoM z': mom_z.round(2),
+        'YoY z': yoy_z.round(2),
+        'Cross z': cross_z.round(2),
+        'Score': score.round(2),
+        'Driver': np.array(['MoM', 'YoY', 'Cross'])[np.argmax(np.nan_to_num(zs, nan=-1), axis=0)],
+    })
+    report = report[~np.isnan(values[:, t])]
+    report['Flagged'] = report['Score'] >= Z_LIMIT
+    return report.sort_values('Score', ascending=False, na_position='last', ignore_index=True)
+
+
+def latest_month(keys: np.ndarray, values: np.ndarray) -> int:
+    """Month key of the newest month any series has a value for."""
+    return int(keys[np.flatnonzero(~np.isnan(values).all(axis=0))[-1]])
+
+
+def _anomaly_id(row) -> str:
+    return f"{row['Month']}|{row['State']}|{row['Measure']}"
+
+
+def load_accepted() -> set:
+    if not os.path.exists(ACCEPTED_PATH):
+        return set()
+    with open(ACCEPTED_PATH) as f:
+        return set(json.load(f))
+
+
+def save_accepted(accepted: set) -> None:
+    os.makedirs(ANOMALY_DIR, exist_ok=True)
+    with open(f'{ACCEPTED_PATH}.tmp', 'w') as f:
+        json.dump(sorted(accepted), f, indent=1)
+    os.replace(f'{ACCEPTED_PATH}.tmp', ACCEPTED_PATH)
+
+
+def report_path(month: int) -> str:
+    return os.path.join(ANOMALY_DIR, f'{key_year(month):04d}-{key_month(month):02d}.csv')
+
+
+def write_report(report: pd.DataFrame, month: int) -> str:
+    os.makedirs(ANOMALY_DIR, exist_ok=True)
+    path = report_path(month)
+    report.to_csv(f'{path}.tmp', index=False)
+    os.replace(f'{path}.tmp', path)
+    return path
+
+
+def accept(month: int | None = None) -> None:
+    """
+    Accept the open anomalies of the written report of `month` (default: the newest report).
+
+    Reads the report rather than re-scoring, since a blocking gate has rolled the month's data back.
+    """
+    if month is not None:
+        path = report_path(month)
+    else:
+        names = sorted(f for f in os.listdir(ANOMALY_DIR) if f.endswith('.csv')) if os.path.isdir(ANOMALY_DIR) else []
+        path = os.path.join(ANOMALY_DIR, names[-1]) if names else None
+    if path is None or not os.path.exists(path):
+        sys.exit(f'No anomaly report to accept{f" at {path}" if path else ""}; run the check first')
+    report = pd.read_csv(path)
+    open_ = report[report['Flagged'] & ~report['Accepted']]
+    if not len(open_):
+        print(f'✔ No open anomalies in {path}')
+        return
+    save_accepted(load_accepted() | {_anomaly_id(row) for _, row in open_.iterrows()})
+    print(f'✔ Accepted {len(open_)} flagged series of {path} → {ACCEPTED_PATH}')
+
+
+def withhold(base: str) -> None:
+    """Roll `current` back to `base`, the snapshot published before this run's merges."""
+    cur = tvt_snapshot.current_snapshot()
+    if not base:
+        print('⚠ No snapshot before the merges to roll back to; their outputs stay published')
+    elif cur and os.path.basename(cur) != base:
+        # Also withdraws anything published alongside the merges (a backfill) since `base`
+        tvt_snapshot.rollback(base)
+
+
+def main(argv: list | None = None) -> None:
+    parser = argparse.ArgumentParser(description='Score the newest report month for anomalies.')
+    parser.add_argument('--month', help='month to score as YYYY-MM (default: the newest month in the data)')
+    parser.add_argument('--top', type=int, default=10, help='rows of the ranked report to print')
+    parser.add_argument('--accept', action='store_true',
+                        help="accept the flagged series of this month's report (default: the newest) after review")
+    parser.add_argument('--base', metavar='SNAPSHOT_ID',
+                        help='snapshot current before the merges; a blocking gate rolls `current` back to it')
+    args = parser.parse_args(argv)
+    if GATE not in GATES:
+        parser.error(f'TVT_ANOMALY_GATE must be one of {GATES}, not {GATE!r}')
+    if args.accept:
+        return accept(parse_range(args.month)[0] if args.month else None)
+
+    metrics = RunMetrics('anomaly_check')
+    with metrics.run():
+        with metrics.phase('parse'):
+            labels, keys, values = tvt_seasonal.load_matrix()
+        month = parse_range(args.month)[0] if args.month else latest_month(keys, values)
+        with metrics.phase('consolidate'):
+            report = score_month(labels, keys, values, month)
+        accepted = load_accepted()
+        report['Accepted'] = [_anomaly_id(row) in accepted for _, row in report.iterrows()]
+        with metrics.phase('write'):
+            path = write_report(report, month)
+
+        flagged = report[report['Flagged']]
+        open_ = flagged[~flagged['Accepted']]
+        metrics.incr('rows_out', len(report))
+        metrics.incr('anomalies', len(flagged))
+        metrics.set_info(month=report['Month'].iat[0] if len(report) else None, gate=GATE,
+                         z_limit=Z_LIMIT, report=path)
+
+        cols = ['State', 'Measure', 'Value', 'MoM %', 'YoY %', 'MoM z', 'YoY z', 'Cross z', 'Score']
+        print(f'▶ {len(report)} series scored for {format_abbr([month])[0]} {key_year(month)}; top {args.top}:')
+        print(report.head(args.top)[cols].to_string(index=False))
+        if len(open_):
+            names = [f"{r['State']} {r['Measure']}" for _, r in open_.head(args.top).iterrows()]
+            more = f' and {len(open_) - len(names)} more' if len(open_) > len(names) else ''
+            print(f'⚠ {len(open_)} series with |z| ≥ {Z_LIMIT:g} need review: {", ".join(names)}{more}')
+        else:
+            print(f'✔ No open anomalies (|z| ≥ {Z_LIMIT:g}); report → {path}')
+        if len(open_) and GATE == 'block':
+            if args.base is not None:
+                withhold(args.base)
+            sys.exit(f'Anomaly gate: {len(open_)} unaccepted anomalies in {path}')
+
+
+if __name__ == '__main__':
+    tvt_profile.run(main)
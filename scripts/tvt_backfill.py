@@ -0,0 +1,110 @@
+# Shared pieces of the merge scripts' backfill mode (--backfill YYYY-MM:YYYY-MM).
+# A backfill re-parses only the workbooks whose report month falls in the range, in parallel worker
+# processes. Reports outside the range that revise the same output months are taken from the per-year
+# partials of the last sharded run when available (and re-parsed otherwise). The affected months are
+# recomputed from those reports and spliced into the current output; every other row is kept as is.
+
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import pandas as pd
+
+import tvt_frames
+import tvt_snapshot
+from tvt_dates import month_key, key_year, key_from_abbr
+from tvt_metrics import RunMetrics
+from tvt_partials import partial_path, read_partials
+
+# Worker processes used to re-parse workbooks
+WORKERS = int(os.getenv('TVT_BACKFILL_WORKERS', str(os.cpu_count() or 1)))
+
+
+def parse_range(text: str) -> tuple:
+    """Month keys (start, end) of 'YYYY-MM:YYYY-MM' (or a single 'YYYY-MM'), inclusive."""
+    bounds = []
+    for part in text.split(':'):
+        try:
+            year, month = (int(p) for p in part.strip().split('-'))
+        except ValueError:
+            raise ValueError(f'Invalid backfill range {text!r}; expected YYYY-MM:YYYY-MM')
+        if not 1 <= month <= 12:
+            raise ValueError(f'Invalid month in backfill range {text!r}')
+        bounds.append(month_key(year, month))
+    start, end = bounds[0], bounds[-1]
+    if len(bounds) > 2 or start > end:
+        raise ValueError(f'Invalid backfill range {text!r}; expected YYYY-MM:YYYY-MM with start <= end')
+    return start, end
+
+
+def _extract_chunk(extract_files, files: list) -> tuple:
+    stats = {'total_files': 0, 'processed': 0, 'errors': defaultdict(list)}
+    metrics = RunMetrics('backfill_worker')
+    frames = extract_files(files, stats, metrics)
+    return frames, stats, metrics.files, dict(metrics.counters)
+
+
+def extract_parallel(extract_files, files: list, stats: dict, metrics: RunMetrics,
+                     workers: int = WORKERS) -> list:
+    """
+    Run a script's `extract_files(files, stats, metrics)` over `files` in worker processes.
+
+    Results, per-file timings and counters are folded into the caller's stats and metrics.
+    """
+    if not files:
+        return []
+    workers = max(1, min(workers, len(files)))
+    chunks = [files[i::workers] for i in range(workers)]
+    frames = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for chunk_frames, chunk_stats, file_times, counters in pool.map(partial(_extract_chunk, extract_files), chunks):
+            frames.extend(chunk_frames)
+            stats['total_files'] += chunk_stats['total_files']
+            stats['processed'] += chunk_stats['processed']
+            for kind, errs in chunk_stats['errors'].items():
+                stats['errors'][kind].extend(errs)
+            metrics.files.update(file_times)
+            for name, n in counters.items():
+                metrics.incr(name, n)
+    return frames
+
+
+def gather_frames(job: str, extract_files, range_files: dict, other_files: dict,
+                  stats: dict, metrics: RunMetrics, workers: int = WORKERS) -> list:
+    """
+    Frames for a backfill, oldest report first.
+
+    `range_files` and `other_files` map report keys to workbook names. Workbooks in the range are always
+    re-parsed; the other reports come from their year's partial when one exists.
+    """
+    frames, to_parse = [], dict(range_files)
+    by_year = defaultdict(dict)
+    for key, fn in other_files.items():
+        by_year[key_year(key)][key] = fn
+    for year, reports in sorted(by_year.items()):
+        if not os.path.exists(partial_path(job, year)):
+            to_parse.update(reports)
+            continue
+        cached, _ = read_partials(job, [year])
+        cached = [item for item in cached if item[0] in reports]
+        frames.extend(cached)
+        # Reports that failed in the shard run get another try
+        missing = reports.keys() - {item[0] for item in cached}
+        to_parse.update({k: reports[k] for k in missing})
+
+    metrics.incr('reports_from_partials', len(frames))
+    print(f'Backfill: parsing {len(to_parse)} workbooks with {workers} workers, '
+          f'{len(frames)} reports reused from partials')
+    with metrics.phase('parse'):
+        frames += extract_parallel(extract_files, sorted(to_parse.values()), stats, metrics, workers)
+    return sorted(frames, key=lambda item: item[0])
+
+
+def load_current(path: str) -> pd.DataFrame:
+    """The published output to splice into, with a MonthKey column."""
+    if tvt_snapshot.current_snapshot() is None and not os.path.exists(path):
+        raise FileNotFoundError(f'{path} has not been built yet; run a full build before backfilling')
+    df = tvt_frames.read_csv(tvt_snapshot.resolve(path))
+    df['MonthKey'] = key_from_abbr(df['Year'], df['Month'])
+    return df
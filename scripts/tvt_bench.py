@@ -0,0 +1,169 @@
+# Scale benchmark for the workbook readers, the merges and tvt_db.py on synthetic data (see tvt_synth.py).
+# Each stage is run at every scale factor (default 1×, 10×, 100×) and timed; a second pass under
+# tracemalloc records the peak memory allocated. Between consecutive scales the growth exponent
+# log(cost ratio) / log(size ratio) is reported: ~1 is linear, ~0 flat; anything above
+# TVT_BENCH_SUPERLINEAR (default 1.2) is flagged so super-linear steps show up before production does.
+#
+# Stages (size at 1×):
+#   files   read_state_miles + read_excel_data over 14 workbooks (one per historical layout), then both
+#           merges' consolidate/build_final_df; scaled by the number of workbooks
+#   rows    the same 14 workbooks with state sheets scale× as long (detail rows below the read window)
+#   states  state miles consolidate + build_final_df for reports with scale × 51 states
+#   db      tvt_db.load_sources + merge_sources over 300 months of scale × 51 states
+#
+# Synthetic corpora are cached under TVT_BENCH_DIR (default data/bench/) and reused by later runs.
+# Results are printed and written to logs/bench/<timestamp>.json.
+#
+# Usage:
+#   python tvt_bench.py [--stages files,rows,states,db] [--scales 1,10,100] [--no-memory]
+
+import os
+import gc
+import json
+import math
+import time
+import argparse
+import tracemalloc
+from datetime import datetime
+
+import tvt_synth
+import tvt_profile
+from tvt_dates import month_key
+
+BASE_DIR = os.getenv('AIRFLOW_HOME', '/opt/airflow')
+BENCH_DIR = os.getenv('TVT_BENCH_DIR', os.path.join(BASE_DIR, 'data', 'bench'))
+REPORT_DIR = os.getenv('TVT_BENCH_REPORT_DIR', os.path.join(BASE_DIR, 'logs', 'bench'))
+# Growth exponent above which a step is flagged as super-linear
+SUPERLINEAR = float(os.getenv('TVT_BENCH_SUPERLINEAR', '1.2'))
+# Steps faster than this are too noisy to judge
+MIN_SECONDS = 0.05
+
+STAGES = ('files', 'rows', 'states', 'db')
+# Rows of a (modern) state sheet; the `rows` stage makes sheets scale× this long
+SHEET_ROWS = 67
+
+
+def _corpus(name: str, **kwargs) -> list:
+    """Synthetic workbooks for one stage and scale, generated on first use."""
+    out_dir = os.path.join(BENCH_DIR, name)
+    listing = os.path.join(out_dir, 'corpus.json')
+    if os.path.exists(listing):
+        with open(listing) as f:
+            return [tuple(item) for item in json.load(f)]
+    t0 = time.perf_counter()
+    written = tvt_synth.generate(out_dir, months=tvt_synth.layout_variants(), **kwargs)
+    with open(listing, 'w') as f:
+        json.dump(written, f)
+    print(f'  generated {len(written)} workbooks → {out_dir} ({time.perf_counter() - t0:.1f}s)')
+    return written
+
+
+def _read_and_merge(corpus: list) -> None:
+    import merge_tvt_page456
+    import merge_tvt_data
+    state_frames, national_frames = [], []
+    for path, year, month in corpus:
+        key = month_key(year, month)
+        state_frames.append((key, path, merge_tvt_page456.read_state_miles(path, year, month)))
+        national_frames.append((key, path, merge_tvt_data.read_excel_data(path, year)))
+    merge_tvt_page456.build_final_df(merge_tvt_page456.consolidate(state_frames))
+    merge_tvt_data.build_final_df(merge_tvt_data.consolidate(national_frames))
+
+
+def setup(stage: str, scale: int) -> tuple:
+    """(size, callable) of one stage at one scale; data generation happens here, outside the timing."""
+    variants = tvt_synth.layout_variants()
+    if stage == 'files':
+        corpus = _corpus(f'files_x{scale}', files=scale * len(variants))
+        return len(corpus), lambda: _read_and_merge(corpus)
+    if stage == 'rows':
+        corpus = _corpus(f'rows_x{scale}', extra_rows=(scale - 1) * SHEET_ROWS)
+        return scale * SHEET_ROWS, lambda: _read_and_merge(corpus)
+    if stage == 'states':
+        import merge_tvt_page456
+        n_states = scale * tvt_synth.STATE_SLOTS
+        frames = [(month_key(y, m), f'{y}-{m}', tvt_synth.expected_state_frame(y, m, n_states)) for y, m in variants]
+        return n_states, lambda: merge_tvt_page456.build_final_df(merge_tvt_page456.consolidate(frames))
+    if stage == 'db':
+        import tvt_db
+        from tvt_gdp_monthly import monthly_gdp
+        n_states = scale * tvt_synth.STATE_SLOTS
+        out_dir = os.path.join(BENCH_DIR, f'db_x{scale}')
+        paths = tvt_synth.merged_tables(out_dir, n_states)
+        monthly_gdp(paths['gdp'])  # warm the monthly GDP cache so both passes do the same work
+        return n_states, lambda: tvt_db.merge_sources(tvt_db.load_sources(paths))
+    raise ValueError(f'Unknown stage {stage!r}; choose from {STAGES}')
+
+
+def measure(run, memory: bool = True) -> tuple:
+    """(seconds, peak MB allocated or None) of one call; memory comes from a second, traced call."""
+    gc.collect()
+    t0 = time.perf_counter()
+    run()
+    seconds = time.perf_counter() - t0
+    if not memory:
+        return seconds, None
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1] / 1e6
+    finally:
+        tracemalloc.stop()
+    return seconds, peak
+
+
+def exponent(prev: float | None, cur: float | None, size_ratio: float, floor: float = 0.0) -> float | None:
+    if prev is None or cur is None or prev <= floor or size_ratio <= 1:
+        return None
+    return math.log(cur / prev) / math.log(size_ratio)
+
+
+def main(argv: list | None = None) -> None:
+    parser = argparse.ArgumentParser(description='Time and memory growth of the pipeline stages at scale.')
+    parser.add_argument('--stages', default=','.join(STAGES), help=f'comma-separated subset of {",".join(STAGES)}')
+    parser.add_argument('--scales', default='1,10,100', help='comma-separated scale factors')
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc pass')
+    args = parser.parse_args(argv)
+    stages = [s.strip() for s in args.stages.split(',')]
+    scales = sorted(int(s) for s in args.scales.split(','))
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        parser.error(f'unknown stage(s) {unknown}; choose from {STAGES}')
+
+    results = []
+    for stage in stages:
+        print(f'▶ {stage}')
+        prev = None
+        for scale in scales:
+            size, run = setup(stage, scale)
+            seconds, peak = measure(run, memory=not args.no_memory)
+            row = {'stage': stage, 'scale': scale, 'size': size, 'seconds': round(seconds, 4),
+                   'peak_mb': None if peak is None else round(peak, 2)}
+            if prev:
+                ratio = size / prev['size']
+                row['time_exponent'] = exponent(prev['seconds'], seconds, ratio, MIN_SECONDS)
+                row['memory_exponent'] = exponent(prev['peak_mb'], peak, ratio)
+                row['superlinear'] = any(e is not None and e > SUPERLINEAR
+                                         for e in (row['time_exponent'], row['memory_exponent']))
+            results.append(row)
+            prev = row
+            growth = ''
+            if 'time_exponent' in row:
+                fmt = lambda e: '  n/a' if e is None else f'{e:5.2f}'
+                growth = f"  growth time {fmt(row['time_exponent'])} mem {fmt(row['memory_exponent'])}"
+                growth += '  ⚠ super-linear' if row['superlinear'] else ''
+            mem = '' if peak is None else f'  peak {peak:9.1f} MB'
+            print(f'  {scale:>4}×  size {size:>8}  {seconds:8.3f}s{mem}{growth}')
+
+    os.makedirs(REPORT_DIR, exist_ok=True)
+    path = os.path.join(REPORT_DIR, f"{datetime.now().strftime('%Y%m%dT%H%M%S')}.json")
+    with open(path, 'w') as f:
+        json.dump({'scales': scales, 'superlinear_threshold': SUPERLINEAR, 'results': results}, f, indent=1)
+    flagged = [f"{r['stage']} {r['scale']}×" for r in results if r.get('superlinear')]
+    print(f"⚠ Super-linear growth: {', '.join(flagged)}" if flagged else '✔ No super-linear growth')
+    print(f'✔ Report → {path}')
+
+
+if __name__ == '__main__':
+    tvt_profile.run(main)
@@ -0,0 +1,201 @@
+# This script builds a change feed for the processed TVT outputs.
+# Each processed CSV is compared with the copy captured on the previous run: rows are hashed per
+# Year partition first, and only the partitions whose hash changed are diffed row by row on their keys.
+# Inserted and updated rows are written to a delta CSV so downstream loaders can apply upserts.
+# To run this script, ensure you have the required libraries installed:
+# pip install pandas numpy
+
+import os
+import json
+import shutil
+import hashlib
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import tvt_frames
+import tvt_snapshot
+import tvt_profile
+from tvt_metrics import RunMetrics
+
+BASE_DIR = os.getenv('AIRFLOW_HOME', '/opt/airflow')
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+PROCESSED_DIR = os.getenv('TVT_PROC_DIR', os.path.join(DATA_DIR, 'tvt', 'processed'))
+CHANGES_DIR = os.getenv('TVT_CHANGES_DIR', os.path.join(PROCESSED_DIR, 'changes'))
+BASELINE_DIR = os.path.join(CHANGES_DIR, 'baseline')
+
+PARTITION_COL = 'Year'
+
+metrics = RunMetrics('build_change_feed')
+
+# Processed outputs tracked by the feed, with the columns that identify a row
+TABLES = {
+    'state_miles': {
+        'path': os.getenv('STATE_MILES_CSV', os.path.join(PROCESSED_DIR, 'merged_tvt_state_miles.csv')),
+        'keys': ['Date', 'State'],
+    },
+    'tvt_data': {
+        'path': os.getenv('NATIONAL_VMT_CSV', os.path.join(PROCESSED_DIR, 'merged_tvt_data.csv')),
+        'keys': ['Date'],
+    },
+    'functional_class': {
+        'path': os.getenv('FUNCTIONAL_CLASS_CSV', os.path.join(PROCESSED_DIR, 'merged_tvt_functional_class.csv')),
+        'keys': ['Date'],
+    },
+    'regional_vmt': {
+        'path': os.getenv('REGIONAL_VMT_CSV', os.path.join(PROCESSED_DIR, 'merged_tvt_regional_vmt.csv')),
+        'keys': ['Date', 'Region'],
+    },
+    'db': {
+        'path': os.path.join(os.getenv('DB_DIR', PROCESSED_DIR), 'merged_db.csv'),
+        'keys': ['Date', 'State'],
+    },
+    # tvt_db.py's narrow economic tables: their full history (merged_db.csv covers only the join window)
+    **{
+        name: {'path': os.path.join(os.getenv('DB_DIR', PROCESSED_DIR), f'{name}.csv'), 'keys': ['Date']}
+        for name in ('econ_cpi', 'econ_unemployment', 'econ_labor_participation', 'econ_gdp')
+    },
+}
+
+
+def load_table(path: str, keys: list) -> pd.DataFrame:
+    """Load a processed CSV as text so the diff sees exactly what downstream loaders see."""
+    df = tvt_frames.read_csv(path, dtype=str, keep_default_na=False)
+    dupes = df.duplicated(subset=keys, keep='last')
+    if dupes.any():
+        print(f'⚠ {os.path.basename(path)}: dropping {int(dupes.sum())} rows with duplicate keys {keys}')
+        df = df[~dupes]
+    return df.reset_index(drop=True)
+
+
+def row_hashes(df: pd.DataFrame) -> np.ndarray:
+    """Return one 64-bit hash per row covering every column."""
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+def partition_hashes(df: pd.DataFrame, hashes: np.ndarray) -> dict:
+    """Combine row hashes into one order-independent digest per partition."""
+    digests = {}
+    keyed = pd.DataFrame({'part': df[PARTITION_COL].to_numpy(), 'hash': hashes})
+    for part, chunk in keyed.groupby('part', sort=True)['hash']:
+        digests[str(part)] = hashlib.sha1(np.sort(chunk.to_numpy()).tobytes()).hexdigest()
+    return digests
+
+
+def changed_partitions(current: dict, previous: dict) -> list:
+    """Partitions that are new or whose digest differs from the previous build."""
+    return sorted(p for p, digest in current.items() if previous.get(p) != digest)
+
+
+def diff_rows(cur: pd.DataFrame, prev: pd.DataFrame, keys: list) -> tuple:
+    """
+    Keyed row-level diff of two frames restricted to the same partitions.
+
+    Returns (delta, removed) where delta holds the inserted/updated rows of `cur`
+    with an `_op` column, and removed counts keys that disappeared from `prev`.
+    """
+    value_cols = [c for c in cur.columns if c not in keys]
+    left = cur[keys].copy()
+    left['_hash'] = pd.util.hash_pandas_object(cur[value_cols], index=False).to_numpy()
+    left['_pos'] = np.arange(len(cur))
+    right = prev[keys].copy()
+    right['_prev_hash'] = pd.util.hash_pandas_object(
+        prev.reindex(columns=value_cols, fill_value=''), index=False
+    ).to_numpy()
+
+    joined = left.merge(right, on=keys, how='outer', indicator=True)
+    inserted = joined.loc[joined['_merge'] == 'left_only', '_pos']
+    updated = joined.loc[
+        (joined['_merge'] == 'both') & (joined['_hash'] != joined['_prev_hash']), '_pos'
+    ]
+    removed = int((joined['_merge'] == 'right_only').sum())
+
+    delta = pd.concat([
+        cur.iloc[inserted.astype(int)].assign(_op='insert'),
+        cur.iloc[updated.astype(int)].assign(_op='update'),
+    ])
+    delta = delta[['_op'] + list(cur.columns)]
+    return delta, removed
+
+
+def build_table_delta(name: str, spec: dict, snapshot: str | None = None) -> dict:
+    """Diff one processed output against its baseline and write its delta CSV."""
+    path, keys = tvt_snapshot.resolve(spec['path'], snapshot), spec['keys']
+    if not os.path.exists(path):
+        print(f'⚠ Skipping {name}: {path} not found')
+        return {'table': name, 'skipped': True}
+
+    with metrics.phase('parse'):
+        cur = load_table(path, keys)
+    metrics.incr('rows_in', len(cur))
+    with metrics.phase('hash'):
+        cur_hashes = partition_hashes(cur, row_hashes(cur))
+
+    baseline_csv = os.path.join(BASELINE_DIR, f'{name}.csv')
+    baseline_json = os.path.join(BASELINE_DIR, f'{name}.hashes.json')
+    if os.path.exists(baseline_csv) and os.path.exists(baseline_json):
+        with open(baseline_json) as f:
+            prev_hashes = json.load(f)
+    else:
+        prev_hashes = {}
+
+    parts = changed_partitions(cur_hashes, prev_hashes)
+    cur_changed = cur[cur[PARTITION_COL].isin(parts)]
+    if prev_hashes and parts:
+        prev = load_table(baseline_csv, keys)
+        prev_changed = prev[prev[PARTITION_COL].isin(parts)]
+    else:
+        prev_changed = cur.iloc[0:0]
+
+    with metrics.phase('consolidate'):
+        delta, removed = diff_rows(cur_changed, prev_changed, keys)
+    dropped_parts = sorted(set(prev_hashes) - set(cur_hashes))
+
+    delta_path = os.path.join(CHANGES_DIR, f'{name}_delta.csv')
+    with metrics.phase('write'):
+        delta.to_csv(delta_path, index=False)
+
+        # The current build becomes the baseline for the next run
+        shutil.copyfile(path, baseline_csv)
+        with open(baseline_json, 'w') as f:
+            json.dump(cur_hashes, f, indent=2)
+    metrics.incr('rows_out', len(delta))
+
+    counts = delta['_op'].value_counts()
+    summary = {
+        'table': name,
+        'source': path,
+        'delta': delta_path,
+        'partitions_total': len(cur_hashes),
+        'partitions_changed': parts,
+        'inserted': int(counts.get('insert', 0)),
+        'updated': int(counts.get('update', 0)),
+        'removed_rows': removed,
+        'removed_partitions': dropped_parts,
+    }
+    print(f"✔ {name}: {len(parts)}/{len(cur_hashes)} partitions changed, "
+          f"{summary['inserted']} inserted, {summary['updated']} updated → {delta_path}")
+    if removed or dropped_parts:
+        print(f'⚠ {name}: {removed} rows and {len(dropped_parts)} partitions no longer present '
+              f'(not part of the upsert feed)')
+    return summary
+
+
+def main() -> None:
+    with metrics.run():
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        snapshot = tvt_snapshot.pin()
+        summaries = [build_table_delta(name, spec, snapshot) for name, spec in TABLES.items()]
+        manifest = {
+            'built_at': datetime.now().isoformat(timespec='seconds'),
+            'snapshot': os.path.basename(snapshot) if snapshot else None,
+            'tables': summaries,
+        }
+        with open(os.path.join(CHANGES_DIR, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        print(f"✅ Change feed written to: {CHANGES_DIR}")
+
+
+if __name__ == '__main__':
+    tvt_profile.run(main)
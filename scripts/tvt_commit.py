@@ -0,0 +1,113 @@
+# Partition commit of the merged outputs.
+# A merge builds its whole output from the published version it started from (its base), but commits only
+# the month partitions its build changed. Under a claim on those months (see tvt_locks.py) and the publish
+# lock, the commit takes the latest published version of the output, replaces just those months with the
+# new rows and publishes. Months another run published after the base was read belong to that run: they
+# are kept and reported, not overwritten. Two runs over different months both land, whatever their order.
+# A commit that changes no month (and no manifest field) publishes nothing and keeps the current snapshot.
+
+import os
+from io import StringIO
+
+import pandas as pd
+
+import tvt_frames
+import tvt_locks
+import tvt_snapshot
+from tvt_dates import key_from_abbr
+from tvt_schema import apply_schema, widen_floats
+
+
+def load_published(path: str) -> pd.DataFrame | None:
+    """The published version of an output (None before its first publish)."""
+    path = tvt_snapshot.resolve(path)
+    if not os.path.exists(path):
+        return None
+    return tvt_frames.read_csv(path)
+
+
+def month_keys(df: pd.DataFrame) -> pd.Series:
+    """Month key of every row of an output (all of them carry Year and the Month abbreviation)."""
+    return key_from_abbr(df['Year'].reset_index(drop=True).astype(int),
+                         df['Month'].reset_index(drop=True).astype(str))
+
+
+def _columns(df: pd.DataFrame) -> list:
+    return [c for c in df.columns if c != 'MonthKey']
+
+
+def _as_written(df: pd.DataFrame) -> pd.DataFrame:
+    """The output as a reader of its CSV sees it (float32 and float64 columns compare alike)."""
+    return pd.read_csv(StringIO(widen_floats(df[_columns(df)]).to_csv(index=False)))
+
+
+def month_text(df: pd.DataFrame | None) -> pd.Series:
+    """Each month's rows as written (sorted, so row order alone is not a change)."""
+    if df is None or df.empty:
+        return pd.Series(dtype=object)
+    df = _as_written(df)
+    lines = df.to_csv(index=False, header=False).splitlines()
+    rows = pd.DataFrame({'MonthKey': month_keys(df), 'line': lines}).sort_values(['MonthKey', 'line'])
+    return rows.groupby('MonthKey')['line'].agg('\n'.join)
+
+
+def changed_months(old: pd.DataFrame | None, new: pd.DataFrame | None) -> set:
+    """Months whose rows differ between two versions of an output (every month if the columns differ)."""
+    a, b = month_text(old), month_text(new)
+    if old is not None and new is not None and _columns(old) != _columns(new):
+        return set(a.index) | set(b.index)
+    keys = a.index.union(b.index)
+    return set(keys[a.reindex(keys).ne(b.reindex(keys)).to_numpy()].tolist())
+
+
+def splice(latest: pd.DataFrame | None, new: pd.DataFrame, months: set, schema: str) -> pd.DataFrame:
+    """`latest` with the rows of `months` taken from `new`, typed by the output's schema."""
+    if latest is None or _columns(latest) != _columns(new):
+        return new
+    if not months:
+        return apply_schema(latest[_columns(latest)], schema)
+    old, new = _as_written(latest), _as_written(new)
+    old_keys, new_keys = month_keys(old), month_keys(new)
+    parts = [old.assign(_key=old_keys)[~old_keys.isin(months)],
+             new.assign(_key=new_keys)[new_keys.isin(months)]]
+    out = pd.concat(parts, ignore_index=True).sort_values('_key', kind='stable')
+    return apply_schema(out.drop(columns='_key').reset_index(drop=True), schema)
+
+
+def _unchanged(path: str, months: set, file_meta: dict | None) -> bool:
+    """Whether committing `months` of an already published output would leave its snapshot entry as it is."""
+    info = tvt_snapshot.file_info(path)
+    if months or not info:
+        return False
+    return all(info.get(k) == v for k, v in (file_meta or {}).items())
+
+
+def commit(tables: dict, job: str, meta: dict | None = None, file_meta: dict | None = None) -> tuple:
+    """
+    Publish the month partitions the run changed.
+
+    `tables` maps output paths to (new output, base, schema): the base is the published version the
+    run started from (None on a first build), the schema its table in tvt_schema.
+    Returns (snapshot id, {path: published output}, {path: months kept from another run}); the
+    snapshot is the current one when nothing changed.
+    """
+    changed = {path: changed_months(base, new) for path, (new, base, _) in tables.items()}
+    with tvt_locks.claim(changed, job), tvt_locks.lock('publish'):
+        published, kept = {}, {}
+        for path, (new, base, schema) in tables.items():
+            latest = load_published(path)
+            moved = changed_months(base, latest) & changed[path] if latest is not None else set()
+            if moved:
+                kept[path] = moved
+                print(f'⚠ {len(moved)} months of {os.path.basename(path)} were published by another run '
+                      f'since this one started; keeping theirs')
+            published[path] = splice(latest, new, changed[path] - moved, schema)
+        if all(_unchanged(path, changed[path] - kept.get(path, set()), (file_meta or {}).get(path))
+               for path in tables):
+            snapshot = os.path.basename(tvt_snapshot.current_snapshot())
+            print(f'✔ No months changed; snapshot {snapshot} stays current')
+        else:
+            snapshot = tvt_snapshot.publish(published, meta=meta, file_meta=file_meta)
+    for path in tables:
+        print(f'  {os.path.basename(path)}: {len(changed[path]) - len(kept.get(path, ()))} months committed')
+    return snapshot, published, kept
@@ -0,0 +1,176 @@
+# Coverage index of the master DB sources: the first and last month each source holds.
+# Every source is written in month order, so its coverage is read off its first and last data lines (the
+# tail is found by seeking from the end) without loading the table. Entries are cached in
+# data/tvt/processed/coverage.json and re-read only when a file's size or mtime changes.
+#
+# tvt_db.py joins its sources only over a window of months taken from the index (TVT_DB_WINDOW):
+#   tvt          months covered by every TVT output (state_miles and tvt_data)      [default]
+#   tvt-any      months covered by any TVT output
+#   all          months covered by any source (the full 1913+ CPI history)
+#   YYYY-MM:YYYY-MM  an explicit range (either end may be left open)
+#
+# Usage:
+#   python tvt_coverage.py [--window tvt]
+
+import os
+import csv
+import json
+import uuid
+import argparse
+
+import tvt_snapshot
+from tvt_dates import month_key, format_iso, ABBR_TO_MONTH
+
+BASE_DIR = os.getenv('AIRFLOW_HOME', '/opt/airflow')
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+PROCESSED_DIR = os.getenv('TVT_PROC_DIR', os.path.join(DATA_DIR, 'tvt', 'processed'))
+INDEX_PATH = os.getenv('TVT_COVERAGE_INDEX', os.path.join(PROCESSED_DIR, 'coverage.json'))
+DEFAULT_WINDOW = os.getenv('TVT_DB_WINDOW', 'tvt')
+
+# Source (keyed like tvt_db.file_paths) -> how its lines carry the month
+#   abbr     Year + Month abbreviation (the TVT outputs)
+#   monthn   Year + Monthn (BLS series)
+#   quarter  Quarter as 'YYYY Qn' (BEA GDP; a quarter covers its three months)
+KINDS = {
+    'state_miles': 'abbr',
+    'tvt_data': 'abbr',
+    'gdp': 'quarter',
+    'lfs': 'monthn',
+    'cpiu': 'monthn',
+    'unemp': 'monthn',
+}
+TVT_SOURCES = ('state_miles', 'tvt_data')
+
+
+def _edge_lines(path: str) -> tuple:
+    """(header, first data line, last data line) of a CSV; the data lines are None if it has no rows."""
+    with open(path, 'rb') as f:
+        header, first = f.readline(), f.readline()
+        if not first.strip():
+            return header, None, None
+        size = f.seek(0, os.SEEK_END)
+        block = 4096
+        while True:
+            f.seek(max(0, size - block))
+            lines = f.read(block).rstrip(b'\r\n').split(b'\n')
+            if len(lines) > 1 or block >= size:
+                break
+            block *= 2
+    return header, first, lines[-1]
+
+
+def _parse(line: bytes) -> list:
+    return next(csv.reader([line.decode('utf-8-sig').strip()]))
+
+
+def _month(row: dict, kind: str, end: bool) -> int:
+    if kind == 'quarter':
+        year, quarter = row['Quarter'].split(' Q')
+        return month_key(int(year), int(quarter) * 3 - (0 if end else 2))
+    year = int(float(row['Year']))
+    if kind == 'monthn':
+        return month_key(year, int(float(row['Monthn'])))
+    return month_key(year, ABBR_TO_MONTH[row['Month'][:3].title()])
+
+
+def read_coverage(path: str, kind: str) -> dict:
+    """{'first', 'last'} month keys of one source (both None when it has no rows)."""
+    header, first, last = _edge_lines(path)
+    if first is None:
+        return {'first': None, 'last': None}
+    columns = _parse(header)
+    return {
+        'first': _month(dict(zip(columns, _parse(first))), kind, end=False),
+        'last': _month(dict(zip(columns, _parse(last))), kind, end=True),
+    }
+
+
+def _signature(path: str) -> list:
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _load_index() -> dict:
+    if not os.path.exists(INDEX_PATH):
+        return {}
+    try:
+        with open(INDEX_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_index(index: dict) -> None:
+    os.makedirs(os.path.dirname(INDEX_PATH), exist_ok=True)
+    tmp = f'{INDEX_PATH}.tmp-{uuid.uuid4().hex[:6]}'
+    with open(tmp, 'w') as f:
+        json.dump(index, f, indent=1)
+    os.replace(tmp, INDEX_PATH)
+
+
+def coverage_index(paths: dict) -> dict:
+    """{source: {'path', 'first', 'last'}} for the sources in `paths` (keyed like tvt_db.file_paths)."""
+    # Entries of files gone since (superseded snapshots) are dropped on the next save
+    cached = {p: e for p, e in _load_index().items() if os.path.exists(p)}
+    index, stale = {}, False
+    for name, path in paths.items():
+        path = os.path.abspath(path)
+        entry = cached.get(path)
+        signature = _signature(path)
+        if entry is None or entry.get('signature') != signature:
+            entry = {'source': name, 'signature': signature, **read_coverage(path, KINDS[name])}
+            cached[path] = entry
+            stale = True
+        index[name] = {'path': path, 'first': entry['first'], 'last': entry['last']}
+    if stale:
+        _save_index(cached)
+    return index
+
+
+def _parse_month(text: str) -> int | None:
+    if not text:
+        return None
+    year, month = text.split('-')
+    return month_key(int(year), int(month))
+
+
+def window(index: dict, mode: str = DEFAULT_WINDOW) -> tuple:
+    """(first, last) month keys to join over; None at an end means unbounded."""
+    if mode in ('tvt', 'tvt-any', 'all'):
+        names = list(index) if mode == 'all' else [n for n in TVT_SOURCES if n in index]
+        spans = [(index[n]['first'], index[n]['last']) for n in names if index[n]['first'] is not None]
+        if not spans:
+            return None, None
+        firsts, lasts = zip(*spans)
+        if mode == 'tvt':
+            return max(firsts), min(lasts)
+        return min(firsts), max(lasts)
+    if ':' not in mode:
+        raise ValueError(f"TVT_DB_WINDOW must be tvt, tvt-any, all or YYYY-MM:YYYY-MM, not {mode!r}")
+    first, last = mode.split(':', 1)
+    return _parse_month(first), _parse_month(last)
+
+
+def describe(first: int | None, last: int | None) -> str:
+    """'YYYY-MM..YYYY-MM' of a month range (open ends shown as '…')."""
+    ends = [format_iso([k])[0][:7] if k is not None else '…' for k in (first, last)]
+    return '..'.join(ends)
+
+
+def main(argv: list | None = None) -> None:
+    parser = argparse.ArgumentParser(description='Print the coverage index of the master DB sources.')
+    parser.add_argument('--window', default=DEFAULT_WINDOW,
+                        help='window to report: tvt, tvt-any, all or YYYY-MM:YYYY-MM (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    import tvt_db
+    snapshot = tvt_snapshot.pin()
+    paths = tvt_db.source_paths(snapshot)
+    index = coverage_index(paths)
+    for name, entry in index.items():
+        print(f"{name:<12} {describe(entry['first'], entry['last']):<18} {entry['path']}")
+    print(f'Window ({args.window}): {describe(*window(index, args.window))}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+# Canonical month representation shared by the pipeline stages.
+# Internally every stage identifies a month by an integer key, year * 12 + month (Jan 2000 → 24001),
+# so month arithmetic is plain integer math and joins are integer joins. Dates are turned into
+# strings only when an output is written.
+
+import numpy as np
+import pandas as pd
+
+MONTH_ABBRS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+               'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+ABBR_TO_MONTH = {abbr: i + 1 for i, abbr in enumerate(MONTH_ABBRS)}
+
+
+def month_key(year, month):
+    """Integer month key for a year and month (1-12); works on scalars, arrays and Series."""
+    return year * 12 + month
+
+
+def key_year(key):
+    """Calendar year of a month key."""
+    return (key - 1) // 12
+
+
+def key_month(key):
+    """Month number (1-12) of a month key."""
+    return (key - 1) % 12 + 1
+
+
+def key_from_abbr(year: pd.Series, month_abbr: pd.Series) -> pd.Series:
+    """Month keys from a Year column and a 'Jan'..'Dec' Month column."""
+    months = month_abbr.astype(str).str[:3].str.title().map(ABBR_TO_MONTH)
+    return month_key(year.astype('int64'), months.astype('int64'))
+
+
+def key_from_quarter(quarter: pd.Series) -> pd.Series:
+    """Month key of the first month of each 'YYYY Qn' label (e.g. '1947 Q2' → April 1947)."""
+    year = quarter.str[:4].astype('int64')
+    qtr = quarter.str[-1].astype('int64')
+    return month_key(year, (qtr - 1) * 3 + 1)
+
+
+def _format(keys, render) -> np.ndarray:
+    """Render each distinct key once and broadcast back (outputs repeat a few hundred months)."""
+    keys = np.asarray(keys, dtype='int64')
+    uniq, inverse = np.unique(keys, return_inverse=True)
+    labels = np.array([render(int(key_year(k)), int(key_month(k))) for k in uniq], dtype=object)
+    return labels[inverse]
+
+
+def format_mdy(keys) -> np.ndarray:
+    """Export format of the TVT CSVs: '04/01/2025'."""
+    return _format(keys, lambda y, m: f'{m:02d}/01/{y}')
+
+
+def format_iso(keys) -> np.ndarray:
+    """Export format of the master DB: '2025-04-01'."""
+    return _format(keys, lambda y, m: f'{y}-{m:02d}-01')
+
+
+def format_abbr(keys) -> np.ndarray:
+    """Month abbreviation column: 'Apr'."""
+    months = key_month(np.asarray(keys, dtype='int64'))
+    return np.array(MONTH_ABBRS, dtype=object)[months - 1]
@@ -1,8 +1,20 @@
 # This script merges various economic and transportation datasets into a single DataFrame.
+# The wide merge (merged_db.csv) covers only the window of months picked from the sources' coverage index
+# (TVT_DB_WINDOW, see tvt_coverage.py): by default the months every TVT output covers. The economic series
+# go back much further (CPI to 1913), so each is also published whole as its own narrow table (econ_*.csv).
 
 import os
 import pandas as pd
 
+import tvt_frames
+import tvt_coverage
+import tvt_snapshot
+import tvt_profile
+from tvt_metrics import RunMetrics
+from tvt_schema import apply_schema, memory_bytes, STATION_COLUMNS
+from tvt_dates import month_key, key_from_abbr, key_year, format_iso, format_abbr
+from tvt_gdp_monthly import monthly_gdp, GDP_COLUMN
+
 BASE_DIR = os.getenv('AIRFLOW_HOME', '/opt/airflow')
 DATA_DIR = os.path.join(BASE_DIR, 'data')
 
@@ -19,80 +31,147 @@ file_paths = {
     'unemp': os.path.join(DATA_DIR, 'bls', 'unemployment', 'unemployment_rate.csv')
 }
 
-# Helper for GDP date parsing
-def parse_gdp_date(s):
-    dt = pd.to_datetime(s, format='%b %y', errors='coerce')
-    if pd.notnull(dt) and dt.year > pd.Timestamp.now().year:
-        dt = dt.replace(year=dt.year - 100)
-    return dt
-
-# Load DataFrames
-dfs = {}
-
-# State-level VMT data
-df_state = pd.read_csv(file_paths['state_miles'], parse_dates=['Date'])
-# Drop Month/Year here; we'll derive later
-df_state = df_state.drop(columns=['Month', 'Year'])
-dfs['state_miles'] = df_state
-
-# TVT national data
-df_tvt = pd.read_csv(file_paths['tvt_data'], parse_dates=['Date'])
-df_tvt = df_tvt.drop(columns=['Month', 'Year'], errors='ignore')
-dfs['tvt_data'] = df_tvt
-
-# GDP
-df_gdp = pd.read_csv(file_paths['gdp'])
-df_gdp['Date'] = df_gdp['Date'].apply(parse_gdp_date)
-df_gdp = df_gdp.drop(columns=['Quarter'], errors='ignore')
-dfs['gdp'] = df_gdp
-
-# Labor force participation
-df_lfs = pd.read_csv(file_paths['lfs'], parse_dates=['Date'], dayfirst=False)
-df_lfs = df_lfs.drop(columns=['Monthn', 'Year'], errors='ignore')
-dfs['lfs'] = df_lfs
-
-# CPI-U
-df_cpiu = pd.read_csv(file_paths['cpiu'], parse_dates=['Date'], dayfirst=False)
-df_cpiu = df_cpiu.drop(columns=['Monthn', 'Year'], errors='ignore')
-dfs['cpiu'] = df_cpiu
-
-# Unemployment rate
-df_unemp = pd.read_csv(file_paths['unemp'], parse_dates=['Date'], dayfirst=False)
-df_unemp = df_unemp.drop(columns=['Monthn', 'Year'], errors='ignore')
-dfs['unemp'] = df_unemp
-
-# Perform full outer merge
-merged = None
-for name, df in dfs.items():
-    if merged is None:
-        merged = df
-    else:
-        # Determine merge keys
-        keys = ['Date']
-        # If both have 'State', merge on State too
-        if 'State' in merged.columns and 'State' in df.columns:
-            keys.append('State')
-        merged = merged.merge(df, on=keys, how='outer')
-
-# Derive Month and Year from Date
-merged['Month'] = merged['Date'].dt.strftime('%b')
-merged['Year'] = merged['Date'].dt.year
-
-# Reorder columns: Date, Month, Year, State, then others
-cols = ['Date', 'Month', 'Year', 'State'] + [c for c in merged.columns if c not in ['Date', 'Month', 'Year', 'State']]
-merged = merged[cols]
-
-# Fill numeric NaNs with 0
-num_cols = merged.select_dtypes(include='number').columns
-merged[num_cols] = merged[num_cols].fillna(0)
-
-# Sort by Date, then State
-merged.sort_values(['Date', 'State'], inplace=True)
-
-# Save to CSV
-OUTPUT_DIR = os.getenv('DB_DIR', os.path.join(DATA_DIR, 'tvt', 'processed'))
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-output_path = os.path.join(OUTPUT_DIR, 'merged_db.csv')
-merged.to_csv(output_path, index=False)
-
-print(f"Database CSV written to: {output_path}")
+# Economic source -> narrow table holding its full history
+ECON_TABLES = {
+    'cpiu': 'econ_cpi.csv',
+    'unemp': 'econ_unemployment.csv',
+    'lfs': 'econ_labor_participation.csv',
+    'gdp': 'econ_gdp.csv',
+}
+
+
+def source_paths(snapshot: str | None) -> dict:
+    """`file_paths` with the TVT outputs resolved in a pinned snapshot."""
+    paths = dict(file_paths)
+    for key in ('state_miles', 'tvt_data'):
+        paths[key] = tvt_snapshot.resolve(paths[key], snapshot)
+    return paths
+
+
+def load_sources(paths: dict) -> dict:
+    """Load every source table keyed like `file_paths`, each carrying an integer MonthKey."""
+    dfs = {}
+
+    # State-level VMT data
+    df_state = tvt_frames.read_csv(paths['state_miles'])
+    df_state['MonthKey'] = key_from_abbr(df_state['Year'], df_state['Month'])
+    # Drop Date/Month/Year here; we'll render them from the key at export
+    df_state = df_state.drop(columns=['Date', 'Month', 'Year'])
+    dfs['state_miles'] = apply_schema(df_state, 'state_miles')
+
+    # TVT national data
+    df_tvt = tvt_frames.read_csv(paths['tvt_data'])
+    df_tvt['MonthKey'] = key_from_abbr(df_tvt['Year'], df_tvt['Month'])
+    df_tvt = df_tvt.drop(columns=['Date', 'Month', 'Year'], errors='ignore')
+    dfs['tvt_data'] = apply_schema(df_tvt, 'tvt_data')
+
+    # GDP: quarterly BEA values resampled to every month (cached; see tvt_gdp_monthly.py)
+    dfs['gdp'] = apply_schema(monthly_gdp(paths['gdp']), 'economic')
+
+    # BLS series already carry numeric Year/Monthn columns
+    for name in ('lfs', 'cpiu', 'unemp'):
+        df = tvt_frames.read_csv(paths[name])
+        df['MonthKey'] = month_key(df['Year'], df['Monthn'])
+        dfs[name] = apply_schema(df.drop(columns=['Date', 'Monthn', 'Year'], errors='ignore'), 'economic')
+    return dfs
+
+def clip_sources(dfs: dict, first: int | None, last: int | None) -> dict:
+    """Every source restricted to the months first..last (None leaves that end open)."""
+    clipped = {}
+    for name, df in dfs.items():
+        keep = pd.Series(True, index=df.index)
+        if first is not None:
+            keep &= df['MonthKey'] >= first
+        if last is not None:
+            keep &= df['MonthKey'] <= last
+        clipped[name] = df[keep].reset_index(drop=True)
+    return clipped
+
+def with_dates(df: pd.DataFrame) -> pd.DataFrame:
+    """Date, Month and Year rendered from the month key, ahead of the other columns (MonthKey dropped)."""
+    df = df.assign(Date=format_iso(df['MonthKey']), Month=format_abbr(df['MonthKey']), Year=key_year(df['MonthKey']))
+    lead = ['Date', 'Month', 'Year'] + (['State'] if 'State' in df.columns else [])
+    return df[lead + [c for c in df.columns if c not in lead + ['MonthKey']]]
+
+def econ_tables(dfs: dict) -> dict:
+    """{source: narrow table} of the economic series over their full history."""
+    return {
+        name: apply_schema(with_dates(dfs[name].sort_values('MonthKey', kind='stable')), 'economic')
+        for name in ECON_TABLES if name in dfs
+    }
+
+def merge_sources(dfs: dict) -> pd.DataFrame:
+    """Outer-merge all sources on MonthKey (and State where both sides have it)."""
+    # Perform full outer merge
+    merged = None
+    for name, df in dfs.items():
+        if merged is None:
+            merged = df
+        else:
+            # Determine merge keys
+            keys = ['MonthKey']
+            # If both have 'State', merge on State too
+            if 'State' in merged.columns and 'State' in df.columns:
+                keys.append('State')
+            merged = merged.merge(df, on=keys, how='outer')
+
+    # Fill numeric NaNs with 0 (station counts and GDP stay missing outside their coverage: unknown is not zero)
+    num_cols = merged.select_dtypes(include='number').columns.drop(['MonthKey', *STATION_COLUMNS, GDP_COLUMN], errors='ignore')
+    merged[num_cols] = merged[num_cols].fillna(0)
+
+    # Sort by month, then State
+    merged.sort_values(['MonthKey', 'State'], inplace=True)
+
+    # Render Date, Month and Year from the month key for export: Date, Month, Year, State, then others
+    return apply_schema(with_dates(merged), 'db')
+
+def main() -> None:
+    metrics = RunMetrics('build_master_db')
+    with metrics.run():
+        # Read the TVT outputs from one pinned snapshot so a concurrent publish can't mix builds
+        snapshot = tvt_snapshot.pin()
+        paths = source_paths(snapshot)
+
+        with metrics.phase('coverage'):
+            coverage = tvt_coverage.coverage_index(paths)
+            first, last = tvt_coverage.window(coverage)
+        span = tvt_coverage.describe(first, last)
+        print(f'▶ Joining over {span} ({tvt_coverage.DEFAULT_WINDOW})')
+
+        with metrics.phase('parse'):
+            dfs = load_sources(paths)
+        metrics.incr('rows_in', sum(len(df) for df in dfs.values()))
+
+        with metrics.phase('consolidate'):
+            merged = merge_sources(clip_sources(dfs, first, last))
+            econ = econ_tables(dfs)
+
+        # Save to CSV
+        OUTPUT_DIR = os.getenv('DB_DIR', os.path.join(DATA_DIR, 'tvt', 'processed'))
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        output_path = os.path.join(OUTPUT_DIR, 'merged_db.csv')
+        tables = {output_path: merged}
+        tables.update({os.path.join(OUTPUT_DIR, ECON_TABLES[name]): df for name, df in econ.items()})
+        # The DB is only as complete as the TVT outputs it was built from
+        quarantined = sorted(
+            name for key in ('state_miles', 'tvt_data')
+            for name in tvt_snapshot.file_info(paths[key], snapshot).get('quarantined', [])
+        )
+        with metrics.phase('write'):
+            published = tvt_snapshot.publish(
+                tables,
+                file_meta={output_path: {'complete': not quarantined, 'quarantined': quarantined, 'window': span}},
+            )
+        metrics.incr('rows_out', len(merged))
+        metrics.set_info(memory_bytes=memory_bytes(merged))
+        metrics.set_info(input_snapshot=snapshot and os.path.basename(snapshot), snapshot=published,
+                         complete=not quarantined, window=span)
+
+        print(f"Database CSV written to: {output_path}")
+        for name, df in econ.items():
+            span = tvt_coverage.describe(coverage[name]['first'], coverage[name]['last'])
+            print(f"  {ECON_TABLES[name]}: {span}, {len(df)} months")
+
+
+if __name__ == '__main__':
+    tvt_profile.run(main)
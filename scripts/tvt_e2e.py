@@ -0,0 +1,176 @@
+# Offline end-to-end run of the monthly_tvt_update chain against the local stand-in (tvt_standin.py).
+# Starts the stand-in, points the scripts at it and at a scratch AIRFLOW_HOME, then runs every task of
+# the DAG in dependency order as the DAG would (same scripts and arguments, one process per task, one
+# mapped extract per report year) and reports the latency of each task. A failed task stops the run
+# and the tasks after it are reported as skipped, like upstream_failed in Airflow.
+# With --warm the tasks go through the warm worker (tvt_worker.py run), started in the scratch home first.
+# The per-task run reports (logs/metrics/) stay in the scratch home for a closer look; each task's output
+# and the summary go to <home>/logs/e2e/<timestamp>/ (<task>.log, summary.json). After a successful run
+# in a temporary home only the data is removed: logs/ and the report it points to are kept.
+#
+# Usage:
+#   python tvt_e2e.py [--home DIR] [--years 2023:2025] [--workers N] [--delay 0.05] [--warm] [--keep]
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import tvt_profile
+from tvt_standin import Fixtures, StandIn, FIXTURE_DIR
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# The chain of dags/monthly_tvt_update.py; None marks the mapped per-year extracts
+TASKS = [
+    ('ingest_sources', ['tvt_ingest.py']),
+    ('extract_tables', None),
+    ('merge_state_miles', ['merge_tvt_page456.py', '--reduce']),
+    ('merge_national_vmt', ['merge_tvt_data.py', '--reduce']),
+    ('merge_tvt_tables', ['merge_tvt_tables.py', '--reduce']),
+    ('anomaly_check', ['tvt_anomaly.py']),
+    ('gap_check', ['tvt_gaps.py']),
+    ('seasonal_adjust', ['tvt_seasonal.py']),
+    ('build_master_db', ['tvt_db.py']),
+    ('nowcast', ['tvt_nowcast.py']),
+    ('build_change_feed', ['tvt_change_feed.py']),
+]
+# Environment variables ending like this are paths and are not passed to the tasks
+PATH_SUFFIXES = ('_DIR', '_CSV', '_CACHE', '_PATH')
+EXTRACT_SCRIPTS = {'extract_tables': 'tvt_extract.py'}
+
+
+def run_script(args: list, env: dict, log_path: str, warm: bool = False) -> tuple:
+    """(seconds, exit code) of one script, its output appended to log_path."""
+    if warm:
+        args = ['tvt_worker.py', 'run', *args]
+    t0 = time.perf_counter()
+    with open(log_path, 'a') as log:
+        log.write(f'$ python {" ".join(args)}\n')
+        log.flush()
+        code = subprocess.call([sys.executable, os.path.join(SCRIPTS_DIR, args[0]), *args[1:]],
+                               cwd=SCRIPTS_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    return time.perf_counter() - t0, code
+
+
+def report_years(env: dict) -> list:
+    """The DAG's list_report_years, evaluated in the scratch environment."""
+    out = subprocess.check_output(
+        [sys.executable, '-c', 'import json, tvt_partials; print(json.dumps(tvt_partials.report_years()))'],
+        cwd=SCRIPTS_DIR, env=env, text=True,
+    )
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def run_chain(env: dict, log_dir: str, workers: int = 1, warm: bool = False) -> list:
+    """Run every task in order; returns one result dict per task (mapped tasks carry their instances)."""
+    results, failed = [], False
+    years = []
+    for task_id, args in TASKS:
+        if failed:
+            results.append({'task': task_id, 'status': 'skipped'})
+            continue
+        log_path = os.path.join(log_dir, f'{task_id}.log')
+        print(f'▶ {task_id}', flush=True)
+        if args is not None:
+            seconds, code = run_script(args, env, log_path, warm)
+            result = {'task': task_id, 'seconds': round(seconds, 3), 'status': 'success' if code == 0 else 'failed'}
+        else:
+            if not years:
+                years = report_years(env)
+            script = EXTRACT_SCRIPTS[task_id]
+            t0 = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                runs = list(pool.map(
+                    lambda y: run_script([script, '--extract-year', str(y)], env,
+                                         os.path.join(log_dir, f'{task_id}_{y}.log'), warm),
+                    years,
+                ))
+            result = {
+                'task': task_id, 'seconds': round(time.perf_counter() - t0, 3),
+                'status': 'success' if all(code == 0 for _, code in runs) else 'failed',
+                'instances': {str(y): round(s, 3) for y, (s, _) in zip(years, runs)},
+            }
+        results.append(result)
+        print(f"  {'✔' if result['status'] == 'success' else '✖'} {result['seconds']:8.2f}s", flush=True)
+        if result['status'] == 'failed':
+            failed = True
+            print(f'✖ {task_id} failed; see {log_path}')
+    return results
+
+
+def main(argv: list | None = None) -> None:
+    parser = argparse.ArgumentParser(description='Run the monthly_tvt_update chain offline and time every task.')
+    parser.add_argument('--home', help='scratch AIRFLOW_HOME (default: a new temporary directory)')
+    parser.add_argument('--years', help='only serve workbooks of report years FIRST[:LAST]')
+    parser.add_argument('--workers', type=int, default=1, help='concurrent mapped extract tasks')
+    parser.add_argument('--delay', type=float, default=0.0, help='stand-in latency per response, in seconds')
+    parser.add_argument('--warm', action='store_true', help='run the tasks through the warm worker (tvt_worker.py)')
+    parser.add_argument('--keep', action='store_true', help="keep the temporary home's data after the run")
+    args = parser.parse_args(argv)
+
+    home = os.path.abspath(args.home or tempfile.mkdtemp(prefix='tvt_e2e_'))
+    if os.path.realpath(os.path.join(home, 'data')) == os.path.realpath(FIXTURE_DIR):
+        parser.error('--home must not be the directory the fixtures are read from')
+    log_dir = os.path.join(home, 'logs', 'e2e', datetime.now().strftime('%Y%m%dT%H%M%S'))
+    os.makedirs(log_dir, exist_ok=True)
+
+    fixtures = Fixtures(years=args.years)
+    standin = StandIn(fixtures, delay=args.delay).start()
+    # Path overrides would point the tasks outside the scratch home; other settings pass through
+    env = {k: v for k, v in os.environ.items() if not k.endswith(PATH_SUFFIXES)}
+    env.update(standin.env(), AIRFLOW_HOME=home)
+    print(f'▶ Stand-in {standin.base_url} ({len(fixtures.workbooks)} workbooks); AIRFLOW_HOME={home}')
+
+    if args.warm:
+        run_script(['tvt_worker.py', 'start'], env, os.path.join(log_dir, 'worker.log'))
+    t0 = time.perf_counter()
+    try:
+        results = run_chain(env, log_dir, args.workers, args.warm)
+    finally:
+        standin.stop()
+        if args.warm:
+            run_script(['tvt_worker.py', 'stop'], env, os.path.join(log_dir, 'worker.log'))
+    total = time.perf_counter() - t0
+
+    print(f"\n{'task':<22}{'status':>9}{'seconds':>10}")
+    for r in results:
+        seconds = f"{r['seconds']:10.2f}" if 'seconds' in r else f"{'-':>10}"
+        print(f"{r['task']:<22}{r['status']:>9}{seconds}")
+        if 'instances' in r:
+            slowest = max(r['instances'].items(), key=lambda item: item[1])
+            print(f"{'':<4}{len(r['instances'])} instances, slowest {slowest[0]} ({slowest[1]:.2f}s)")
+    print(f"{'total':<22}{'':>9}{total:10.2f}")
+
+    ok = all(r['status'] == 'success' for r in results)
+    summary = {
+        'home': home, 'workbooks': len(fixtures.workbooks), 'years': args.years, 'workers': args.workers,
+        'warm': args.warm, 'delay': args.delay, 'total_seconds': round(total, 3), 'status': 'success' if ok else 'failed',
+        'requests': standin.hits, 'tasks': results,
+    }
+    with open(os.path.join(log_dir, 'summary.json'), 'w') as f:
+        json.dump(summary, f, indent=1)
+    print(f"{'✅' if ok else '✖'} End-to-end run {'succeeded' if ok else 'failed'}; logs → {log_dir}")
+
+    if not (args.home or args.keep) and ok:
+        for entry in os.listdir(home):
+            if entry == 'logs':
+                continue
+            path = os.path.join(home, entry)
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        print(f'  (temporary data removed, logs kept in {home}; pass --keep to inspect the data)')
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    tvt_profile.run(main)
@@ -0,0 +1,183 @@
+# Table extractors over one open workbook.
+# Every table taken from a TVT workbook is a registered extractor: a reader of an already-open workbook
+# (pd.ExcelFile) plus the report year and month. A workbook is opened once and every extractor reads its
+# sheets from that open file, so a new table costs only the read of its own sheet.
+# The readers register themselves in the scripts that merge their table:
+#   state_miles       merge_tvt_page456.read_state_miles   (sheets 3-5: rural/urban/all by state)
+#   national_vmt      merge_tvt_data.extract_national       (Trend / Page 2 / Data: national monthly VMT)
+#   functional_class  merge_tvt_tables.read_functional_class (Table 1: monthly VMT by functional system)
+#   regional_vmt      merge_tvt_tables.read_regional_vmt     (Page 1: report-month VMT by region)
+#
+# Shard mode runs every extractor over one report year's workbooks and saves one partial per table
+# (see tvt_partials.py) for the merge scripts' --reduce steps: one mapped DAG task per year for all tables.
+#
+# Usage:
+#   python tvt_extract.py --extract-year 2024 [--tables state_miles,national_vmt]
+#   python tvt_extract.py --list
+
+import os
+import re
+import argparse
+import importlib
+from collections import defaultdict
+
+import pandas as pd
+
+import tvt_profile
+from tvt_dates import month_key
+from tvt_metrics import RunMetrics
+from tvt_partials import write_partial
+from tvt_raw_store import list_workbooks, open_workbook
+
+BASE_DIR = os.getenv('AIRFLOW_HOME', '/opt/airflow')
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+INPUT_DIR = os.getenv('TVT_RAW_DIR', os.path.join(DATA_DIR, 'tvt', 'raw'))
+
+FNAME_RE = re.compile(r'(?P<yy>\d{2})(?P<mon>[a-z]+)tvt\.xlsx$', re.IGNORECASE)
+MONTH_MAP = {
+    'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
+    'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12,
+}
+
+# Scripts whose import registers their tables' extractors
+EXTRACTOR_MODULES = ('merge_tvt_page456', 'merge_tvt_data', 'merge_tvt_tables')
+
+# table -> reader(book, year, month) -> DataFrame
+EXTRACTORS = {}
+
+
+def extractor(table: str):
+    """Register `fn(book, year, month)` as the reader of `table`."""
+    def register(fn):
+        EXTRACTORS[table] = fn
+        return fn
+    return register
+
+
+def load_extractors() -> dict:
+    """Every registered extractor (importing the scripts that define them)."""
+    for name in EXTRACTOR_MODULES:
+        importlib.import_module(name)
+    return EXTRACTORS
+
+
+def open_book(source) -> pd.ExcelFile:
+    """Open a workbook (path or in-memory file) once for all of its readers."""
+    return pd.ExcelFile(source, engine='openpyxl')
+
+
+def extract_workbook(source, year: int, month: int, tables: list) -> dict:
+    """{table: DataFrame, or the exception its reader raised} from one open of the workbook."""
+    if any(t not in EXTRACTORS for t in tables):
+        load_extractors()
+    try:
+        book = open_book(source)
+    except Exception as e:
+        return {table: e for table in tables}
+    results = {}
+    with book:
+        for table in tables:
+            try:
+                results[table] = EXTRACTORS[table](book, year, month)
+            except Exception as e:
+                results[table] = e
+    return results
+
+
+def extract_one(source, year: int, month: int, table: str) -> pd.DataFrame:
+    """One table of one workbook; raises the reader's error."""
+    result = extract_workbook(source, year, month, [table])[table]
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+def report_files(year: int | None = None) -> list:
+    """(report key, year, month, file name) of the workbooks in INPUT_DIR, oldest report first."""
+    reports = []
+    for fn in list_workbooks(INPUT_DIR):
+        m = FNAME_RE.match(fn)
+        mon = MONTH_MAP.get(m.group('mon').lower()) if m else None
+        if mon is None or not 2 <= int(m.group('yy')) <= 25:
+            continue
+        full_year = 2000 + int(m.group('yy'))
+        if year is None or full_year == year:
+            reports.append((month_key(full_year, mon), full_year, mon, fn))
+    return sorted(reports)
+
+
+def extract_reports(reports: list, tables: list, metrics: RunMetrics) -> tuple:
+    """
+    Run the extractors of `tables` over `reports` (from report_files), opening each workbook once.
+
+    Returns ({table: [(report_key, file_name, DataFrame)]}, {table: stats}) with the stats in the
+    shape the merge scripts keep (processed count, read errors by file).
+    """
+    frames = {table: [] for table in tables}
+    stats = {table: {'processed': 0, 'errors': defaultdict(list)} for table in tables}
+    for key, year, month, fn in reports:
+        with metrics.time_file(fn):
+            try:
+                source = open_workbook(INPUT_DIR, fn)
+            except Exception as e:  # e.g. a missing or damaged raw-store blob: a read error of every table
+                results = {table: e for table in tables}
+            else:
+                results = extract_workbook(source, year, month, tables)
+        for table, result in results.items():
+            if isinstance(result, Exception):
+                stats[table]['errors']['read_error'].append((fn, str(result)))
+                continue
+            frames[table].append((key, fn, result))
+            stats[table]['processed'] += 1
+            metrics.incr('rows_in', len(result))
+    return frames, stats
+
+
+def run_extract(year: int, tables: list) -> None:
+    """Shard mode: run every extractor over one report year's workbooks; one partial per table."""
+    metrics = RunMetrics(f'extract_tables_{year}')
+    metrics.set_info(input_dir=INPUT_DIR, report_year=year, tables=tables)
+    with metrics.run():
+        with metrics.phase('list'):
+            reports = report_files(year)
+        print(f'Extracting {", ".join(tables)} from {len(reports)} workbooks of report year {year}...')
+        frames, stats = extract_reports(reports, tables, metrics)
+
+        failed = set()
+        with metrics.phase('write'):
+            for table in tables:
+                path = write_partial(table, year, frames[table], stats[table])
+                print(f"✔ {table}: {stats[table]['processed']} of {len(reports)} workbooks → {path}")
+                for fn, err in stats[table]['errors'].get('read_error', []):
+                    print(f'  ✖ {fn}: {err}')
+                    failed.add(fn)
+        metrics.incr('files_processed', len(reports) - len(failed))
+        metrics.incr('files_failed', len(failed))
+        print(f'✅ Saved {len(tables)} partials for report year {year}')
+
+
+def main(argv: list | None = None) -> None:
+    parser = argparse.ArgumentParser(description='Extract every registered table from TVT workbooks in one pass.')
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument('--extract-year', type=int, metavar='YYYY',
+                      help='extract this report year and save one partial per table')
+    mode.add_argument('--list', action='store_true', help='list the registered tables')
+    parser.add_argument('--tables', help='comma-separated subset of the registered tables')
+    args = parser.parse_args(argv)
+
+    registered = load_extractors()
+    if args.list:
+        for table, fn in registered.items():
+            print(f'{table:<18} {fn.__module__}.{fn.__name__}')
+        return
+    tables = [t.strip() for t in args.tables.split(',')] if args.tables else list(registered)
+    unknown = [t for t in tables if t not in registered]
+    if unknown:
+        parser.error(f'unknown table(s) {unknown}; registered: {", ".join(registered)}')
+    run_extract(args.extract_year, tables)
+
+
+if __name__ == '__main__':
+    # The readers register into the importable module, not into this __main__ copy of it
+    import tvt_extract
+    tvt_profile.run(tvt_extract.main)
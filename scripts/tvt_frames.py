@@ -0,0 +1,103 @@
+# In-process cache of parsed pipeline files (CSV outputs, extract partials).
+# A one-shot script run leaves it disabled and every call simply reads the file. The warm worker
+# (tvt_worker.py) enables it, so a file parsed or written by one step is handed to the next step from
+# memory instead of being parsed again. An entry is only used while the file's inode, size and mtime are
+# unchanged (a rewrite or a new snapshot is always read afresh), callers get their own copy, and the
+# least recently used entries are dropped beyond the configured size.
+
+import os
+import copy
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+_lock = threading.Lock()
+_entries = OrderedDict()  # key -> (signature, value, bytes)
+_limit = 0  # bytes; 0 disables the cache
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+
+def enable(max_mb: float) -> None:
+    """Keep up to `max_mb` MB of parsed files in memory from now on."""
+    global _limit
+    _limit = int(max_mb * 1e6)
+
+
+def stats() -> dict:
+    with _lock:
+        return {**_stats, 'entries': len(_entries), 'mb': round(sum(e[2] for e in _entries.values()) / 1e6, 1),
+                'limit_mb': _limit / 1e6}
+
+
+def _signature(path: str) -> tuple | None:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+def _key(path: str, loader, args: tuple, kwargs: dict) -> tuple:
+    name = f'{getattr(loader, "__module__", "")}.{getattr(loader, "__qualname__", repr(loader))}'
+    return os.path.realpath(path), name, repr(args), repr(sorted(kwargs.items()))
+
+
+def _size(value) -> int:
+    """Approximate bytes held by `value` (DataFrames inside dicts/lists/tuples are counted deeply)."""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, dict):
+        return sum(_size(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(_size(v) for v in value)
+    return 64
+
+
+def _store(key: tuple, signature: tuple, value) -> None:
+    nbytes = _size(value)
+    if nbytes > _limit:
+        return
+    with _lock:
+        _entries[key] = (signature, value, nbytes)
+        _entries.move_to_end(key)
+        total = sum(e[2] for e in _entries.values())
+        while total > _limit:
+            _, (_, _, dropped) = _entries.popitem(last=False)
+            total -= dropped
+            _stats['evictions'] += 1
+
+
+def load(path: str, loader, *args, **kwargs):
+    """loader(path, *args, **kwargs), served from memory while the file is unchanged."""
+    if not _limit:
+        return loader(path, *args, **kwargs)
+    key = _key(path, loader, args, kwargs)
+    signature = _signature(path)
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None and signature is not None and entry[0] == signature:
+            _entries.move_to_end(key)
+            _stats['hits'] += 1
+            return copy.deepcopy(entry[1])
+        _stats['misses'] += 1
+    value = loader(path, *args, **kwargs)
+    if signature is not None and _signature(path) == signature:
+        _store(key, signature, copy.deepcopy(value))
+    return value
+
+
+def remember(path: str, value, loader, *args, **kwargs) -> None:
+    """Record `value` as what loader(path, ...) returns for the file just written to `path`."""
+    if not _limit:
+        return
+    signature = _signature(path)
+    if signature is not None:
+        _store(_key(path, loader, args, kwargs), signature, copy.deepcopy(value))
+
+
+def read_csv(path: str, **kwargs) -> pd.DataFrame:
+    """pd.read_csv through the cache."""
+    return load(path, pd.read_csv, **kwargs)
@@ -0,0 +1,299 @@
+# Gap analysis and imputation of the state-month series.
+# merged_tvt_state_miles.csv only has the rows its workbooks produced: a month whose workbook failed to
+# parse has no rows at all, and early reports carry only some measures (December 2000 has just Rural
+# Arterial Miles). The merge drops rows without any measure, so these holes are invisible in the table.
+#
+# Every state (aggregate rows such as Subtotal dropped, older spellings such as 'Dist Of Columbia' filed
+# under the current name) is put onto one complete month grid in a single vectorized step: a state ×
+# month × column array filled by one fancy-index assignment. Missing cells of each (state, measure) series are grouped
+# into runs:
+#   leading    before the series' first reported month
+#   interior   between two reported months
+#   trailing   after its last reported month, up to the newest month of the table
+# Interior runs of up to TVT_GAP_MAX_RUN months can be imputed (--impute / TVT_GAP_IMPUTE):
+#   ratio      the state's share of national Total VMT in the same calendar month, interpolated
+#              between the nearest years that have it, times national VMT of the missing month
+#   station    interpolation between the reported months on either side, each weighted by its
+#              station count (linear when a side has no count)
+# The Imputed column flags filled cells as a bitmask: one bit per measure (BITS), plus ROW_ADDED on the
+# months a state had no row for.
+#
+# Outputs:
+#   merged_tvt_state_miles_grid.csv   Date, Month, Year, State, <measures>, <stations>, Imputed (snapshot)
+#   data/tvt/processed/gaps/gap_runs.csv   State, Measure, Kind, Start, End, Months, Rows Missing, Imputed
+#
+# Usage:
+#   python tvt_gaps.py [--impute none|ratio|station] [--max-run N] [--top N]
+
+import os
+import uuid
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import tvt_frames
+import tvt_snapshot
+import tvt_profile
+from tvt_metrics import RunMetrics
+from tvt_schema import apply_schema
+from tvt_seasonal import state_rows
+from tvt_dates import key_from_abbr, key_year, key_month, format_mdy, format_abbr, format_iso
+
+BASE_DIR = os.getenv('AIRFLOW_HOME', '/opt/airflow')
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+PROCESSED_DIR = os.getenv('TVT_PROC_DIR', os.path.join(DATA_DIR, 'tvt', 'processed'))
+STATE_MILES_CSV = os.getenv('STATE_MILES_CSV', os.path.join(PROCESSED_DIR, 'merged_tvt_state_miles.csv'))
+NATIONAL_VMT_CSV = os.getenv('NATIONAL_VMT_CSV', os.path.join(PROCESSED_DIR, 'merged_tvt_data.csv'))
+GRID_CSV = os.path.join(PROCESSED_DIR, 'merged_tvt_state_miles_grid.csv')
+GAPS_DIR = os.getenv('TVT_GAPS_DIR', os.path.join(PROCESSED_DIR, 'gaps'))
+# Imputation method: none, ratio or station
+DEFAULT_IMPUTE = os.getenv('TVT_GAP_IMPUTE', 'none')
+# Longest interior run (months) that is imputed
+MAX_RUN = int(os.getenv('TVT_GAP_MAX_RUN', '6'))
+
+# Measure -> its station count column; the order gives each measure's bit in Imputed
+STATIONS = {
+    'Rural Arterial Miles': 'Rural Arterial Stations',
+    'Urban Arterial Miles': 'Urban Arterial Stations',
+    'All Miles': 'All Stations',
+    'Other Miles': 'Other Stations',
+}
+MEASURES = list(STATIONS)
+BITS = {measure: 1 << i for i, measure in enumerate(MEASURES)}
+ROW_ADDED = 1 << len(MEASURES)
+NATIONAL_MEASURE = 'Total VMT (Million)'
+METHODS = ('none', 'ratio', 'station')
+
+
+def load_grid(path: str = STATE_MILES_CSV) -> tuple:
+    """
+    (states, keys, columns, cube, present): the state table on a complete month grid.
+    cube is states × months × columns (NaN where not reported); present marks the state-months
+    the table has a row for. Aggregate rows and state aliases are resolved first (tvt_seasonal.state_rows).
+    """
+    df = state_rows(tvt_frames.read_csv(tvt_snapshot.resolve(path)))
+    columns = [c for c in df.columns if c in STATIONS or c in STATIONS.values()]
+    row_keys = key_from_abbr(df['Year'], df['Month']).to_numpy()
+    states, state_idx = np.unique(df['State'].astype(str).to_numpy(), return_inverse=True)
+    keys = np.arange(row_keys.min(), row_keys.max() + 1)
+
+    cube = np.full((len(states), len(keys), len(columns)), np.nan)
+    cube[state_idx, row_keys - keys[0]] = df[columns].to_numpy(dtype='float64', na_value=np.nan)
+    present = np.zeros((len(states), len(keys)), dtype=bool)
+    present[state_idx, row_keys - keys[0]] = True
+    return list(states), keys, columns, cube, present
+
+
+def load_national(keys: np.ndarray, path: str = NATIONAL_VMT_CSV) -> np.ndarray:
+    """National Total VMT over `keys` (NaN where not reported)."""
+    df = tvt_frames.read_csv(tvt_snapshot.resolve(path), usecols=['Year', 'Month', NATIONAL_MEASURE])
+    series = pd.Series(df[NATIONAL_MEASURE].to_numpy(dtype='float64'),
+                       index=key_from_abbr(df['Year'], df['Month']).to_numpy())
+    series = series[~series.index.duplicated(keep='last')]
+    return series.reindex(keys).to_numpy()
+
+
+def neighbours(values: np.ndarray) -> tuple:
+    """(prev, next): the index of the nearest known value at or before / at or after each position of the last axis (-1 / n if none)."""
+    n = values.shape[-1]
+    idx = np.arange(n)
+    known = ~np.isnan(values)
+    prev = np.maximum.accumulate(np.where(known, idx, -1), axis=-1)
+    nxt = np.minimum.accumulate(np.where(known, idx, n)[..., ::-1], axis=-1)[..., ::-1]
+    return prev, nxt
+
+
+def interpolate(values: np.ndarray, weights: np.ndarray | None = None, extend: bool = False) -> np.ndarray:
+    """
+    Fill the NaNs of `values` along its last axis from the known values on either side, in proportion to
+    their distance and (optionally) `weights` of the known positions. With `extend`, positions with a
+    known value on one side only take that value; otherwise they stay NaN.
+    """
+    n = values.shape[-1]
+    prev, nxt = neighbours(values)
+    p, q = np.clip(prev, 0, n - 1), np.clip(nxt, 0, n - 1)
+    vp, vn = np.take_along_axis(values, p, -1), np.take_along_axis(values, q, -1)
+    t = np.arange(n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        wp = (nxt - t) / (nxt - prev)
+        wn = (t - prev) / (nxt - prev)
+        if weights is not None:
+            sp, sn = np.take_along_axis(weights, p, -1), np.take_along_axis(weights, q, -1)
+            both = (sp > 0) & (sn > 0)
+            wp, wn = wp * np.where(both, sp, 1), wn * np.where(both, sn, 1)
+        filled = (wp * vp + wn * vn) / (wp + wn)
+    filled = np.where(~np.isnan(values), values, filled)
+    if extend:
+        filled = np.where((prev >= 0) & (nxt == n), vp, filled)
+        filled = np.where((prev < 0) & (nxt < n), vn, filled)
+    return filled
+
+
+def gap_runs(series: np.ndarray) -> pd.DataFrame:
+    """
+    Runs of missing cells of every series (rows of `series`) that reports at least once:
+    series index, first and last month index of the run, and its kind.
+    """
+    missing = np.isnan(series)
+    n = series.shape[1]
+    reported = ~missing.all(axis=1)
+    first = np.argmax(~missing, axis=1)
+    last = n - 1 - np.argmax(~missing[:, ::-1], axis=1)
+    edges = np.diff(np.pad(missing, ((0, 0), (1, 1))).astype('int8'), axis=1)
+    rows, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)
+    runs = pd.DataFrame({'series': rows, 'start': starts, 'end': ends - 1})
+    runs = runs[reported[runs['series']]].reset_index(drop=True)
+    kind = np.where(runs['start'].to_numpy() < first[runs['series']], 'leading',
+                    np.where(runs['end'].to_numpy() > last[runs['series']], 'trailing', 'interior'))
+    return runs.assign(kind=kind, months=runs['end'] - runs['start'] + 1)
+
+
+def run_mask(runs: pd.DataFrame, shape: tuple) -> np.ndarray:
+    """Boolean series × months mask of the cells covered by `runs`."""
+    marks = np.zeros((shape[0], shape[1] + 1), dtype='int32')
+    np.add.at(marks, (runs['series'].to_numpy(), runs['start'].to_numpy()), 1)
+    np.add.at(marks, (runs['series'].to_numpy(), runs['end'].to_numpy() + 1), -1)
+    return np.cumsum(marks, axis=1)[:, :-1] > 0
+
+
+def impute_ratio(series: np.ndarray, keys: np.ndarray, national: np.ndarray) -> np.ndarray:
+    """Each series' share of national VMT, interpolated across years per calendar month, times national VMT."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        share = np.where(national > 0, series / national, np.nan)
+    # Lay the month axis out as whole years so each calendar month is a column
+    lead = key_month(keys[0]) - 1
+    trail = 12 - key_month(keys[-1])
+    padded = np.pad(share, ((0, 0), (lead, trail)), constant_values=np.nan)
+    by_month = padded.reshape(len(series), -1, 12).transpose(0, 2, 1)
+    filled = interpolate(by_month, extend=True).transpose(0, 2, 1).reshape(len(series), -1)
+    return filled[:, lead:lead + len(keys)] * national
+
+
+def impute_station(series: np.ndarray, stations: np.ndarray) -> np.ndarray:
+    """Interpolation between the reported months around each gap, weighted by their station counts."""
+    return interpolate(series, weights=stations)
+
+
+def analyse(states: list, keys: np.ndarray, columns: list, cube: np.ndarray, present: np.ndarray,
+            national: np.ndarray | None, method: str, max_run: int) -> tuple:
+    """(filled cube, Imputed bitmask states × months, gap runs report)."""
+    measures = [m for m in MEASURES if m in columns]
+    m_idx = [columns.index(m) for m in measures]
+    # series × months, series ordered state-major then measure
+    series = cube[:, :, m_idx].transpose(0, 2, 1).reshape(-1, len(keys))
+    runs = gap_runs(series)
+
+    filled = series.copy()
+    if method != 'none':
+        target = run_mask(runs[(runs['kind'] == 'interior') & (runs['months'] <= max_run)], series.shape)
+        if method == 'ratio':
+            estimate = impute_ratio(series, keys, national)
+        else:
+            s_idx = [columns.index(STATIONS[m]) if STATIONS[m] in columns else None for m in measures]
+            stations = np.stack([cube[:, :, i] if i is not None else np.full(cube.shape[:2], np.nan)
+                                 for i in s_idx], axis=1).reshape(-1, len(keys))
+            estimate = impute_station(series, stations)
+        fill = target & ~np.isnan(estimate)
+        filled[fill] = np.round(estimate[fill], 2)
+    imputed = ~np.isnan(filled) & np.isnan(series)
+
+    bits = np.array([BITS[m] for m in measures], dtype='int64')
+    mask = (imputed.reshape(len(states), len(measures), len(keys)) * bits[None, :, None]).sum(axis=1)
+    mask = (mask | np.where(present, 0, ROW_ADDED)).astype('uint8')
+
+    out = cube.copy()
+    out[:, :, m_idx] = filled.reshape(len(states), len(measures), len(keys)).transpose(0, 2, 1)
+
+    # Report: one row per run, with the months the state had no row at all and the cells imputed
+    state_of = runs['series'].to_numpy() // len(measures)
+    absent = np.pad(np.cumsum(~present, axis=1), ((0, 0), (1, 0)))
+    done = np.pad(np.cumsum(imputed, axis=1), ((0, 0), (1, 0)))
+    start, end = runs['start'].to_numpy(), runs['end'].to_numpy()
+    report = pd.DataFrame({
+        'State': np.array(states, dtype=object)[state_of],
+        'Measure': np.array(measures, dtype=object)[runs['series'].to_numpy() % len(measures)],
+        'Kind': runs['kind'].to_numpy(),
+        'Start': [d[:7] for d in format_iso(keys[start])],
+        'End': [d[:7] for d in format_iso(keys[end])],
+        'Months': runs['months'].to_numpy(),
+        'Rows Missing': absent[state_of, end + 1] - absent[state_of, start],
+        'Imputed': done[runs['series'].to_numpy(), end + 1] - done[runs['series'].to_numpy(), start],
+    })
+    return out, mask, report
+
+
+def grid_table(states: list, keys: np.ndarray, columns: list, cube: np.ndarray, mask: np.ndarray) -> pd.DataFrame:
+    """The grid as a state table: one row per state and month, in month then state order."""
+    month_idx = np.repeat(np.arange(len(keys)), len(states))
+    state_idx = np.tile(np.arange(len(states)), len(keys))
+    row_keys = keys[month_idx]
+    df = pd.DataFrame({
+        'Date': format_mdy(row_keys),
+        'Month': format_abbr(row_keys),
+        'Year': key_year(row_keys),
+        'State': np.array(states, dtype=object)[state_idx],
+    })
+    values = cube[state_idx, month_idx]
+    for i, col in enumerate(columns):
+        df[col] = values[:, i]
+    df['Imputed'] = mask[state_idx, month_idx]
+    return apply_schema(df, 'state_miles_grid')
+
+
+def write_report(report: pd.DataFrame) -> str:
+    os.makedirs(GAPS_DIR, exist_ok=True)
+    path = os.path.join(GAPS_DIR, 'gap_runs.csv')
+    tmp = f'{path}.tmp-{uuid.uuid4().hex[:6]}'
+    report.to_csv(tmp, index=False)
+    os.replace(tmp, path)
+    return path
+
+
+def main(argv: list | None = None) -> None:
+    parser = argparse.ArgumentParser(description='Report and optionally impute gaps in the state-month series.')
+    parser.add_argument('--impute', choices=METHODS, default=DEFAULT_IMPUTE,
+                        help='imputation of interior gaps (default: %(default)s)')
+    parser.add_argument('--max-run', type=int, default=MAX_RUN,
+                        help='longest interior gap, in months, that is imputed (default: %(default)s)')
+    parser.add_argument('--top', type=int, default=10, help='longest interior gaps to print')
+    args = parser.parse_args(argv)
+
+    metrics = RunMetrics('gap_check')
+    metrics.set_info(impute=args.impute, max_run=args.max_run)
+    with metrics.run():
+        with metrics.phase('parse'):
+            states, keys, columns, cube, present = load_grid()
+            national = load_national(keys) if args.impute == 'ratio' else None
+        metrics.incr('rows_in', int(present.sum()))
+
+        with metrics.phase('consolidate'):
+            filled, mask, report = analyse(states, keys, columns, cube, present, national,
+                                           args.impute, args.max_run)
+            grid = grid_table(states, keys, columns, filled, mask)
+
+        with metrics.phase('write'):
+            report_path = write_report(report)
+            snapshot = tvt_snapshot.publish({GRID_CSV: grid}, meta={'stage': 'gap_check'})
+        metrics.incr('rows_out', len(grid))
+
+        added = int((~present).sum())
+        imputed = int(report['Imputed'].sum())
+        metrics.set_info(snapshot=snapshot, rows_added=added, cells_imputed=imputed,
+                         runs={kind: int(n) for kind, n in report['Kind'].value_counts().items()})
+        counts = report.groupby('Kind')['Months'].agg(['size', 'sum'])
+        print(f'✔ {len(states)} states × {len(keys)} months: {added} state-months had no row')
+        for kind, row in counts.iterrows():
+            print(f"  {kind:<9} {row['size']:>5} runs, {row['sum']:>6} missing cells")
+        interior = report[report['Kind'] == 'interior'].sort_values('Months', ascending=False, kind='stable')
+        for _, row in interior.head(args.top).iterrows():
+            print(f"  ⚠ {row['State']} {row['Measure']}: {row['Start']}..{row['End']} "
+                  f"({row['Months']} months, {row['Rows Missing']} without a row, {row['Imputed']} imputed)")
+        if args.impute != 'none':
+            print(f'✔ Imputed {imputed} cells ({args.impute}; interior gaps up to {args.max_run} months)')
+        print(f'✅ Gap report → {report_path}; grid → {GRID_CSV}')
+
+
+if __name__ == '__main__':
+    tvt_profile.run(main)
@@ -0,0 +1,186 @@
+# Monthly GDP from the quarterly BEA series.
+# BEA publishes GDP per quarter; the master DB is monthly. Instead of placing each quarter on its first
+# month (and leaving the other two empty), the whole history is resampled to months in one vectorized
+# pass, with three methods kept side by side:
+#   step    every month of a quarter carries the quarter's value
+#   linear  straight lines between quarter mid-points (the middle month of each quarter)
+#   cubic   natural cubic spline through the quarter mid-points
+# Quarterly values are annualized rates, so each quarter's middle month reproduces the published value
+# under every method.
+#
+# The result is cached next to the quarterly CSV together with the quarterly inputs it was built from.
+# When a BEA fetch revises or adds quarters, only the months those quarters can influence are
+# recomputed and spliced into the cache; an unchanged fetch is a cache hit.
+#
+# Usage:
+#   python tvt_gdp_monthly.py [--full]      # TVT_GDP_METHOD picks the column used by tvt_db.py
+
+import os
+import json
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import tvt_profile
+from tvt_metrics import RunMetrics
+from tvt_dates import key_from_quarter, format_iso
+
+BASE_DIR = os.getenv('AIRFLOW_HOME', '/opt/airflow')
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+GDP_DIR = os.getenv('GDP_DIR', os.path.join(DATA_DIR, 'bea', 'gdp'))
+QUARTERLY_CSV = os.path.join(GDP_DIR, 'gdp_current_bil.csv')
+# Cache files, written next to the quarterly CSV
+MONTHLY_NAME = 'gdp_monthly.csv'
+INPUTS_NAME = 'gdp_monthly_inputs.json'
+# Method whose values go into the master DB
+METHOD = os.getenv('TVT_GDP_METHOD', 'linear').strip().lower()
+
+GDP_COLUMN = 'GDP in billions of current dollars'
+METHODS = ('step', 'linear', 'cubic')
+# Quarters on each side of a revision that are recomputed. Step and linear values only depend on the
+# neighbouring quarter; a natural spline's response to one knot shrinks by ~0.27 per knot, so after
+# eight quarters it is far below the 0.1 bn precision of the output.
+REACH = 8
+DECIMALS = 1
+
+
+def load_quarterly(path: str = QUARTERLY_CSV) -> pd.Series:
+    """Quarterly GDP indexed by the month key of each quarter's first month."""
+    df = pd.read_csv(path)
+    values = pd.Series(df[GDP_COLUMN].to_numpy(dtype='float64'), index=key_from_quarter(df['Quarter']).to_numpy())
+    return values[~values.index.duplicated(keep='first')].sort_index()
+
+
+def _natural_spline(x: np.ndarray, y: np.ndarray, t: np.ndarray) -> np.ndarray:
+    """Evaluate the natural cubic spline through (x, y) at t (end segments extended beyond the knots)."""
+    n = len(x)
+    if n < 3:
+        return np.interp(t, x, y)
+    h = np.diff(x)
+    # Second derivatives M at the knots: tridiagonal system with M[0] = M[-1] = 0
+    a = np.zeros((n - 2, n - 2))
+    idx = np.arange(n - 2)
+    a[idx, idx] = 2 * (h[:-1] + h[1:])
+    a[idx[1:], idx[:-1]] = h[1:-1]
+    a[idx[:-1], idx[1:]] = h[1:-1]
+    rhs = 6 * (np.diff(y[1:]) / h[1:] - np.diff(y[:-1]) / h[:-1])
+    m = np.zeros(n)
+    m[1:-1] = np.linalg.solve(a, rhs)
+
+    i = np.clip(np.searchsorted(x, t, side='right') - 1, 0, n - 2)
+    hi, left, right = h[i], t - x[i], x[i + 1] - t
+    return (
+        m[i] * right ** 3 / (6 * hi) + m[i + 1] * left ** 3 / (6 * hi)
+        + (y[i] - m[i] * hi ** 2 / 6) * right / hi + (y[i + 1] - m[i + 1] * hi ** 2 / 6) * left / hi
+    )
+
+
+def resample(quarterly: pd.Series) -> pd.DataFrame:
+    """Monthly GDP under every method for the months of the given quarters."""
+    starts = quarterly.index.to_numpy(dtype='int64')
+    values = quarterly.to_numpy(dtype='float64')
+    months = (starts[:, None] + np.arange(3)).ravel()
+    mids = (starts + 1).astype('float64')
+    out = pd.DataFrame({
+        'MonthKey': months,
+        'step': np.repeat(values, 3),
+        'linear': np.interp(months, mids, values),
+        'cubic': _natural_spline(mids, values, months.astype('float64')),
+    })
+    out[list(METHODS)] = out[list(METHODS)].round(DECIMALS)
+    return out
+
+
+def revised_quarters(old: dict, quarterly: pd.Series) -> list:
+    """Quarter keys whose value is new, changed or gone since the cached build."""
+    new = {int(k): float(v) for k, v in quarterly.items()}
+    return sorted(k for k in old.keys() | new.keys() if old.get(k) != new.get(k))
+
+
+def _cache_paths(quarterly_path: str) -> tuple:
+    cache_dir = os.path.dirname(os.path.abspath(quarterly_path))
+    return os.path.join(cache_dir, MONTHLY_NAME), os.path.join(cache_dir, INPUTS_NAME)
+
+
+def _load_cache(quarterly_path: str) -> tuple:
+    monthly_csv, inputs_json = _cache_paths(quarterly_path)
+    if not (os.path.exists(monthly_csv) and os.path.exists(inputs_json)):
+        return None, {}
+    with open(inputs_json) as f:
+        inputs = {int(k): v for k, v in json.load(f).items()}
+    return pd.read_csv(monthly_csv), inputs
+
+
+def _save_cache(quarterly_path: str, monthly: pd.DataFrame, quarterly: pd.Series) -> None:
+    monthly_csv, inputs_json = _cache_paths(quarterly_path)
+    out = monthly.copy()
+    out.insert(1, 'Date', format_iso(out['MonthKey']))
+    out.to_csv(f'{monthly_csv}.tmp', index=False)
+    os.replace(f'{monthly_csv}.tmp', monthly_csv)
+    with open(f'{inputs_json}.tmp', 'w') as f:
+        json.dump({str(k): float(v) for k, v in quarterly.items()}, f)
+    os.replace(f'{inputs_json}.tmp', inputs_json)
+
+
+def update(quarterly_path: str = QUARTERLY_CSV, full: bool = False, metrics: RunMetrics | None = None) -> pd.DataFrame:
+    """
+    Monthly GDP (MonthKey plus one column per method) for the current quarterly CSV.
+
+    Reuses the cache and recomputes only the months around revised quarters; `full` rebuilds everything.
+    """
+    quarterly = load_quarterly(quarterly_path)
+    cached, inputs = (None, {}) if full else _load_cache(quarterly_path)
+    revised = revised_quarters(inputs, quarterly)
+    if cached is not None and not revised:
+        if metrics:
+            metrics.incr('cache_hits')
+        return cached[['MonthKey', *METHODS]]
+
+    keys = quarterly.index.to_numpy(dtype='int64')
+    if cached is None:
+        monthly = resample(quarterly)
+        print(f'▶ Resampled {len(quarterly)} quarters to {len(monthly)} months')
+    else:
+        # Positions of the revised quarters (a removed quarter counts at its old position)
+        pos = np.searchsorted(keys, revised)
+        lo, hi = max(pos.min() - REACH, 0), min(pos.max() + REACH, len(keys) - 1)
+        # Fit on a wider slice so the spline's free ends sit outside the recomputed window
+        fit = quarterly.iloc[max(lo - REACH, 0):hi + REACH + 1]
+        window = resample(fit)
+        first, last = keys[lo], keys[hi] + 2
+        window = window[(window['MonthKey'] >= first) & (window['MonthKey'] <= last)]
+        kept = cached[cached['MonthKey'].isin((keys[:, None] + np.arange(3)).ravel())]
+        kept = kept[(kept['MonthKey'] < first) | (kept['MonthKey'] > last)]
+        monthly = pd.concat([kept[['MonthKey', *METHODS]], window], ignore_index=True)
+        monthly = monthly.sort_values('MonthKey', ignore_index=True)
+        print(f'▶ {len(revised)} quarter(s) revised; recomputed {len(window)} of {len(monthly)} months')
+        if metrics:
+            metrics.incr('months_recomputed', len(window))
+    _save_cache(quarterly_path, monthly, quarterly)
+    return monthly
+
+
+def monthly_gdp(quarterly_path: str = QUARTERLY_CSV, method: str = METHOD,
+                metrics: RunMetrics | None = None) -> pd.DataFrame:
+    """MonthKey plus the GDP column, resampled with `method`, for joining into the master DB."""
+    if method not in METHODS:
+        raise ValueError(f'Unknown GDP resampling method {method!r}; choose from {METHODS}')
+    monthly = update(quarterly_path, metrics=metrics)
+    return monthly[['MonthKey', method]].rename(columns={method: GDP_COLUMN})
+
+
+def main(argv: list | None = None) -> None:
+    parser = argparse.ArgumentParser(description='Resample quarterly GDP to months.')
+    parser.add_argument('--full', action='store_true', help='ignore the cache and rebuild every month')
+    args = parser.parse_args(argv)
+    metrics = RunMetrics('gdp_monthly')
+    with metrics.run():
+        with metrics.phase('consolidate'):
+            monthly = update(full=args.full, metrics=metrics)
+        metrics.incr('rows_out', len(monthly))
+        print(f'✔ Monthly GDP ({", ".join(METHODS)}) → {_cache_paths(QUARTERLY_CSV)[0]}')
+
+
+if __name__ == '__main__':
+    tvt_profile.run(main)
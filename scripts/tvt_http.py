@@ -0,0 +1,435 @@
+# Shared HTTP layer for the BLS and BEA API clients.
+# Every call goes through three pieces, all shared across processes via files under data/http/:
+#   * a response cache keyed by the request (method, URL, parameters, body; API keys excluded) with a
+#     per-API TTL, so repeated runs and backfills are answered from disk instead of the quota
+#   * a persistent token bucket per API (requests per second, burst size and a daily quota), so
+#     concurrent scripts and retries together stay under the published limits
+#   * retries with exponential backoff that honour Retry-After / RateLimit-Reset headers; a server
+#     that asks us to back off blocks the whole API in the shared limiter state, not just this caller
+# When the daily quota is spent, a stale cached response is served (with a warning) if there is one.
+# BLS caps every query at a number of years and series (BLS_YEARS / BLS_SERIES, lower without a
+# registration key) and silently shortens longer ranges, so BLS requests are split into windows within
+# those caps, each going through the limiter and cache, and the answers are joined into one response.
+# A response that still says its range was shortened raises Truncated and is never cached. Windows that
+# end before BLS's revision horizon (BLS_REVISION_YEARS) no longer change and stay cached for the
+# settled TTL, so a daily run only refetches the recent windows of each series.
+#
+# Usage:
+#   python tvt_http.py status        # limiter state and cache size per API
+#   python tvt_http.py clear-cache [<api>]
+
+import os
+import sys
+import json
+import time
+import fcntl
+import random
+import hashlib
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+BASE_DIR = os.getenv('AIRFLOW_HOME', '/opt/airflow')
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+HTTP_DIR = os.getenv('TVT_HTTP_DIR', os.path.join(DATA_DIR, 'http'))
+CACHE_DIR = os.path.join(HTTP_DIR, 'cache')
+LIMITER_DIR = os.path.join(HTTP_DIR, 'ratelimit')
+# Set to 'off' to bypass the response cache (responses are still stored)
+CACHE_MODE = os.getenv('TVT_HTTP_CACHE', 'on').strip().lower()
+RETRIES = int(os.getenv('TVT_HTTP_RETRIES', '4'))
+# First retry delay in seconds; doubles on every further attempt, capped at BACKOFF_MAX
+BACKOFF = float(os.getenv('TVT_HTTP_BACKOFF', '2'))
+BACKOFF_MAX = float(os.getenv('TVT_HTTP_BACKOFF_MAX', '300'))
+TIMEOUT = float(os.getenv('TVT_HTTP_TIMEOUT', '60'))
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# BLS v2 limits per query, keyed by whether the request carries a registration key
+BLS_YEARS = {True: 20, False: 10}
+BLS_SERIES = {True: 50, False: 25}
+BLS_DAILY = {True: 500, False: 25}
+# Years back that BLS still revises (seasonal factors); older windows are settled
+BLS_REVISION_YEARS = 5
+# Request fields that carry credentials; left out of cache keys and cache files
+SECRET_FIELDS = {'registrationKey', 'UserID', 'api_key'}
+
+
+def _env(api: str, name: str, default: str) -> str:
+    return os.getenv(f'TVT_HTTP_{api.upper()}_{name}', default)
+
+
+def _bls_throttled(resp: requests.Response) -> bool:
+    """BLS reports a spent daily threshold as a 200 with status REQUEST_NOT_PROCESSED."""
+    try:
+        data = resp.json()
+    except ValueError:
+        return False
+    return data.get('status') == 'REQUEST_NOT_PROCESSED' and any(
+        'threshold' in str(m).lower() for m in data.get('message', []))
+
+
+def _bls_truncated(resp: requests.Response) -> str | None:
+    """The message of a BLS response whose year range was cut to the system-allowed limit, if any."""
+    try:
+        data = resp.json()
+    except ValueError:
+        return None
+    return next((str(m) for m in data.get('message', []) if 'system-allowed limit' in str(m).lower()), None)
+
+
+def _bls_keyed(body) -> bool:
+    return isinstance(body, dict) and bool(body.get('registrationKey'))
+
+
+def _bls_daily(body) -> int:
+    """Daily query quota of the BLS account a request is sent with (registered or not)."""
+    return BLS_DAILY[_bls_keyed(body)]
+
+
+def _bls_settled(body) -> bool:
+    """Whether a BLS request only covers years BLS no longer revises."""
+    if not isinstance(body, dict) or not body.get('endyear'):
+        return False
+    return int(body['endyear']) < datetime.now(timezone.utc).year - BLS_REVISION_YEARS
+
+
+def _bls_windows(body):
+    """BLS request bodies that each stay within the per-query year and series limits."""
+    if not isinstance(body, dict) or 'startyear' not in body:
+        return [body]
+    keyed = _bls_keyed(body)
+    first, last = int(body['startyear']), int(body.get('endyear') or body['startyear'])
+    series = body.get('seriesid') or []
+    step = BLS_SERIES[keyed]
+    windows = []
+    for i in range(0, max(len(series), 1), step):
+        for start in range(first, last + 1, BLS_YEARS[keyed]):
+            end = min(last, start + BLS_YEARS[keyed] - 1)
+            windows.append({**body, 'seriesid': series[i:i + step], 'startyear': str(start), 'endyear': str(end)})
+    return windows
+
+
+def _bls_join(responses: list) -> requests.Response:
+    """One BLS response holding the data of every window, newest first as BLS sends it."""
+    status, messages, series = 'REQUEST_SUCCEEDED', [], {}
+    for resp in responses:
+        data = resp.json()
+        if data.get('status') != 'REQUEST_SUCCEEDED':
+            status = data.get('status')
+        messages += [m for m in data.get('message', []) if m not in messages]
+        for s in data.get('Results', {}).get('series', []):
+            series.setdefault(s['seriesID'], {**s, 'data': []})['data'].extend(s['data'])
+    for s in series.values():
+        s['data'].sort(key=lambda r: (r['year'], r['period']), reverse=True)
+    joined = requests.Response()
+    joined.status_code = 200
+    joined.url = responses[0].url
+    joined.headers = CaseInsensitiveDict({'Content-Type': 'application/json'})
+    joined._content = json.dumps({'status': status, 'message': messages,
+                                  'Results': {'series': list(series.values())}}).encode()
+    joined.from_cache = all(r.from_cache for r in responses)
+    return joined
+
+
+class Api:
+    """Published limits and cache policy of one API."""
+
+    def __init__(self, name: str, rate: float, burst: int, daily: int, ttl: float, throttled=None,
+                 truncated=None, split=None, join=None, settled=None, settled_ttl: float = 0, daily_for=None):
+        self.name = name
+        self.rate = float(_env(name, 'RATE', str(rate)))      # requests per second, sustained
+        self.burst = int(_env(name, 'BURST', str(burst)))     # bucket size
+        self.daily = int(_env(name, 'DAILY', str(daily)))     # queries per UTC day; 0 = unlimited
+        # Quota of the account a request body is sent with; TVT_HTTP_<API>_DAILY overrides it
+        override = os.getenv(f'TVT_HTTP_{name.upper()}_DAILY')
+        self.daily_for = (lambda body: self.daily) if override or daily_for is None else daily_for
+        self.ttl = float(_env(name, 'CACHE_TTL', str(ttl)))   # seconds a cached response stays fresh
+        self.throttled = throttled or (lambda resp: False)
+        self.truncated = truncated or (lambda resp: None)   # message if the answer covers less than asked
+        self.split = split or (lambda body: [body])          # request body -> bodies within per-query limits
+        self.join = join                                     # responses of the split bodies -> one response
+        self.settled = settled or (lambda body: False)       # whether the answer to a body can no longer change
+        self.settled_ttl = float(_env(name, 'SETTLED_TTL', str(settled_ttl or self.ttl)))
+
+
+APIS = {
+    # BLS v2: 50 queries per 10 s; 500 queries a day with a registration key, 25 without (BLS_DAILY)
+    'bls': Api('bls', rate=5, burst=50, daily=25, ttl=12 * 3600, throttled=_bls_throttled,
+               truncated=_bls_truncated, split=_bls_windows, join=_bls_join,
+               settled=_bls_settled, settled_ttl=30 * 86400, daily_for=_bls_daily),
+    # BEA: 100 requests per minute
+    'bea': Api('bea', rate=100 / 60, burst=100, daily=0, ttl=12 * 3600),
+}
+
+
+class RateLimited(RuntimeError):
+    """The API's daily quota is spent (or it kept throttling us through every retry)."""
+
+
+class Truncated(ValueError):
+    """The API answered a shorter range than was asked for."""
+
+
+@contextmanager
+def _locked(path: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f'{path}.lock', 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+class TokenBucket:
+    """Token bucket whose state lives in a file, shared by every process using the same API."""
+
+    def __init__(self, api: Api, state_dir: str = LIMITER_DIR, daily: int | None = None):
+        self.api = api
+        self.daily = api.daily if daily is None else daily
+        self.path = os.path.join(state_dir, f'{api.name}.json')
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'tokens': self.api.burst, 'updated': time.time(), 'day': None, 'used': 0, 'blocked_until': 0}
+
+    def _save(self, state: dict) -> None:
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, self.path)
+
+    def acquire(self) -> None:
+        """Take one token, sleeping until one is available; raises RateLimited when the day's quota is spent."""
+        while True:
+            with _locked(self.path):
+                state = self._load()
+                now = time.time()
+                state['tokens'] = min(self.api.burst, state['tokens'] + (now - state['updated']) * self.api.rate)
+                state['updated'] = now
+                today = datetime.now(timezone.utc).date().isoformat()
+                if state['day'] != today:
+                    state['day'], state['used'] = today, 0
+                if self.daily and state['used'] >= self.daily:
+                    self._save(state)
+                    raise RateLimited(f'{self.api.name}: daily quota of {self.daily} queries used')
+                wait = max(state.get('blocked_until', 0) - now, (1 - state['tokens']) / self.api.rate)
+                if wait <= 0:
+                    state['tokens'] -= 1
+                    state['used'] += 1
+                    self._save(state)
+                    return
+                self._save(state)
+            time.sleep(wait)
+
+    def block(self, seconds: float) -> None:
+        """Make every caller of this API wait `seconds` (server asked us to back off)."""
+        with _locked(self.path):
+            state = self._load()
+            state['blocked_until'] = max(state.get('blocked_until', 0), time.time() + seconds)
+            self._save(state)
+
+    def exhaust(self) -> None:
+        """The server says today's quota is gone even if our count disagrees."""
+        with _locked(self.path):
+            state = self._load()
+            state['day'] = datetime.now(timezone.utc).date().isoformat()
+            state['used'] = max(state['used'], self.daily)
+            self._save(state)
+
+    def status(self) -> dict:
+        return self._load()
+
+
+def _scrub(value):
+    if isinstance(value, dict):
+        return {k: _scrub(v) for k, v in sorted(value.items()) if k not in SECRET_FIELDS}
+    if isinstance(value, list):
+        return [_scrub(v) for v in value]
+    return value
+
+
+def cache_key(method: str, url: str, params: dict | None = None, json_body=None) -> str:
+    request = {'method': method.upper(), 'url': url, 'params': _scrub(params or {}), 'json': _scrub(json_body)}
+    return hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()
+
+
+class ResponseCache:
+    """Successful responses on disk: <key>.json (metadata) plus <key>.body, per API."""
+
+    def __init__(self, api: str, root: str = CACHE_DIR):
+        self.dir = os.path.join(root, api)
+
+    def _paths(self, key: str) -> tuple:
+        return os.path.join(self.dir, f'{key}.json'), os.path.join(self.dir, f'{key}.body')
+
+    def get(self, key: str, ttl: float | None) -> requests.Response | None:
+        """Cached response, or None if missing or older than `ttl` seconds (None: any age)."""
+        meta_path, body_path = self._paths(key)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            with open(body_path, 'rb') as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        age = time.time() - meta['stored']
+        if ttl is not None and age > ttl:
+            return None
+        resp = requests.Response()
+        resp.status_code = meta['status']
+        resp.url = meta['url']
+        resp.headers = CaseInsensitiveDict(meta['headers'])
+        resp._content = body
+        resp.from_cache = True
+        resp.cache_age = age
+        return resp
+
+    def put(self, key: str, resp: requests.Response, url: str) -> None:
+        """Store a response; `url` is the request URL without its query (which may hold an API key)."""
+        os.makedirs(self.dir, exist_ok=True)
+        meta_path, body_path = self._paths(key)
+        meta = {
+            'stored': time.time(), 'status': resp.status_code, 'url': url,
+            'headers': {k: v for k, v in resp.headers.items() if k.lower() in ('content-type', 'date', 'etag', 'last-modified')},
+        }
+        # Body first: a metadata file always points at a complete body
+        for path, data, mode in ((body_path, resp.content, 'wb'), (meta_path, json.dumps(meta), 'w')):
+            with open(f'{path}.tmp', mode) as f:
+                f.write(data)
+            os.replace(f'{path}.tmp', path)
+
+    def clear(self) -> int:
+        if not os.path.isdir(self.dir):
+            return 0
+        names = [n for n in os.listdir(self.dir) if n.endswith('.json')]
+        for name in os.listdir(self.dir):
+            os.remove(os.path.join(self.dir, name))
+        return len(names)
+
+
+def retry_after(resp: requests.Response) -> float | None:
+    """Seconds the server asked us to wait (Retry-After, RateLimit-Reset, X-RateLimit-Reset), if any."""
+    value = resp.headers.get('Retry-After')
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+            except (TypeError, ValueError):
+                pass
+    for header in ('RateLimit-Reset', 'X-RateLimit-Reset'):
+        value = resp.headers.get(header)
+        if value:
+            try:
+                seconds = float(value)
+            except ValueError:
+                continue
+            # Some APIs send an epoch timestamp rather than a delta
+            return max(0.0, seconds - time.time()) if seconds > 1e9 else seconds
+    return None
+
+
+def request(api: str, method: str, url: str, *, params: dict | None = None, json=None,
+            headers: dict | None = None, timeout: float = TIMEOUT, refresh: bool = False,
+            retries: int = RETRIES) -> requests.Response:
+    """
+    Cached, rate-limited request to one of APIS.
+
+    Returns a requests.Response; `resp.from_cache` tells whether it came from disk. With `refresh`
+    (or TVT_HTTP_CACHE=off) the cache is not read, but the fresh response is still stored. A body
+    beyond the API's per-query limits is sent as several requests whose answers are joined.
+    """
+    spec = APIS[api]
+    bodies = spec.split(json)
+    if len(bodies) > 1:
+        return spec.join([_request(spec, method, url, params, body, headers, timeout, refresh, retries)
+                          for body in bodies])
+    return _request(spec, method, url, params, bodies[0], headers, timeout, refresh, retries)
+
+
+def _request(spec: Api, method: str, url: str, params, body, headers, timeout, refresh, retries) -> requests.Response:
+    """One cached, rate-limited request within the API's per-query limits."""
+    api = spec.name
+    cache = ResponseCache(api)
+    bucket = TokenBucket(spec, daily=spec.daily_for(body))
+    key = cache_key(method, url, params, body)
+    if not refresh and CACHE_MODE != 'off':
+        cached = cache.get(key, spec.settled_ttl if spec.settled(body) else spec.ttl)
+        # Shortened answers stored before they were rejected are refetched
+        if cached is not None and not spec.truncated(cached):
+            return cached
+
+    for attempt in range(retries + 1):
+        try:
+            bucket.acquire()
+        except RateLimited:
+            stale = cache.get(key, None)
+            if stale is None:
+                raise
+            print(f'⚠ {api}: daily quota spent; serving a cached response {stale.cache_age / 3600:.1f} h old')
+            return stale
+
+        error, wait = None, None
+        try:
+            resp = requests.request(method, url, params=params, json=body, headers=headers, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = e
+        else:
+            if spec.throttled(resp):
+                bucket.exhaust()
+                continue  # the next acquire() raises (or serves stale)
+            if resp.status_code not in RETRY_STATUS:
+                resp.raise_for_status()
+                message = spec.truncated(resp)
+                if message:
+                    raise Truncated(f'{api}: {message} (asked for {body.get("startyear")}-{body.get("endyear")})'
+                                    if isinstance(body, dict) else f'{api}: {message}')
+                cache.put(key, resp, url)
+                resp.from_cache = False
+                return resp
+            error, wait = f'HTTP {resp.status_code}', retry_after(resp)
+            if wait is not None:
+                bucket.block(wait)
+
+        if attempt == retries:
+            if isinstance(error, Exception):
+                raise error
+            if resp.status_code == 429:
+                raise RateLimited(f'{api}: still throttled after {retries} retries')
+            resp.raise_for_status()
+        delay = min(BACKOFF_MAX, wait if wait is not None else BACKOFF * 2 ** attempt)
+        delay += random.uniform(0, 0.1 * delay)
+        print(f'⚠ {api}: {method} {url} failed ({error}); retry {attempt + 1}/{retries} in {delay:.1f}s')
+        time.sleep(delay)
+    raise RateLimited(f'{api}: quota spent while retrying')
+
+
+def main() -> None:
+    cmd = sys.argv[1] if len(sys.argv) > 1 else 'status'
+    if cmd == 'status':
+        for name, spec in APIS.items():
+            state = TokenBucket(spec).status()
+            cache_dir = ResponseCache(name).dir
+            cached = len([n for n in os.listdir(cache_dir) if n.endswith('.json')]) if os.path.isdir(cache_dir) else 0
+            # Without and with a registration key, where the quota depends on it
+            limits = sorted({spec.daily_for(None), spec.daily_for({'registrationKey': '-'})})
+            quota = f"{state['used']}/{' or '.join(map(str, limits))}" if spec.daily else f"{state['used']}/unlimited"
+            print(f"{name}: {quota} queries on {state['day'] or 'n/a'}, {state['tokens']:.1f}/{spec.burst} tokens, "
+                  f"{cached} cached responses (ttl {spec.ttl / 3600:g} h)")
+    elif cmd == 'clear-cache':
+        for name in sys.argv[2:] or list(APIS):
+            print(f'✔ {name}: removed {ResponseCache(name).clear()} cached responses')
+    else:
+        print('usage: tvt_http.py [status|clear-cache [<api> ...]]')
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    main()
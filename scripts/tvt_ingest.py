@@ -0,0 +1,191 @@
+# Single-process ingest of every external source: the FHWA TVT workbooks and the BEA/BLS series.
+# All sources run concurrently on one asyncio event loop, so a full ingest takes about as long as the
+# slowest source rather than the sum of five scripts. Requests to the same host share a concurrency
+# limit, every request has a timeout, and connection errors, timeouts, 429s and 5xx responses are
+# retried with exponential backoff. Each source's raw payload is written as soon as it lands; the
+# per-source transform then runs on the same worker-thread pool the HTTP calls use.
+#
+# The HTTP calls go through the scripts' own request specs and `requests` (run in worker threads); BLS
+# and BEA requests use the shared tvt_http client (response cache, rate limits, backoff). The base URLs
+# come from TVT_BASE_PAGE / BEA_API_URL / BLS_API_URL, so the runner can be pointed at local stub servers.
+#
+# Usage:
+#   python tvt_ingest.py                    # all sources
+#   python tvt_ingest.py --only gdp,cpi     # a subset
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+
+import tvt_http
+import tvt_profile
+import data_prep
+import GDP_All_Year
+import CPI_1913_present
+import Labor_Participation_Rate_1948_present
+import Unemployment_Rate_1948_present
+from tvt_metrics import RunMetrics
+
+# Concurrent requests per host (the FHWA workbook downloads are the only fan-out)
+HOST_LIMIT = int(os.getenv('TVT_INGEST_HOST_LIMIT', '4'))
+# Seconds before one request is abandoned (and retried)
+TIMEOUT = float(os.getenv('TVT_INGEST_TIMEOUT', '60'))
+RETRIES = int(os.getenv('TVT_INGEST_RETRIES', '3'))
+# First retry delay in seconds; doubles on every further attempt
+BACKOFF = float(os.getenv('TVT_INGEST_BACKOFF', '2'))
+# Worker threads for blocking HTTP calls and transforms
+THREADS = int(os.getenv('TVT_INGEST_THREADS', '16'))
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# Series sources: each module exposes request(), save_raw(data) and process(data)
+API_SOURCES = {
+    'gdp': GDP_All_Year,
+    'cpi': CPI_1913_present,
+    'labor_participation': Labor_Participation_Rate_1948_present,
+    'unemployment': Unemployment_Rate_1948_present,
+}
+SOURCES = ['fhwa'] + list(API_SOURCES)
+
+metrics = RunMetrics('ingest_sources')
+
+
+class RetryableStatus(Exception):
+    def __init__(self, resp: requests.Response):
+        super().__init__(f'HTTP {resp.status_code} from {resp.url}')
+        self.resp = resp
+
+
+class Client:
+    """Async front for `requests` with per-host limits, timeouts and retries."""
+
+    def __init__(self, host_limit: int = HOST_LIMIT, timeout: float = TIMEOUT,
+                 retries: int = RETRIES, backoff: float = BACKOFF):
+        self.host_limit = host_limit
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._limits = {}
+
+    def _limit(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        if host not in self._limits:
+            self._limits[host] = asyncio.Semaphore(self.host_limit)
+        return self._limits[host]
+
+    async def fetch(self, method: str, url: str, api: str | None = None, **kwargs) -> requests.Response:
+        """One HTTP request, retried on transient failures; raises on anything else."""
+        if api is not None:
+            # BLS/BEA calls go through the shared client: its cache, rate limiter and backoff
+            async with self._limit(url):
+                resp = await asyncio.to_thread(tvt_http.request, api, method, url, timeout=self.timeout, **kwargs)
+            metrics.incr('cache_hits' if resp.from_cache else 'bytes_fetched', 1 if resp.from_cache else len(resp.content))
+            return resp
+        for attempt in range(self.retries + 1):
+            try:
+                async with self._limit(url):
+                    # The socket timeout covers connect/read; wait_for bounds the whole call
+                    resp = await asyncio.wait_for(
+                        asyncio.to_thread(requests.request, method, url, timeout=self.timeout, **kwargs),
+                        self.timeout * 2,
+                    )
+                if resp.status_code in RETRY_STATUS:
+                    raise RetryableStatus(resp)
+                resp.raise_for_status()
+                metrics.incr('bytes_fetched', len(resp.content))
+                return resp
+            except (requests.ConnectionError, requests.Timeout, asyncio.TimeoutError, RetryableStatus) as e:
+                if attempt == self.retries:
+                    if isinstance(e, RetryableStatus):
+                        e.resp.raise_for_status()
+                    raise
+                delay = self.backoff * 2 ** attempt
+                metrics.incr('retries')
+                print(f'⚠ {method} {url} failed ({e or type(e).__name__}); retry {attempt + 1}/{self.retries} in {delay:g}s')
+                await asyncio.sleep(delay)
+
+
+async def ingest_api(name: str, module, client: Client) -> None:
+    """Fetch one BEA/BLS series, write its raw payload, then build its table."""
+    resp = await client.fetch(**module.request())
+    data = resp.json()
+    await asyncio.to_thread(module.save_raw, data)
+    print(f'✔ {name}: raw payload written to {module.RAW_PATH}')
+    await asyncio.to_thread(module.process, data)
+
+
+async def ingest_fhwa(client: Client) -> None:
+    """Download every new TVT workbook concurrently, then rename/convert them."""
+    data_prep.ensure_dir(data_prep.DOWNLOAD_DIR)
+    resp = await client.fetch('GET', data_prep.BASE_PAGE)
+    links = data_prep.workbook_links(resp.text)
+    todo = [(fn, url) for fn, url in links if not data_prep.have_workbook(fn)]
+    metrics.incr('cache_hits', len(links) - len(todo))
+    print(f'▶ fhwa: {len(links)} workbooks linked, {len(todo)} to download')
+
+    async def download(filename: str, url: str) -> None:
+        try:
+            r = await client.fetch('GET', url)
+        except Exception as e:
+            metrics.incr('files_failed')
+            print(f'✖ Failed to download {filename}: {e}')
+            return
+        await asyncio.to_thread(data_prep.save_workbook, filename, r.content)
+        metrics.incr('files_downloaded')
+
+    await asyncio.gather(*(download(fn, url) for fn, url in todo))
+    await asyncio.to_thread(data_prep.prepare)
+
+
+async def run_sources(names: list, client: Client | None = None) -> dict:
+    """Run the named sources concurrently; returns {source: None or the exception it failed with}."""
+    client = client or Client()
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=THREADS))
+
+    async def timed(name: str):
+        t0 = time.perf_counter()
+        try:
+            if name == 'fhwa':
+                await ingest_fhwa(client)
+            else:
+                await ingest_api(name, API_SOURCES[name], client)
+            return None
+        except Exception as e:
+            print(f'✖ {name} failed: {e}')
+            return e
+        finally:
+            metrics.files[name] = time.perf_counter() - t0
+
+    results = await asyncio.gather(*(timed(name) for name in names))
+    return dict(zip(names, results))
+
+
+def main(argv: list | None = None) -> None:
+    parser = argparse.ArgumentParser(description='Fetch every external source concurrently.')
+    parser.add_argument('--only', help=f'comma-separated subset of {",".join(SOURCES)}')
+    args = parser.parse_args(argv)
+    names = [n.strip() for n in args.only.split(',')] if args.only else SOURCES
+    unknown = [n for n in names if n not in SOURCES]
+    if unknown:
+        parser.error(f'unknown source(s) {unknown}; choose from {SOURCES}')
+
+    metrics.set_info(sources=names, host_limit=HOST_LIMIT, timeout=TIMEOUT, retries=RETRIES)
+    with metrics.run():
+        with metrics.phase('ingest'):
+            results = asyncio.run(run_sources(names))
+        failed = [name for name, err in results.items() if err is not None]
+        metrics.incr('sources_failed', len(failed))
+        for name in names:
+            print(f"{'✖' if results[name] else '✔'} {name:<20} {metrics.files[name]:7.2f}s")
+        if failed:
+            sys.exit(f"Ingest failed for: {', '.join(failed)}")
+
+
+if __name__ == '__main__':
+    tvt_profile.run(main)
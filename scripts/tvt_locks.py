@@ -0,0 +1,197 @@
+# Locks that let pipeline runs overlap (a manual re-run or backfill next to the scheduled monthly_tvt_update
+# on the CeleryExecutor) without one run's publish overwriting the other's.
+#   lock(name)    an exclusive fcntl lock on data/tvt/processed/locks/<name>.lock, e.g. 'publish' around the
+#                 read-current → swap-pointer section of tvt_snapshot.publish. Re-entrant within a process.
+#   claim(...)    the lock table (locks/claims.json): the month partitions of each output a run is about to
+#                 rewrite. A claim waits while another live run holds any of the same months, so runs over
+#                 different months (or different outputs) go ahead in parallel.
+# A claim left by a run that died is dropped once its process is gone (same host) or it is older than
+# TVT_LOCK_STALE seconds (other hosts). See tvt_commit.py for the commit protocol built on these.
+#
+# Usage:
+#   python tvt_locks.py [status]
+
+import os
+import sys
+import json
+import time
+import uuid
+import fcntl
+import socket
+from contextlib import contextmanager
+from datetime import datetime
+
+from tvt_dates import format_iso
+
+BASE_DIR = os.getenv('AIRFLOW_HOME', '/opt/airflow')
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+PROCESSED_DIR = os.getenv('TVT_PROC_DIR', os.path.join(DATA_DIR, 'tvt', 'processed'))
+LOCK_DIR = os.getenv('TVT_LOCK_DIR', os.path.join(PROCESSED_DIR, 'locks'))
+CLAIMS_PATH = os.path.join(LOCK_DIR, 'claims.json')
+# Seconds to wait for a lock or claim before giving up
+LOCK_TIMEOUT = float(os.getenv('TVT_LOCK_TIMEOUT', '3600'))
+# Age after which a claim from another host is considered abandoned
+STALE_AFTER = float(os.getenv('TVT_LOCK_STALE', str(6 * 3600)))
+POLL_SECONDS = 0.2
+HOST = socket.gethostname()
+
+# name -> [open lock file, depth] of the locks this process holds
+_held = {}
+
+
+class LockTimeout(TimeoutError):
+    """A lock or claim was not granted within TVT_LOCK_TIMEOUT."""
+
+
+def _owner() -> dict:
+    return {'host': HOST, 'pid': os.getpid(), 'since': time.time()}
+
+
+@contextmanager
+def lock(name: str, timeout: float = LOCK_TIMEOUT):
+    """Hold the exclusive lock `name` (waiting up to `timeout` seconds for another process to release it)."""
+    if name in _held:
+        _held[name][1] += 1
+        try:
+            yield
+        finally:
+            _held[name][1] -= 1
+        return
+
+    os.makedirs(LOCK_DIR, exist_ok=True)
+    f = open(os.path.join(LOCK_DIR, f'{name}.lock'), 'a+')
+    deadline, waited = time.monotonic() + timeout, False
+    while True:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            break
+        except BlockingIOError:
+            if time.monotonic() > deadline:
+                f.close()
+                raise LockTimeout(f'Lock {name!r} still held after {timeout:.0f}s')
+            if not waited:
+                print(f'▶ Waiting for lock {name!r} held by another run...')
+                waited = True
+            time.sleep(POLL_SECONDS)
+    # Who holds it, for `status`
+    f.seek(0)
+    f.truncate()
+    f.write(json.dumps(_owner()))
+    f.flush()
+    _held[name] = [f, 1]
+    try:
+        yield
+    finally:
+        _held[name][1] -= 1
+        if _held[name][1] == 0:
+            del _held[name]
+            f.seek(0)
+            f.truncate()
+            fcntl.flock(f, fcntl.LOCK_UN)
+            f.close()
+
+
+def _alive(entry: dict) -> bool:
+    """Whether the run that made a claim may still be running."""
+    if time.time() - entry['since'] > STALE_AFTER:
+        return False
+    if entry['host'] != HOST:
+        return True
+    try:
+        os.kill(entry['pid'], 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _read_claims() -> dict:
+    if not os.path.exists(CLAIMS_PATH):
+        return {}
+    with open(CLAIMS_PATH) as f:
+        return {claim_id: entry for claim_id, entry in json.load(f).items() if _alive(entry)}
+
+
+def _write_claims(claims: dict) -> None:
+    tmp = f'{CLAIMS_PATH}.tmp-{uuid.uuid4().hex[:6]}'
+    with open(tmp, 'w') as f:
+        json.dump(claims, f, indent=1)
+    os.replace(tmp, CLAIMS_PATH)
+
+
+def _describe(months) -> str:
+    first, last = format_iso([min(months), max(months)])
+    return f'{len(months)} months {first[:7]}..{last[:7]}'
+
+
+def conflicts(claims: dict, tables: dict) -> list:
+    """(job, output, months) of the claims by other processes that overlap `tables` ({output: months})."""
+    found = []
+    for entry in claims.values():
+        if entry['host'] == HOST and entry['pid'] == os.getpid():
+            continue
+        for name, months in tables.items():
+            overlap = set(months) & set(entry['tables'].get(name, ()))
+            if overlap:
+                found.append((entry['job'], name, overlap))
+    return found
+
+
+@contextmanager
+def claim(tables: dict, job: str, timeout: float = LOCK_TIMEOUT):
+    """
+    Claim month partitions of outputs for the rest of the block.
+
+    `tables` maps output paths to the month keys the run will rewrite. Waits while another live run
+    holds any of them; this process's own claims never block it, so claims nest.
+    """
+    tables = {os.path.basename(p): sorted({int(m) for m in months}) for p, months in tables.items() if len(months)}
+    if not tables:
+        yield
+        return
+    claim_id = uuid.uuid4().hex
+    deadline, waited = time.monotonic() + timeout, set()
+    while True:
+        with lock('claims'):
+            claims = _read_claims()
+            busy = conflicts(claims, tables)
+            if not busy:
+                claims[claim_id] = {'job': job, 'tables': tables, **_owner()}
+                _write_claims(claims)
+                break
+        if time.monotonic() > deadline:
+            raise LockTimeout(f'{job}: partitions still claimed after {timeout:.0f}s by '
+                              + ', '.join(sorted({other for other, _, _ in busy})))
+        for other, name, months in busy:
+            if (other, name) not in waited:
+                print(f'▶ Waiting for {other} to release {_describe(months)} of {name}...')
+                waited.add((other, name))
+        time.sleep(POLL_SECONDS)
+    try:
+        yield
+    finally:
+        with lock('claims'):
+            claims = _read_claims()
+            claims.pop(claim_id, None)
+            _write_claims(claims)
+
+
+def main() -> None:
+    cmd = sys.argv[1] if len(sys.argv) > 1 else 'status'
+    if cmd != 'status':
+        print('usage: tvt_locks.py [status]')
+        sys.exit(2)
+    with lock('claims'):
+        claims = _read_claims()
+    if not claims:
+        print('No partitions claimed')
+    for entry in sorted(claims.values(), key=lambda e: e['since']):
+        since = datetime.fromtimestamp(entry['since']).isoformat(timespec='seconds')
+        print(f"{entry['job']}  pid {entry['pid']}@{entry['host']}  since {since}")
+        for name, months in entry['tables'].items():
+            print(f'  {name}: {_describe(months)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+# Lightweight run instrumentation shared by the pipeline scripts.
+# Each script creates one RunMetrics, wraps its phases (list, parse, consolidate, write, ...) in
+# `metrics.phase(...)`, times individual workbooks with `metrics.time_file(...)` and bumps counters
+# (rows in/out, cache hits, bytes fetched). At exit it writes a JSON run report and a Prometheus
+# textfile-collector file so phase and workbook costs can be tracked across runs.
+
+import os
+import json
+import time
+import socket
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+
+BASE_DIR = os.getenv('AIRFLOW_HOME', '/opt/airflow')
+METRICS_DIR = os.getenv('TVT_METRICS_DIR', os.path.join(BASE_DIR, 'logs', 'metrics'))
+# Point this at node_exporter's --collector.textfile.directory to scrape the .prom files
+PROM_TEXTFILE_DIR = os.getenv('TVT_PROM_TEXTFILE_DIR', METRICS_DIR)
+# Keep this many run reports per job
+KEEP_REPORTS = int(os.getenv('TVT_METRICS_KEEP', '50'))
+
+
+def _escape(value: str) -> str:
+    """Escape a Prometheus label value."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _atomic_write(path: str, text: str) -> None:
+    """Write via a temp file + rename so collectors never read a partial file."""
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+class RunMetrics:
+    """Per-run timers and counters for one pipeline job (one script invocation)."""
+
+    def __init__(self, job: str):
+        self.job = job
+        self.started = time.time()
+        self._t0 = time.perf_counter()
+        self.phases = defaultdict(float)
+        self.files = {}
+        self.counters = defaultdict(float)
+        self.info = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time a phase; repeated entries accumulate (e.g. parse inside the file loop)."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] += time.perf_counter() - t0
+
+    @contextmanager
+    def time_file(self, fname: str, phase: str = 'parse'):
+        """Time the handling of one input file and charge it to `phase`."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - t0
+            self.files[fname] = self.files.get(fname, 0.0) + elapsed
+            self.phases[phase] += elapsed
+
+    def incr(self, counter: str, n: float = 1) -> None:
+        """Increase a counter such as rows_in, rows_out, cache_hits or bytes_fetched."""
+        self.counters[counter] += n
+
+    def set_info(self, **kwargs) -> None:
+        """Attach free-form context (input dir, snapshot id, ...) to the JSON report."""
+        self.info.update(kwargs)
+
+    def report(self, status: str) -> dict:
+        """Build the JSON run report."""
+        slowest = sorted(self.files.items(), key=lambda kv: kv[1], reverse=True)
+        return {
+            'job': self.job,
+            'status': status,
+            'host': socket.gethostname(),
+            'started': datetime.fromtimestamp(self.started).isoformat(timespec='seconds'),
+            'duration_seconds': round(time.perf_counter() - self._t0, 4),
+            'phases': {k: round(v, 4) for k, v in self.phases.items()},
+            'counters': dict(self.counters),
+            'files': {k: round(v, 4) for k, v in slowest},
+            'info': self.info,
+        }
+
+    def prometheus(self, report: dict) -> str:
+        """Render the report in the Prometheus text exposition format."""
+        job = _escape(self.job)
+        lines = [
+            '# HELP tvt_run_duration_seconds Wall time of the last run.',
+            '# TYPE tvt_run_duration_seconds gauge',
+            f'tvt_run_duration_seconds{{job="{job}"}} {report["duration_seconds"]}',
+            '# HELP tvt_run_success Whether the last run succeeded.',
+            '# TYPE tvt_run_success gauge',
+            f'tvt_run_success{{job="{job}"}} {int(report["status"] == "success")}',
+            '# HELP tvt_run_timestamp_seconds Start time of the last run.',
+            '# TYPE tvt_run_timestamp_seconds gauge',
+            f'tvt_run_timestamp_seconds{{job="{job}"}} {int(self.started)}',
+            '# HELP tvt_phase_duration_seconds Wall time per pipeline phase in the last run.',
+            '# TYPE tvt_phase_duration_seconds gauge',
+        ]
+        lines += [
+            f'tvt_phase_duration_seconds{{job="{job}",phase="{_escape(p)}"}} {v}'
+            for p, v in report['phases'].items()
+        ]
+        lines += [
+            '# HELP tvt_file_duration_seconds Wall time spent on each input file in the last run.',
+            '# TYPE tvt_file_duration_seconds gauge',
+        ]
+        lines += [
+            f'tvt_file_duration_seconds{{job="{job}",file="{_escape(f)}"}} {v}'
+            for f, v in report['files'].items()
+        ]
+        for name, value in sorted(report['counters'].items()):
+            metric = f'tvt_{name}'
+            lines += [f'# TYPE {metric} gauge', f'{metric}{{job="{job}"}} {value:g}']
+        return '\n'.join(lines) + '\n'
+
+    def write(self, status: str = 'success') -> str:
+        """Write the JSON report and the .prom file; returns the JSON report path."""
+        report = self.report(status)
+        job_dir = os.path.join(METRICS_DIR, self.job)
+        os.makedirs(job_dir, exist_ok=True)
+        os.makedirs(PROM_TEXTFILE_DIR, exist_ok=True)
+
+        stamp = datetime.fromtimestamp(self.started).strftime('%Y%m%dT%H%M%S')
+        json_path = os.path.join(job_dir, f'{stamp}.json')
+        _atomic_write(json_path, json.dumps(report, indent=2))
+        _atomic_write(os.path.join(PROM_TEXTFILE_DIR, f'tvt_{self.job}.prom'), self.prometheus(report))
+
+        reports = sorted(f for f in os.listdir(job_dir) if f.endswith('.json'))
+        for old in reports[:-KEEP_REPORTS]:
+            os.remove(os.path.join(job_dir, old))
+
+        top = ', '.join(f'{k}={v:.2f}s' for k, v in report['phases'].items())
+        print(f'▶ Run metrics ({self.job}): {report["duration_seconds"]:.2f}s total; {top} → {json_path}')
+        return json_path
+
+    @contextmanager
+    def run(self):
+        """Wrap a script's main body: writes the report on success and on failure."""
+        try:
+            yield self
+        except BaseException:
+            self.write('failed')
+            raise
+        self.write('success')
@@ -0,0 +1,330 @@
+# Next-month nowcast of every state series and national VMT.
+# Each series of the series × month matrix (see tvt_seasonal.load_matrix) gets a seasonal autoregression
+# of its year-over-year log change z[t] = log v[t] - log v[t-12]:
+#   z[t] = c + a1·z[t-1] + a12·z[t-12] + b·x[t-1] + e
+# where x are the optional regressors from tvt_db.py's narrow economic tables (TVT_NOWCAST_REGRESSORS): the
+# YoY log change of CPI and the YoY change of the unemployment rate, lagged a month so the nowcast only uses
+# what is known.
+# The forecast of month t+1 is v[t-11]·exp(ẑ), with a TVT_NOWCAST_LEVEL prediction interval from the
+# residual variance and the leverage of the new row.
+#
+# All series are fitted at once: the per-row normal-equation terms (X'X, X'y, y'y) of the whole matrix are
+# summed with one cumulative sum over months, and every series' coefficients at every month come out of one
+# batched solve. The running sums, coefficients and issued nowcasts are cached; on the next run the rows
+# touched by new or revised months (from the first changed month on) are subtracted and re-added, so the
+# monthly update costs a few rows per series instead of a refit. Nowcasts are recorded as issued: a later
+# revision of the actuals does not rewrite them. A first run (or --full) replays the history, so every past
+# month also gets the nowcast the model would have made from the data before it.
+#
+# Output (published as a snapshot next to the merged files):
+#   merged_tvt_nowcast.csv  Date, Month, Year, State, Measure, Actual, Nowcast, Lower, Upper
+#
+# Usage:
+#   python tvt_nowcast.py [--full] [--regressors cpi,unemp|none]
+
+import os
+import pickle
+import uuid
+import argparse
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+import tvt_frames
+import tvt_snapshot
+import tvt_profile
+import tvt_seasonal
+from tvt_metrics import RunMetrics
+from tvt_dates import key_from_abbr, key_year, format_mdy, format_abbr
+
+BASE_DIR = os.getenv('AIRFLOW_HOME', '/opt/airflow')
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+PROCESSED_DIR = os.getenv('TVT_PROC_DIR', os.path.join(DATA_DIR, 'tvt', 'processed'))
+DB_DIR = os.getenv('DB_DIR', PROCESSED_DIR)
+NOWCAST_CSV = os.getenv('NOWCAST_CSV', os.path.join(PROCESSED_DIR, 'merged_tvt_nowcast.csv'))
+CACHE_PATH = os.getenv('TVT_NOWCAST_CACHE', os.path.join(PROCESSED_DIR, 'nowcast', 'model.pkl'))
+# Regressors to use, by short name (empty or 'none': pure autoregression)
+DEFAULT_REGRESSORS = os.getenv('TVT_NOWCAST_REGRESSORS', 'cpi,unemp')
+# Coverage of the prediction intervals
+LEVEL = float(os.getenv('TVT_NOWCAST_LEVEL', '0.9'))
+
+# Short name -> (tvt_db narrow table, column, transform of the monthly series)
+REGRESSORS = {
+    'cpi': ('econ_cpi.csv', 'CPI', lambda s: np.log(s).diff(12)),
+    'unemp': ('econ_unemployment.csv', 'Monthly Unemployment rate', lambda s: s.diff(12)),
+}
+# Lags of z in the model (besides the intercept)
+AR_LAGS = (1, 12)
+# Months a regressor is carried past its last release (it is published later than VMT)
+CARRY_MONTHS = 3
+# Rows a series needs before it is nowcast
+MIN_OBS = 36
+# A regressor is dropped when it covers fewer of the model rows than this
+MIN_COVERAGE = 0.8
+# Keeps the normal equations solvable for flat or short series
+RIDGE = 1e-8
+NATIONAL_LABEL = 'United States'
+
+
+def load_regressors(keys: np.ndarray, names: list) -> tuple:
+    """(names, R × months matrix) of the transformed regressors over `keys`, carried up to CARRY_MONTHS forward."""
+    loaded, rows = [], []
+    for name in names:
+        table, col, transform = REGRESSORS[name]
+        path = tvt_snapshot.resolve(os.path.join(DB_DIR, table))
+        if not os.path.exists(path):
+            print(f'⚠ {table} has not been built yet (tvt_db.py); nowcasting without {name}')
+            continue
+        df = tvt_frames.read_csv(path, usecols=['Year', 'Month', col])
+        # The narrow tables hold one row per month of the series' full history
+        series = pd.Series(df[col].to_numpy(dtype='float64'), index=key_from_abbr(df['Year'], df['Month']).to_numpy())
+        series = series.reindex(np.arange(series.index.min(), max(series.index.max(), keys[-1]) + 1))
+        loaded.append(name)
+        rows.append(transform(series).ffill(limit=CARRY_MONTHS).reindex(keys).to_numpy(dtype='float64'))
+    if not rows:
+        return [], np.empty((0, len(keys)))
+    return loaded, np.vstack(rows)
+
+
+def design(logv: np.ndarray, econ: np.ndarray) -> tuple:
+    """
+    (X, y, valid) over the month axis: y[s, t] = z[s, t] and X[s, t] its regressors, all known at t-1.
+
+    The month axis of logv/econ has one extra month at the end, whose row holds the next month's
+    regressors (y unknown).
+    """
+    z = np.full(logv.shape, np.nan)
+    z[:, 12:] = logv[:, 12:] - logv[:, :-12]
+
+    def lag(a, k):
+        out = np.full(a.shape, np.nan)
+        out[..., k:] = a[..., :-k]
+        return out
+
+    cols = [np.ones(logv.shape)] + [lag(z, k) for k in AR_LAGS]
+    cols += [np.broadcast_to(lag(row, 1), logv.shape) for row in econ]
+    X = np.stack(cols, axis=-1)
+    valid = ~np.isnan(z) & ~np.isnan(X).any(axis=-1)
+    return X, z, valid
+
+
+def row_terms(X: np.ndarray, y: np.ndarray, valid: np.ndarray) -> tuple:
+    """Per-row (x x', x y, y², 1) of the valid rows, zero elsewhere."""
+    Xm = np.where(valid[..., None], X, 0.0)
+    ym = np.where(valid, y, 0.0)
+    return np.einsum('stp,stq->stpq', Xm, Xm), Xm * ym[..., None], ym ** 2, valid.astype('float64')
+
+
+def solve(XX: np.ndarray, Xy: np.ndarray, yy: np.ndarray, n: np.ndarray) -> tuple:
+    """Batched least squares from summed terms: (coefficients, residual variance, A⁻¹) with NaN below MIN_OBS."""
+    p = XX.shape[-1]
+    A = XX + RIDGE * np.eye(p)
+    inv = np.linalg.inv(A)
+    beta = np.einsum('...pq,...q->...p', inv, Xy)
+    sse = yy - 2 * np.einsum('...p,...p->...', beta, Xy) + np.einsum('...p,...pq,...q->...', beta, XX, beta)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sigma2 = np.maximum(sse, 0) / (n - p)
+    enough = n >= max(MIN_OBS, p + 1)
+    beta[~enough] = np.nan
+    sigma2[~enough] = np.nan
+    return beta, sigma2, inv
+
+
+def forecast(beta, sigma2, inv, x, base) -> np.ndarray:
+    """(..., 3) nowcast, lower, upper in the series' units; `base` is log v a year before the target."""
+    zhat = np.einsum('...p,...p->...', beta, x)
+    leverage = np.einsum('...p,...pq,...q->...', x, inv, x)
+    se = np.sqrt(sigma2 * (1 + leverage))
+    z = NormalDist().inv_cdf(0.5 + LEVEL / 2)
+    return np.exp(np.stack([base + zhat, base + zhat - z * se, base + zhat + z * se], axis=-1))
+
+
+def _load_cache(path: str = CACHE_PATH) -> dict | None:
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def _save_cache(cache: dict, path: str = CACHE_PATH) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.tmp-{uuid.uuid4().hex[:6]}'
+    with open(tmp, 'wb') as f:
+        pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def latest_month(values: np.ndarray) -> int:
+    """Index of the newest month observed in any series."""
+    return int(np.flatnonzero(~np.isnan(values).all(axis=0))[-1])
+
+
+def update(labels: list, keys: np.ndarray, values: np.ndarray, regressors: list, econ: np.ndarray,
+           full: bool = False, metrics: RunMetrics | None = None) -> tuple:
+    """
+    Fit (or update) every series and issue the nowcasts of the months not nowcast yet.
+
+    Returns (cache, whether anything changed); the cache holds the issued nowcasts by target month key.
+    """
+    keys = np.append(keys, keys[-1] + 1)  # room for the month after the newest
+    values = np.pad(values, ((0, 0), (0, 1)), constant_values=np.nan)
+    econ = np.concatenate([econ, econ[:, -1:]], axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        logv = np.log(np.where(values > 0, values, np.nan))
+    inputs = np.vstack([logv, econ])
+    input_labels = labels + [('', name) for name in regressors]
+
+    cache = None if full else _load_cache()
+    if cache is not None and (cache['labels'] != input_labels or cache['keys'][0] != keys[0]):
+        print('▶ Series or regressors changed since the cached model; refitting')
+        cache = None
+    start = 0
+    if cache is not None:
+        changed = tvt_seasonal.first_changed_month(cache, input_labels, keys, inputs)
+        if changed is None:
+            if metrics:
+                metrics.incr('cache_hits')
+            return cache, False
+        start = int(changed - keys[0])
+
+    X, y, valid = design(logv, econ)
+    terms = row_terms(X[:, start:], y[:, start:], valid[:, start:])
+    if cache is None:
+        base = [np.zeros_like(term[:, 0]) for term in terms]
+        issued, last_origin = {}, -1
+    else:
+        # Take the cached contribution of every row from the first changed month on out of the sums
+        n_series = len(labels)
+        oX, oy, ovalid = design(cache['values'][:n_series], cache['values'][n_series:])
+        old = row_terms(oX[:, start:], oy[:, start:], ovalid[:, start:])
+        base = [total - term.sum(axis=1) for total, term in zip(cache['sums'], old)]
+        issued, last_origin = cache['issued'], int(cache['origin'] - keys[0])
+    # Sums through every month from `start` on
+    sums = [np.expand_dims(b, 1) + np.cumsum(term, axis=1) for b, term in zip(base, terms)]
+
+    # Each new origin's model sees the rows through it and nowcasts the month after
+    latest = latest_month(values[:, :-1])
+    origins = np.arange(max(last_origin + 1, start, 11), latest + 1)
+    if len(origins):
+        beta, sigma2, inv = solve(*(s[:, origins - start] for s in sums))
+        target = origins + 1
+        preds = forecast(beta, sigma2, inv, X[:, target], logv[:, target - 12])
+        for i, t in enumerate(target):
+            issued[int(keys[t])] = preds[:, i]
+
+    totals = [s[:, -1] for s in sums]
+    beta, sigma2, _ = solve(*totals)
+    rows = int(terms[-1].sum())
+    print(f'▶ Nowcast model: {len(labels)} series, {len(regressors)} regressors; '
+          f'{rows} rows {"fitted" if cache is None else "refreshed from " + format_mdy([keys[start]])[0]}, '
+          f'{len(origins)} months nowcast')
+    if metrics:
+        metrics.incr('rows_fitted', rows)
+        metrics.incr('months_nowcast', len(origins))
+    cache = {
+        'labels': input_labels, 'keys': keys, 'values': inputs, 'sums': totals,
+        'coefficients': beta, 'sigma2': sigma2, 'origin': int(keys[latest]), 'issued': issued,
+    }
+    _save_cache(cache)
+    return cache, True
+
+
+def usable_regressors(values: np.ndarray, regressors: list, econ: np.ndarray) -> tuple:
+    """Drop the regressors that miss more than MIN_COVERAGE of the rows the autoregression alone would fit."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        _, _, valid = design(np.log(np.where(values > 0, values, np.nan)), np.empty((0, values.shape[1])))
+    rows = valid.any(axis=0)
+    kept = []
+    for i, name in enumerate(regressors):
+        lagged = np.r_[np.nan, econ[i, :-1]]
+        if rows.any() and np.mean(~np.isnan(lagged[rows])) >= MIN_COVERAGE:
+            kept.append(i)
+        else:
+            print(f'⚠ {name} covers too few of the VMT months in {REGRESSORS[name][0]}; nowcasting without it')
+    return [regressors[i] for i in kept], econ[kept]
+
+
+def build_output(labels: list, keys: np.ndarray, values: np.ndarray, issued: dict) -> pd.DataFrame:
+    """One row per series and nowcast month: the actual (once reported) next to the nowcast and its interval."""
+    targets = np.array(sorted(issued), dtype='int64')
+    preds = np.stack([issued[t] for t in targets], axis=1)  # series × targets × 3
+    index = {int(k): i for i, k in enumerate(keys)}
+    actual = np.full(preds.shape[:2], np.nan)
+    known = np.array([t in index for t in targets])
+    actual[:, known] = values[:, [index[t] for t in targets[known]]]
+    out = pd.DataFrame({
+        'MonthKey': np.tile(targets, len(labels)),
+        'State': np.repeat([state or NATIONAL_LABEL for state, _ in labels], len(targets)),
+        'Measure': np.repeat([measure for _, measure in labels], len(targets)),
+        'Actual': actual.ravel(),
+        'Nowcast': preds[..., 0].ravel(),
+        'Lower': preds[..., 1].ravel(),
+        'Upper': preds[..., 2].ravel(),
+    })
+    out = out.dropna(subset=['Nowcast']).sort_values(['MonthKey', 'State', 'Measure'])
+    out[['Actual', 'Nowcast', 'Lower', 'Upper']] = out[['Actual', 'Nowcast', 'Lower', 'Upper']].round(3)
+    out.insert(0, 'Date', format_mdy(out['MonthKey']))
+    out.insert(1, 'Month', format_abbr(out['MonthKey']))
+    out.insert(2, 'Year', key_year(out['MonthKey']))
+    return out.drop(columns='MonthKey').reset_index(drop=True)
+
+
+def accuracy(out: pd.DataFrame, months: int = 12) -> dict:
+    """Mean absolute % error and interval coverage of the nowcasts of the last `months` reported months."""
+    scored = out.dropna(subset=['Actual'])
+    recent = scored[scored['Date'].isin(scored['Date'].drop_duplicates().iloc[-months:])]
+    if recent.empty:
+        return {}
+    inside = (recent['Actual'] >= recent['Lower']) & (recent['Actual'] <= recent['Upper'])
+    return {
+        'mape': round(float((recent['Nowcast'] / recent['Actual'] - 1).abs().mean() * 100), 2),
+        'coverage': round(float(inside.mean()), 3),
+    }
+
+
+def main(argv: list | None = None) -> None:
+    parser = argparse.ArgumentParser(description='Nowcast next-month VMT for every state and national series.')
+    parser.add_argument('--full', action='store_true', help='ignore the cached model and replay the whole history')
+    parser.add_argument('--regressors', default=DEFAULT_REGRESSORS,
+                        help=f'comma-separated subset of {", ".join(REGRESSORS)}, or none (default: %(default)s)')
+    args = parser.parse_args(argv)
+    names = [n.strip() for n in args.regressors.split(',') if n.strip() and n.strip() != 'none']
+    unknown = [n for n in names if n not in REGRESSORS]
+    if unknown:
+        parser.error(f'unknown regressor(s) {unknown}; choose from {", ".join(REGRESSORS)}')
+
+    metrics = RunMetrics('nowcast')
+    with metrics.run():
+        with metrics.phase('parse'):
+            labels, keys, values = tvt_seasonal.load_matrix()
+            regressors, econ = load_regressors(keys, names)
+            regressors, econ = usable_regressors(values, regressors, econ)
+        metrics.incr('rows_in', int(np.sum(~np.isnan(values))))
+        # Requested regressors that are missing or too short show up in the run report, not only the log
+        dropped = [n for n in names if n not in regressors]
+        metrics.incr('regressors_dropped', len(dropped))
+        metrics.set_info(regressors=regressors, regressors_dropped=dropped)
+
+        with metrics.phase('consolidate'):
+            cache, changed = update(labels, keys, values, regressors, econ, full=args.full, metrics=metrics)
+        if not changed and os.path.exists(NOWCAST_CSV):
+            print('✔ Inputs unchanged since the last run; nowcasts are current')
+            return
+        with metrics.phase('consolidate'):
+            out = build_output(labels, keys, values, cache['issued'])
+        with metrics.phase('write'):
+            snapshot = tvt_snapshot.publish({NOWCAST_CSV: out}, meta={'stage': 'nowcast'})
+        scores = accuracy(out)
+        metrics.incr('rows_out', len(out))
+        metrics.set_info(series=len(labels), snapshot=snapshot, **scores)
+        target = out['Date'].iloc[-1]
+        print(f'✅ Nowcast {target} for {int((out["Date"] == target).sum())} series → {NOWCAST_CSV} '
+              f'(regressors: {", ".join(regressors) or "none"})')
+        if scores:
+            print(f"  last 12 months: mean abs error {scores['mape']}%, "
+                  f"{scores['coverage']:.0%} of actuals inside the {LEVEL:.0%} interval")
+
+
+if __name__ == '__main__':
+    tvt_profile.run(main)
@@ -0,0 +1,84 @@
+# Partial extracts for sharded workbook processing.
+# A full rebuild can be split by report year: each shard parses only that year's workbooks and
+# saves the extracted frames (tagged with the report month they came from) as one partial file.
+# The reduce step loads every partial and replays the frames in chronological report order, so the
+# override logic sees exactly the sequence a single-process run would.
+#
+# Layout: data/tvt/processed/partials/<job>/<report_year>.pkl
+
+import os
+import re
+import pickle
+import uuid
+
+import tvt_frames
+from tvt_raw_store import list_workbooks
+
+BASE_DIR = os.getenv('AIRFLOW_HOME', '/opt/airflow')
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+INPUT_DIR = os.getenv('TVT_RAW_DIR', os.path.join(DATA_DIR, 'tvt', 'raw'))
+PROCESSED_DIR = os.getenv('TVT_PROC_DIR', os.path.join(DATA_DIR, 'tvt', 'processed'))
+PARTIALS_DIR = os.getenv('TVT_PARTIALS_DIR', os.path.join(PROCESSED_DIR, 'partials'))
+
+FNAME_RE = re.compile(r'(?P<yy>\d{2})(?P<mon>[a-z]+)tvt\.xlsx$', re.IGNORECASE)
+
+
+def report_years(input_dir: str = INPUT_DIR) -> list:
+    """Report years (e.g. 2002..2025) that have at least one workbook in input_dir."""
+    years = {2000 + int(m.group('yy')) for m in map(FNAME_RE.match, list_workbooks(input_dir)) if m}
+    return sorted(years)
+
+
+def partial_path(job: str, year: int) -> str:
+    return os.path.join(PARTIALS_DIR, job, f'{year}.pkl')
+
+
+def _load_partial(path: str) -> dict:
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def write_partial(job: str, year: int, frames: list, stats: dict) -> str:
+    """
+    Save one shard's output.
+
+    `frames` is a list of (report_key, file_name, DataFrame) in the order they were read;
+    `stats` is the script's processing summary (processed count and errors by type).
+    """
+    path = partial_path(job, year)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    part = {
+        'year': year,
+        'frames': frames,
+        'processed': stats['processed'],
+        'errors': {kind: list(files) for kind, files in stats['errors'].items() if files},
+    }
+    tmp = f'{path}.tmp-{uuid.uuid4().hex[:6]}'
+    with open(tmp, 'wb') as f:
+        pickle.dump(part, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+    # In the warm worker the reduce step gets the partial from memory
+    tvt_frames.remember(path, part, _load_partial)
+    return path
+
+
+def read_partials(job: str, years: list) -> tuple:
+    """
+    Load the partials of `years` and return (frames, stats).
+
+    Frames come back in chronological report order across all shards. A missing partial is an
+    error: publishing without it would silently drop a year of revisions.
+    """
+    missing = [y for y in years if not os.path.exists(partial_path(job, y))]
+    if missing:
+        raise FileNotFoundError(f'No {job} partials for report years {missing} in {PARTIALS_DIR}')
+    frames, stats = [], {'processed': 0, 'errors': {}}
+    for year in years:
+        part = tvt_frames.load(partial_path(job, year), _load_partial)
+        frames.extend(part['frames'])
+        stats['processed'] += part['processed']
+        for kind, files in part['errors'].items():
+            if files:
+                stats['errors'].setdefault(kind, []).extend(files)
+    frames.sort(key=lambda item: item[0])
+    return frames, stats
@@ -0,0 +1,249 @@
+# Opt-in profiling for any pipeline script.
+# Set TVT_PROFILE=cprofile (deterministic) or TVT_PROFILE=sample (low-overhead stack sampling) in the
+# task environment and the script's main() runs under that profiler; nothing changes when it is unset.
+# Work done inside `tag(...)` blocks (one per workbook in the readers) is attributed to that tag, and the
+# summary breaks time down by package (openpyxl vs pandas vs our own merge code).
+# Artifacts and a top-N summary are written next to the Airflow task logs:
+#   logs/profiles/dag_id=<dag>/run_id=<run>/task_id=<task>/   (or logs/profiles/<script>/<timestamp>/)
+
+import os
+import sys
+import time
+import pstats
+import cProfile
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from functools import wraps
+
+BASE_DIR = os.getenv('AIRFLOW_HOME', '/opt/airflow')
+PROFILE_MODE = os.getenv('TVT_PROFILE', '').strip().lower()
+PROFILE_DIR = os.getenv('TVT_PROFILE_DIR', os.path.join(BASE_DIR, 'logs', 'profiles'))
+PROFILE_TOP = int(os.getenv('TVT_PROFILE_TOP', '25'))
+# Seconds between stack samples in `sample` mode
+SAMPLE_INTERVAL = float(os.getenv('TVT_PROFILE_INTERVAL', '0.005'))
+
+MODES = ('cprofile', 'sample')
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_session = None
+
+
+def _package_of(filename: str) -> str:
+    """Bucket a source file into the package that owns it (openpyxl, pandas, pipeline, ...)."""
+    if filename.startswith(SCRIPTS_DIR):
+        return 'pipeline'
+    parts = filename.replace('\\', '/').split('/')
+    if 'site-packages' in parts:
+        idx = parts.index('site-packages')
+        if idx + 1 < len(parts):
+            return parts[idx + 1].split('.')[0]
+    if filename.startswith('<'):
+        return 'builtin'
+    return 'stdlib'
+
+
+def output_dir(job: str) -> str:
+    """Artifact directory: alongside the Airflow task log when run by Airflow."""
+    dag, run, task = (os.getenv(k) for k in (
+        'AIRFLOW_CTX_DAG_ID', 'AIRFLOW_CTX_DAG_RUN_ID', 'AIRFLOW_CTX_TASK_ID'))
+    if dag and run and task:
+        path = os.path.join(PROFILE_DIR, f'dag_id={dag}', f'run_id={run}', f'task_id={task}')
+    else:
+        path = os.path.join(PROFILE_DIR, job, datetime.now().strftime('%Y%m%dT%H%M%S'))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class _CProfileSession:
+    """Deterministic profiling; each tag gets its own profiler so hotspots stay separable."""
+
+    def __init__(self):
+        self.main = cProfile.Profile()
+        self.tags = {}
+        self.tag_wall = defaultdict(float)
+        self._depth = 0
+
+    def start(self):
+        self.main.enable()
+
+    def stop(self):
+        self.main.disable()
+
+    @contextmanager
+    def tag(self, label: str):
+        t0 = time.perf_counter()
+        if self._depth:
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+            return
+        self._depth = 1
+        self.main.disable()
+        prof = self.tags.setdefault(label, cProfile.Profile())
+        prof.enable()
+        try:
+            yield
+        finally:
+            prof.disable()
+            self.main.enable()
+            self._depth = 0
+            self.tag_wall[label] += time.perf_counter() - t0
+
+    def _all_stats(self) -> pstats.Stats:
+        stats = pstats.Stats(self.main)
+        for prof in self.tags.values():
+            stats.add(prof)
+        return stats
+
+    def write(self, out_dir: str, top: int) -> list:
+        stats = self._all_stats()
+        stats.dump_stats(os.path.join(out_dir, 'profile.prof'))
+
+        by_package = Counter()
+        for (filename, _, _), (_, _, tottime, _, _) in stats.stats.items():
+            by_package[_package_of(filename)] += tottime
+        total = sum(by_package.values()) or 1.0
+
+        lines = ['Self time by package:']
+        lines += [f'  {pkg:<20} {sec:9.3f}s {100 * sec / total:5.1f}%' for pkg, sec in by_package.most_common()]
+        lines += ['', f'Top {top} functions by cumulative time:']
+        rows = sorted(stats.stats.items(), key=lambda kv: kv[1][3], reverse=True)[:top]
+        lines += [f'  {ct:9.3f}s cum {tt:9.3f}s self  {fn}:{ln}({func})'
+                  for (fn, ln, func), (_, _, tt, ct, _) in rows]
+        lines += ['', f'Top {top} tags by wall time (hottest function inside each):']
+        for label, wall in sorted(self.tag_wall.items(), key=lambda kv: kv[1], reverse=True)[:top]:
+            tag_stats = pstats.Stats(self.tags[label]).stats
+            (fn, ln, func), vals = max(tag_stats.items(), key=lambda kv: kv[1][2])
+            lines.append(f'  {wall:9.3f}s  {label}  [{os.path.basename(fn)}:{ln}({func}) {vals[2]:.3f}s self]')
+        return lines
+
+
+class _SampleSession:
+    """Statistical profiling: a background thread samples the main thread's stack."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.target = threading.main_thread().ident
+        self.stacks = Counter()
+        self.tag_samples = defaultdict(Counter)
+        self.tag_wall = defaultdict(float)
+        self.current_tag = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name='tvt-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_filename, frame.f_lineno, code.co_name))
+                frame = frame.f_back
+            if not stack:
+                continue
+            stack = tuple(reversed(stack))
+            self.stacks[stack] += 1
+            if self.current_tag is not None:
+                leaf = stack[-1]
+                self.tag_samples[self.current_tag][(leaf[0], leaf[2])] += 1
+
+    @contextmanager
+    def tag(self, label: str):
+        outer = self.current_tag
+        if outer is None:
+            self.current_tag = label
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            if outer is None:
+                self.current_tag = None
+                self.tag_wall[label] += time.perf_counter() - t0
+
+    def write(self, out_dir: str, top: int) -> list:
+        # Folded stacks: feed to flamegraph.pl / speedscope
+        with open(os.path.join(out_dir, 'stacks.folded'), 'w') as f:
+            for stack, count in self.stacks.most_common():
+                frames = ';'.join(f'{func} ({os.path.basename(fn)})' for fn, _, func in stack)
+                f.write(f'{frames} {count}\n')
+
+        total = sum(self.stacks.values()) or 1
+        self_count, cum_count, by_package = Counter(), Counter(), Counter()
+        for stack, count in self.stacks.items():
+            leaf = stack[-1]
+            self_count[(leaf[0], leaf[2])] += count
+            by_package[_package_of(leaf[0])] += count
+            for key in {(fn, func) for fn, _, func in stack}:
+                cum_count[key] += count
+
+        lines = [f'{total} samples every {self.interval * 1000:.1f} ms', '', 'Self samples by package:']
+        lines += [f'  {pkg:<20} {n:8d} {100 * n / total:5.1f}%' for pkg, n in by_package.most_common()]
+        lines += ['', f'Top {top} functions by self samples:']
+        lines += [f'  {100 * n / total:5.1f}%  {fn}({func})' for (fn, func), n in self_count.most_common(top)]
+        lines += ['', f'Top {top} functions by cumulative samples:']
+        lines += [f'  {100 * n / total:5.1f}%  {fn}({func})' for (fn, func), n in cum_count.most_common(top)]
+        lines += ['', f'Top {top} tags by wall time (hottest leaf inside each):']
+        for label, wall in sorted(self.tag_wall.items(), key=lambda kv: kv[1], reverse=True)[:top]:
+            hot = self.tag_samples[label].most_common(1)
+            hint = f'[{os.path.basename(hot[0][0][0])}({hot[0][0][1]}) {hot[0][1]} samples]' if hot else ''
+            lines.append(f'  {wall:9.3f}s  {label}  {hint}')
+        return lines
+
+
+def tag(label: str):
+    """Attribute the enclosed work to `label` in the profile (no-op when profiling is off)."""
+    if _session is None:
+        return nullcontext()
+    return _session.tag(label)
+
+
+def tagged(label_of):
+    """Decorator form of `tag`: `label_of(*args, **kwargs)` names the tag for each call."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if _session is None:
+                return func(*args, **kwargs)
+            with _session.tag(label_of(*args, **kwargs)):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def run(main, job: str | None = None):
+    """Call `main()`, under the profiler selected by TVT_PROFILE if any."""
+    global _session
+    if not PROFILE_MODE:
+        return main()
+    if PROFILE_MODE not in MODES:
+        print(f'⚠ Unknown TVT_PROFILE={PROFILE_MODE!r} (expected one of {MODES}); running unprofiled')
+        return main()
+
+    job = job or os.path.splitext(os.path.basename(sys.argv[0]))[0]
+    _session = _CProfileSession() if PROFILE_MODE == 'cprofile' else _SampleSession(SAMPLE_INTERVAL)
+    t0 = time.perf_counter()
+    _session.start()
+    try:
+        return main()
+    finally:
+        _session.stop()
+        session, _session = _session, None
+        out_dir = output_dir(job)
+        lines = [f'Profile of {job} ({PROFILE_MODE}), wall {time.perf_counter() - t0:.2f}s', '']
+        lines += session.write(out_dir, PROFILE_TOP)
+        summary = '\n'.join(lines) + '\n'
+        with open(os.path.join(out_dir, 'summary.txt'), 'w') as f:
+            f.write(summary)
+        print(summary)
+        print(f'▶ Profile artifacts written to: {out_dir}')
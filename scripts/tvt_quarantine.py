@@ -0,0 +1,82 @@
+# Quarantine of workbooks that failed to parse.
+# Each merge job keeps a JSON list of the workbooks it could not read, with the last error, so a run can
+# retry just those files (`--retry-quarantined`) instead of re-parsing the whole archive, and so the
+# published output can say whether it is complete.
+#
+# Layout: data/tvt/processed/quarantine/<job>.json
+#   {"05novtvt.xlsx": {"error": "...", "attempts": 2, "first_failed": "...", "last_failed": "..."}}
+
+import os
+import json
+import uuid
+from datetime import datetime
+
+import tvt_locks
+
+BASE_DIR = os.getenv('AIRFLOW_HOME', '/opt/airflow')
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+PROCESSED_DIR = os.getenv('TVT_PROC_DIR', os.path.join(DATA_DIR, 'tvt', 'processed'))
+QUARANTINE_DIR = os.getenv('TVT_QUARANTINE_DIR', os.path.join(PROCESSED_DIR, 'quarantine'))
+
+
+def quarantine_path(job: str) -> str:
+    return os.path.join(QUARANTINE_DIR, f'{job}.json')
+
+
+def load(job: str) -> dict:
+    """Quarantined workbooks of a job, keyed by file name."""
+    path = quarantine_path(job)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def update(job: str, parsed: set, failed: list, replace: bool = False) -> dict:
+    """
+    Record the outcome of a run and return the new quarantine.
+
+    `parsed` are workbooks read successfully (released from quarantine), `failed` the script's
+    (file, error) read errors. With `replace`, the run saw every workbook, so entries for files
+    it did not mention are dropped too (e.g. files deleted from the raw dir).
+    """
+    # Overlapping runs of the same job update the file one at a time, each from the other's result
+    with tvt_locks.lock(f'quarantine-{job}'):
+        now = datetime.now().isoformat(timespec='seconds')
+        old = load(job)
+        entries = {} if replace else {fn: e for fn, e in old.items() if fn not in parsed}
+        for fn, error in failed:
+            prev = old.get(fn, {})
+            entries[fn] = {
+                'error': error,
+                'attempts': prev.get('attempts', 0) + 1,
+                'first_failed': prev.get('first_failed', now),
+                'last_failed': now,
+            }
+
+        os.makedirs(QUARANTINE_DIR, exist_ok=True)
+        path = quarantine_path(job)
+        tmp = f'{path}.tmp-{uuid.uuid4().hex[:6]}'
+        with open(tmp, 'w') as f:
+            json.dump(dict(sorted(entries.items())), f, indent=2)
+        os.replace(tmp, path)
+
+    released = sorted(set(old) - set(entries))
+    if released:
+        print(f"✔ Released from quarantine: {', '.join(released)}")
+    if entries:
+        print(f"⚠ {len(entries)} workbook(s) quarantined for {job}; output marked incomplete "
+              f"(retry with --retry-quarantined): {', '.join(entries)}")
+    return entries
+
+
+def release_missing(job: str, listing: list) -> dict:
+    """Release the entries of workbooks no longer in the raw dir (`listing`) and return the quarantine."""
+    entries = load(job)
+    gone = set(entries) - set(listing)
+    return update(job, gone, []) if gone else entries
+
+
+def completeness(entries: dict) -> dict:
+    """Completeness flag recorded for an output in the snapshot manifest."""
+    return {'complete': not entries, 'quarantined': sorted(entries)}
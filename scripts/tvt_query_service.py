@@ -0,0 +1,255 @@
+# Local HTTP/JSON query service over the master data (merged_db.csv).
+# The current snapshot is loaded once into an in-process index (one sorted month-key array plus one
+# value array per measure, per state) and queries are answered by binary search on that index, so no
+# request ever re-reads the CSV. Encoded responses are kept in an LRU cache; the cache and the index
+# are dropped as soon as the `current` snapshot link points at a new build.
+#
+# Endpoints (dates are YYYY-MM or YYYY-MM-DD, ranges are inclusive, `measure` takes a comma list):
+#   GET /series?state=Ohio&measure=All Miles&start=2020-01&end=2020-12
+#   GET /national?measure=CPI,Total VMT (Million)&start=2019-01
+#   GET /states    GET /measures    GET /health
+#
+# To run this script, ensure you have the required libraries installed:
+# pip install pandas numpy
+
+import os
+import json
+import math
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+import numpy as np
+import pandas as pd
+
+import tvt_snapshot
+from tvt_seasonal import state_rows
+from tvt_dates import month_key, key_from_abbr, format_iso
+
+BASE_DIR = os.getenv('AIRFLOW_HOME', '/opt/airflow')
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+DB_PATH = os.path.join(os.getenv('DB_DIR', os.path.join(DATA_DIR, 'tvt', 'processed')), 'merged_db.csv')
+HOST = os.getenv('TVT_QUERY_HOST', '127.0.0.1')
+PORT = int(os.getenv('TVT_QUERY_PORT', '8765'))
+# Number of encoded responses kept in the LRU cache
+CACHE_SIZE = int(os.getenv('TVT_QUERY_CACHE_SIZE', '1024'))
+
+# Columns reported per state; everything else in the DB is a national (month-only) indicator
+STATE_MEASURES = [
+    'Rural Arterial Miles', 'Urban Arterial Miles', 'All Miles', 'Other Miles',
+    'Rural Arterial Stations', 'Urban Arterial Stations', 'All Stations', 'Other Stations',
+]
+KEY_COLUMNS = ['Date', 'Month', 'Year', 'State']
+
+
+class QueryError(ValueError):
+    """Bad request parameters; reported to the client as HTTP 400."""
+
+
+class NotFound(Exception):
+    """Unknown endpoint or state; reported to the client as HTTP 404."""
+
+
+def parse_month(value: str | None, default: int) -> int:
+    """Month key of a 'YYYY-MM' / 'YYYY-MM-DD' parameter."""
+    if not value:
+        return default
+    try:
+        year, month = (int(p) for p in value.split('-')[:2])
+    except ValueError:
+        raise QueryError(f'Invalid date {value!r}; expected YYYY-MM')
+    if not 1 <= month <= 12:
+        raise QueryError(f'Invalid month in {value!r}')
+    return month_key(year, month)
+
+
+class Series:
+    """Sorted month keys plus aligned value arrays for a set of measures."""
+
+    def __init__(self, df: pd.DataFrame, measures: list):
+        df = df.sort_values('MonthKey')
+        self.keys = df['MonthKey'].to_numpy(dtype='int64')
+        self.values = {m: df[m].to_numpy(dtype='float64') for m in measures}
+
+    def slice(self, measures: list, start: int, end: int) -> dict:
+        lo = np.searchsorted(self.keys, start, side='left')
+        hi = np.searchsorted(self.keys, end, side='right')
+        out = {'date': list(format_iso(self.keys[lo:hi]))}
+        for m in measures:
+            out[m] = [None if math.isnan(v) else v for v in self.values[m][lo:hi].tolist()]
+        return out
+
+
+class Index:
+    """In-memory index of one snapshot of merged_db.csv."""
+
+    def __init__(self, path: str, snapshot: str | None):
+        self.snapshot = snapshot
+        self.complete = tvt_snapshot.file_info(path, snapshot).get('complete', True)
+        df = pd.read_csv(path)
+        df['MonthKey'] = key_from_abbr(df['Year'], df['Month'])
+        self.rows = len(df)
+        self.state_measures = [c for c in STATE_MEASURES if c in df.columns]
+        self.national_measures = [
+            c for c in df.columns if c not in KEY_COLUMNS + self.state_measures + ['MonthKey']
+        ]
+
+        # Only actual states, each under one name (no Subtotal/Total rows, 'Dist Of Columbia' merged)
+        by_state = state_rows(df.dropna(subset=['State']))
+        self.states = {
+            state: Series(group, self.state_measures)
+            for state, group in by_state.groupby('State', sort=True)
+        }
+        # National indicators are repeated on every state row of a month; keep one row per month
+        national = df.drop_duplicates('MonthKey')[['MonthKey'] + self.national_measures]
+        self.national = Series(national, self.national_measures)
+
+    def series(self, state: str, measures: list, start: int, end: int) -> dict:
+        if state not in self.states:
+            raise NotFound(f'Unknown state {state!r}; see /states')
+        self._check(measures, self.state_measures)
+        return {'state': state, **self.states[state].slice(measures, start, end)}
+
+    def national_series(self, measures: list, start: int, end: int) -> dict:
+        self._check(measures, self.national_measures)
+        return self.national.slice(measures, start, end)
+
+    @staticmethod
+    def _check(measures: list, known: list) -> None:
+        unknown = [m for m in measures if m not in known]
+        if unknown:
+            raise QueryError(f'Unknown measure(s) {unknown}; see /measures')
+
+
+class QueryService:
+    """Owns the current index and the LRU response cache, both tied to one snapshot."""
+
+    def __init__(self, db_path: str = DB_PATH, cache_size: int = CACHE_SIZE):
+        self.db_path = db_path
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._index = None
+        self._link = None
+        self._cache = OrderedDict()
+        self.hits = self.misses = 0
+
+    def _current_link(self) -> str | None:
+        """Cheap change check: one readlink per request instead of a stat of the data."""
+        try:
+            return os.readlink(tvt_snapshot.CURRENT_LINK)
+        except OSError:
+            return None
+
+    def index(self) -> Index:
+        """Index of the current snapshot, (re)loaded when a new snapshot has been published."""
+        link = self._current_link()
+        with self._lock:
+            if self._index is None or link != self._link:
+                snapshot = tvt_snapshot.pin()
+                self._index = Index(tvt_snapshot.resolve(self.db_path, snapshot), snapshot)
+                self._link = link
+                self._cache.clear()
+                print(f'▶ Loaded {self._index.rows} rows from snapshot {snapshot and os.path.basename(snapshot)}')
+            return self._index
+
+    def query(self, path: str, params: dict) -> bytes:
+        """Encoded JSON body for a request, served from the LRU cache when possible."""
+        index = self.index()
+        key = (path, tuple(sorted((k, tuple(v)) for k, v in params.items())))
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key]
+            self.misses += 1
+
+        body = json.dumps(self._answer(index, path, params)).encode()
+        with self._lock:
+            # Only cache answers computed against the index that is still current
+            if index is self._index:
+                self._cache[key] = body
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return body
+
+    def _answer(self, index: Index, path: str, params: dict) -> dict:
+        def one(name, required=True):
+            values = params.get(name)
+            if not values:
+                if required:
+                    raise QueryError(f'Missing parameter {name!r}')
+                return None
+            return values[-1]
+
+        if path in ('/series', '/national'):
+            measures = [m.strip() for m in one('measure').split(',') if m.strip()]
+            start = parse_month(one('start', False), 0)
+            end = parse_month(one('end', False), 10 ** 9)
+            if path == '/series':
+                return index.series(one('state'), measures, start, end)
+            return index.national_series(measures, start, end)
+        if path == '/states':
+            return {'states': list(index.states)}
+        if path == '/measures':
+            return {'state': index.state_measures, 'national': index.national_measures}
+        raise NotFound(f'No endpoint {path}')
+
+    def health(self) -> dict:
+        index = self.index()
+        return {
+            'status': 'ok',
+            'snapshot': index.snapshot and os.path.basename(index.snapshot),
+            'rows': index.rows,
+            'complete': index.complete,
+            'cache': {'size': len(self._cache), 'hits': self.hits, 'misses': self.misses},
+        }
+
+
+def make_handler(service: QueryService):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlsplit(self.path)
+            path = url.path.rstrip('/') or '/'
+            try:
+                if path == '/health':
+                    body = json.dumps(service.health()).encode()
+                else:
+                    body = service.query(path, parse_qs(url.query))
+                self._send(200, body)
+            except QueryError as e:
+                self._send(400, json.dumps({'error': str(e)}).encode())
+            except NotFound as e:
+                self._send(404, json.dumps({'error': str(e)}).encode())
+            except FileNotFoundError as e:
+                self._send(503, json.dumps({'error': f'Master data not available: {e.filename}'}).encode())
+            except Exception as e:
+                self._send(500, json.dumps({'error': f'{type(e).__name__}: {e}'}).encode())
+
+        def _send(self, status: int, body: bytes):
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, fmt, *args):
+            pass
+
+    return Handler
+
+
+def main() -> None:
+    service = QueryService()
+    server = ThreadingHTTPServer((HOST, PORT), make_handler(service))
+    print(f'▶ Serving TVT queries on http://{HOST}:{PORT} (db: {DB_PATH})')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
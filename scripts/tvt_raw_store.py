@@ -0,0 +1,279 @@
+# Content-addressed store for the raw TVT workbooks.
+# Each workbook is stored once as a blob named by the SHA-256 of its content (identical files share a
+# blob), compressed with zstd when that saves space (.xlsx files are already zip archives and are usually
+# kept as is; zlib blobs of older stores are still read). A small manifest maps each report
+# month to one blob, so discovering the workbooks is a manifest lookup instead of a directory listing,
+# and readers stream a workbook straight out of its blob. A month keeps one form: the converted .xlsx
+# replaces the original .xls (whose blob is then collected), and a later .xls never displaces an .xlsx.
+#
+# Set TVT_RAW_SOURCE=store to make the merge scripts read from the store instead of TVT_RAW_DIR.
+#
+# Usage:
+#   python tvt_raw_store.py ingest [--prune]   # add TVT_RAW_DIR to the store (--prune: then delete the files)
+#   python tvt_raw_store.py ls
+#   python tvt_raw_store.py verify
+#   python tvt_raw_store.py export <dir>       # write the workbooks back out as files
+#   python tvt_raw_store.py gc                 # delete blobs no manifest entry points at
+
+import io
+import os
+import re
+import sys
+import json
+import zlib
+import hashlib
+from datetime import datetime
+
+import zstandard
+
+BASE_DIR = os.getenv('AIRFLOW_HOME', '/opt/airflow')
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+RAW_DIR = os.getenv('TVT_RAW_DIR', os.path.join(DATA_DIR, 'tvt', 'raw'))
+STORE_DIR = os.getenv('TVT_STORE_DIR', os.path.join(DATA_DIR, 'tvt', 'store'))
+# 'dir' (default): scripts list and open TVT_RAW_DIR; 'store': they use the manifest and blobs
+RAW_SOURCE = os.getenv('TVT_RAW_SOURCE', 'dir').strip().lower()
+# Keep the compressed form only if it is at most this fraction of the original
+MIN_RATIO = float(os.getenv('TVT_STORE_MIN_RATIO', '0.9'))
+
+MANIFEST_NAME = 'manifest.json'
+WORKBOOK_RE = re.compile(r'^(?P<yy>\d{2})(?P<mon>[a-z]{3,4})tvt\.(?P<kind>xlsx?)$', re.IGNORECASE)
+MONTHS = {m: i + 1 for i, m in enumerate(
+    ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'])}
+
+
+def parse_name(name: str) -> tuple | None:
+    """(year, month, kind) of a renamed workbook such as '04martvt.xlsx', or None."""
+    m = WORKBOOK_RE.match(name)
+    if not m or m.group('mon').lower()[:3] not in MONTHS:
+        return None
+    return 2000 + int(m.group('yy')), MONTHS[m.group('mon').lower()[:3]], m.group('kind').lower()
+
+
+def entry_key(year: int, month: int) -> str:
+    return f'{year:04d}-{month:02d}'
+
+
+def _canonical(entries: dict) -> dict:
+    """Entries keyed by report month, keeping the .xlsx form (manifests written before keyed by kind too)."""
+    months = {}
+    for key, e in sorted(entries.items()):
+        month = key.split('/')[0]
+        kind = e.get('kind') or parse_name(e['name'])[2]
+        if month not in months or kind == 'xlsx':
+            months[month] = {**e, 'kind': kind}
+    return months
+
+
+def _compress(data: bytes) -> tuple:
+    packed = zstandard.ZstdCompressor(level=10).compress(data)
+    if len(packed) <= MIN_RATIO * len(data):
+        return packed, 'zstd'
+    return data, 'none'
+
+
+def _decompress(packed: bytes, codec: str) -> bytes:
+    if codec == 'none':
+        return packed
+    if codec == 'zlib':
+        return zlib.decompress(packed)
+    if codec == 'zstd':
+        return zstandard.ZstdDecompressor().decompress(packed)
+    raise ValueError(f'Unknown blob codec {codec!r}')
+
+
+class RawStore:
+    """Manifest plus hash-named blobs under one directory."""
+
+    def __init__(self, root: str = STORE_DIR):
+        self.root = root
+        self.blob_dir = os.path.join(root, 'blobs')
+        self.manifest_path = os.path.join(root, MANIFEST_NAME)
+        self.manifest = {'entries': {}, 'blobs': {}}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+        self.manifest['entries'] = _canonical(self.manifest['entries'])
+
+    @property
+    def entries(self) -> dict:
+        return self.manifest['entries']
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def save(self) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        tmp = f'{self.manifest_path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.manifest_path)
+
+    def put(self, path: str) -> str | None:
+        """Add one workbook file; returns its entry key (None for names that are not TVT workbooks).
+
+        An .xls is skipped when the month already has its .xlsx; an .xlsx replaces the month's .xls.
+        """
+        name = os.path.basename(path)
+        parsed = parse_name(name)
+        if parsed is None:
+            return None
+        year, month, kind = parsed
+        key = entry_key(year, month)
+        stat = os.stat(path)
+        old = self.entries.get(key)
+        if old and old['kind'] == 'xlsx' and kind == 'xls':
+            return key
+        # Unchanged since the last ingest: skip re-hashing
+        if old and old['name'] == name and old['size'] == stat.st_size and old['mtime'] == int(stat.st_mtime):
+            return key
+
+        with open(path, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+        if digest not in self.manifest['blobs']:
+            packed, codec = _compress(data)
+            blob_path = self._blob_path(digest)
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            with open(f'{blob_path}.tmp', 'wb') as f:
+                f.write(packed)
+            os.replace(f'{blob_path}.tmp', blob_path)
+            self.manifest['blobs'][digest] = {'size': len(data), 'stored': len(packed), 'codec': codec}
+        self.entries[key] = {
+            'name': name, 'kind': kind, 'blob': digest, 'size': stat.st_size, 'mtime': int(stat.st_mtime),
+            'added': datetime.now().isoformat(timespec='seconds'),
+        }
+        return key
+
+    def read(self, key: str) -> bytes:
+        """Original bytes of an entry."""
+        digest = self.entries[key]['blob']
+        with open(self._blob_path(digest), 'rb') as f:
+            return _decompress(f.read(), self.manifest['blobs'][digest]['codec'])
+
+    def names(self, kind: str = 'xlsx') -> list:
+        """Workbook names (as in the raw directory) of every entry of `kind`."""
+        return [e['name'] for k, e in sorted(self.entries.items()) if e['kind'] == kind]
+
+    def open(self, name: str) -> io.BytesIO:
+        """A workbook as an in-memory file, named like the raw file, for pd.read_excel."""
+        parsed = parse_name(name)
+        key = entry_key(*parsed[:2]) if parsed else None
+        if key not in self.entries or self.entries[key]['name'] != name:
+            raise FileNotFoundError(f'{name} is not in the raw store {self.root}')
+        buf = io.BytesIO(self.read(key))
+        buf.name = name
+        return buf
+
+    def has(self, year: int, month: int, kind: str | None = None) -> bool:
+        """Whether the month is stored (in `kind` form, if given)."""
+        e = self.entries.get(entry_key(year, month))
+        return e is not None and kind in (None, e['kind'])
+
+    def gc(self) -> list:
+        """Delete blobs that no entry references."""
+        live = {e['blob'] for e in self.entries.values()}
+        removed = [d for d in self.manifest['blobs'] if d not in live]
+        for digest in removed:
+            if os.path.exists(self._blob_path(digest)):
+                os.remove(self._blob_path(digest))
+            del self.manifest['blobs'][digest]
+        self.save()
+        return removed
+
+    def verify(self) -> list:
+        """Entries whose blob is missing or no longer matches its hash."""
+        bad = []
+        for key, e in sorted(self.entries.items()):
+            try:
+                ok = hashlib.sha256(self.read(key)).hexdigest() == e['blob']
+            except (OSError, ValueError, zlib.error, zstandard.ZstdError):
+                ok = False
+            if not ok:
+                bad.append(key)
+        return bad
+
+
+def ingest(raw_dir: str = RAW_DIR, store: RawStore | None = None, prune: bool = False) -> RawStore:
+    """Add every workbook in raw_dir to the store; with `prune`, delete the files once stored."""
+    store = store or RawStore()
+    added = []
+    for name in sorted(os.listdir(raw_dir)):
+        path = os.path.join(raw_dir, name)
+        if os.path.isfile(path) and store.put(path):
+            added.append(path)
+    # Blobs of .xls forms replaced by their .xlsx are no longer referenced
+    store.gc()
+    if prune:
+        for path in added:
+            os.remove(path)
+    return store
+
+
+_store = None
+
+
+def store() -> RawStore:
+    """The process-wide store (loaded once)."""
+    global _store
+    if _store is None:
+        _store = RawStore()
+    return _store
+
+
+def list_workbooks(raw_dir: str = RAW_DIR) -> list:
+    """Workbook names to process: a manifest lookup in store mode, a directory listing otherwise."""
+    if RAW_SOURCE == 'store':
+        return store().names('xlsx')
+    return os.listdir(raw_dir)
+
+
+def open_workbook(raw_dir: str, name: str):
+    """Path of a workbook, or in store mode an in-memory file streamed from its blob."""
+    if RAW_SOURCE == 'store':
+        return store().open(name)
+    return os.path.join(raw_dir, name)
+
+
+def source_name(source) -> str:
+    """File name of a workbook source (path, in-memory file, or a pd.ExcelFile opened from either)."""
+    # pd.ExcelFile keeps what it was opened from as .io (pandas < 3) or ._io
+    source = getattr(source, 'io', None) or getattr(source, '_io', None) or source
+    return os.path.basename(getattr(source, 'name', source))
+
+
+def main() -> None:
+    cmd = sys.argv[1] if len(sys.argv) > 1 else 'ls'
+    if cmd == 'ingest':
+        s = ingest(prune='--prune' in sys.argv[2:])
+        print(f'✔ Store has {len(s.entries)} workbooks in {len(s.manifest["blobs"])} blobs → {s.root}')
+    elif cmd == 'ls':
+        s = store()
+        for key, e in sorted(s.entries.items()):
+            blob = s.manifest['blobs'][e['blob']]
+            print(f"{key:<8} {e['name']:<16} {blob['size']:>10} → {blob['stored']:>10} {blob['codec']:<5} {e['blob'][:12]}")
+        raw = sum(b['size'] for b in s.manifest['blobs'].values())
+        stored = sum(b['stored'] for b in s.manifest['blobs'].values())
+        print(f'{len(s.entries)} workbooks, {len(s.manifest["blobs"])} blobs, {raw / 1e6:.1f} MB → {stored / 1e6:.1f} MB on disk')
+    elif cmd == 'verify':
+        bad = store().verify()
+        for key in bad:
+            print(f'✖ {key}')
+        print(f'{len(bad)} damaged entries' if bad else '✔ All blobs match their hashes')
+        sys.exit(1 if bad else 0)
+    elif cmd == 'export' and len(sys.argv) > 2:
+        s = store()
+        os.makedirs(sys.argv[2], exist_ok=True)
+        for key, e in sorted(s.entries.items()):
+            with open(os.path.join(sys.argv[2], e['name']), 'wb') as f:
+                f.write(s.read(key))
+        print(f'✔ Exported {len(s.entries)} workbooks → {sys.argv[2]}')
+    elif cmd == 'gc':
+        removed = store().gc()
+        print(f'✔ Removed {len(removed)} unreferenced blobs')
+    else:
+        print('usage: tvt_raw_store.py [ingest [--prune]|ls|verify|export <dir>|gc]')
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+# Compact column types for the processed TVT tables.
+# Each table has a schema mapping columns to storage types: categorical State/Month, int16 Year,
+# nullable Int16 station counts and float32 for measures whose published precision survives the
+# downcast (checked per column, otherwise float64 is kept). Schemas are applied as soon as a frame
+# is extracted and again after merges, so every stage and output works on the compact types.
+
+import numpy as np
+import pandas as pd
+
+from tvt_dates import MONTH_ABBRS
+
+MONTH_DTYPE = pd.CategoricalDtype(MONTH_ABBRS, ordered=True)
+
+
+class CompactFloat:
+    """float32 when every value round-trips at `decimals` places, float64 otherwise."""
+
+    def __init__(self, decimals: int):
+        self.decimals = decimals
+
+    def cast(self, s: pd.Series) -> pd.Series:
+        values = pd.to_numeric(s, errors='coerce').astype('float64')
+        narrow = values.astype('float32')
+        tolerance = 0.5 * 10 ** -self.decimals
+        if np.allclose(narrow.astype('float64'), values, rtol=0, atol=tolerance, equal_nan=True):
+            return narrow
+        return values
+
+
+def _cast(s: pd.Series, dtype) -> pd.Series:
+    """Cast one column, coercing placeholders such as '-' in numeric columns to missing."""
+    if isinstance(dtype, CompactFloat):
+        return dtype.cast(s)
+    if isinstance(dtype, pd.CategoricalDtype) or dtype == 'category':
+        if s.dtype == object or pd.api.types.is_string_dtype(s):
+            s = s.str.strip()
+        return s.astype(dtype)
+    if dtype in ('Int16', 'Int32'):
+        return pd.to_numeric(s, errors='coerce').round().astype(dtype)
+    return pd.to_numeric(s, errors='coerce').astype(dtype)
+
+
+MILES = CompactFloat(3)
+VMT = CompactFloat(3)
+RATE = CompactFloat(2)
+
+SECTIONS = ('Rural', 'Urban', 'All')
+
+# Columns of read_state_miles() frames, e.g. Rural_Stations, Rural_LastMonth_Current
+STATE_MILES_EXTRACT = {'State': 'category', 'Year': 'int16', 'Month': 'int8'}
+for _section in SECTIONS:
+    STATE_MILES_EXTRACT.update({
+        f'{_section}_Stations': 'Int16',
+        f'{_section}_Current': MILES,
+        f'{_section}_Previous': MILES,
+        f'{_section}_LastMonth_Stations': 'Int16',
+        f'{_section}_LastMonth_Current': MILES,
+        f'{_section}_LastMonth_Previous': MILES,
+    })
+
+# Columns of read_excel_data() frames
+NATIONAL_EXTRACT = {
+    'year_record': 'int16',
+    'tmonth': VMT,
+    'yearToDate': VMT,
+    'moving': VMT,
+}
+
+# Station counts stay nullable end to end (missing is not zero)
+STATION_COLUMNS = [
+    'Rural Arterial Stations', 'Urban Arterial Stations', 'All Stations', 'Other Stations',
+]
+
+STATE_MILES = {
+    'Month': MONTH_DTYPE,
+    'Year': 'int16',
+    'State': 'category',
+    'Rural Arterial Miles': MILES,
+    'Urban Arterial Miles': MILES,
+    'All Miles': MILES,
+    'Other Miles': MILES,
+    **{c: 'Int16' for c in STATION_COLUMNS},
+}
+
+# State table on the complete month grid (tvt_gaps.py); Imputed is a bitmask of filled cells
+STATE_MILES_GRID = {**STATE_MILES, 'Imputed': 'uint8'}
+
+TVT_DATA = {
+    'Month': MONTH_DTYPE,
+    'Year': 'int16',
+    'Total VMT (Million)': VMT,
+    'Year To Date VMT (Million)': VMT,
+    'Moving 12-Month VMT (Million)': VMT,
+    'VMT Change Rate(Monthly)': RATE,
+    'VMT Change Rate (Annually)': RATE,
+}
+
+# Table 1 of every workbook: monthly VMT (billions) by functional system
+FUNCTIONAL_SYSTEMS = (
+    'Rural Interstate', 'Rural Other Arterial', 'Other Rural',
+    'Urban Interstate', 'Urban Other Arterial', 'Other Urban', 'All Systems',
+)
+
+# Columns of read_functional_class() / read_regional_vmt() frames
+FUNCTIONAL_CLASS_EXTRACT = {'Year': 'int16', 'Month': 'int8', 'System': 'category', 'VMT': VMT}
+REGIONAL_EXTRACT = {'Year': 'int16', 'Month': 'int8', 'Region': 'category', 'VMT': VMT, 'Change': RATE}
+
+FUNCTIONAL_CLASS = {
+    'Month': MONTH_DTYPE,
+    'Year': 'int16',
+    **{f'{system} VMT (Billion)': VMT for system in FUNCTIONAL_SYSTEMS},
+}
+
+REGIONAL_VMT = {
+    'Month': MONTH_DTYPE,
+    'Year': 'int16',
+    'Region': 'category',
+    'VMT (Billion)': VMT,
+    'Change From Last Year (%)': RATE,
+}
+
+ECONOMIC = {
+    'GDP in billions of current dollars': CompactFloat(1),
+    'Monthly Labor Participation Rate': CompactFloat(1),
+    'CPI': CompactFloat(3),
+    'Inflation': CompactFloat(6),
+    'Monthly Unemployment rate': CompactFloat(1),
+    'Monthly Unemployment in tenth': 'Int16',
+}
+
+SCHEMAS = {
+    'state_miles_extract': STATE_MILES_EXTRACT,
+    'national_extract': NATIONAL_EXTRACT,
+    'state_miles': STATE_MILES,
+    'state_miles_grid': STATE_MILES_GRID,
+    'tvt_data': TVT_DATA,
+    'functional_class_extract': FUNCTIONAL_CLASS_EXTRACT,
+    'regional_extract': REGIONAL_EXTRACT,
+    'functional_class': FUNCTIONAL_CLASS,
+    'regional_vmt': REGIONAL_VMT,
+    'economic': ECONOMIC,
+    'db': {**STATE_MILES, **TVT_DATA, **ECONOMIC},
+}
+
+
+def apply_schema(df: pd.DataFrame, table: str) -> pd.DataFrame:
+    """Cast the columns of `df` that appear in the table's schema; other columns are left alone."""
+    schema = SCHEMAS[table]
+    out = df.copy()
+    for col, dtype in schema.items():
+        if col in out.columns:
+            out[col] = _cast(out[col], dtype)
+    return out
+
+
+def widen_floats(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    float32 columns as the float64 of their shortest decimal form, for writing: to_csv prints float32
+    values in exponent form (1.512965e+06) where the published tables have plain decimals (1512965.0).
+    """
+    narrow = [c for c in df.columns if df[c].dtype == 'float32']
+    if not narrow:
+        return df
+    out = df.copy()
+    for col in narrow:
+        out[col] = out[col].to_numpy().astype(str).astype('float64')
+    return out
+
+
+def memory_bytes(df: pd.DataFrame) -> int:
+    """Deep in-memory size of a frame, for the run report."""
+    return int(df.memory_usage(deep=True).sum())
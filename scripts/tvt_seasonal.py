@@ -0,0 +1,256 @@
+# Seasonal adjustment of the state and national VMT series.
+# Every series (All / Rural Arterial / Urban Arterial Miles for each state, plus national Total VMT) is
+# laid out as one row of a series × month matrix and decomposed in a single batched NumPy pass
+# (classical multiplicative decomposition with a moving seasonal filter, X-11 style):
+#   1. trend     centred 2×12 moving average
+#   2. ratios    value / trend
+#   3. factors   per calendar month, the median ratio over a 5-year window centred on the year
+#                (robust to one-off shocks such as April 2020), normalised to average 1 within each year
+#   4. adjusted  value / factor
+# A factor depends only on values within FACTOR_REACH months of its own month, so when new months
+# arrive (or a backfill revises old ones) only the factors from FACTOR_REACH months before the first
+# changed month onward are recomputed; older factors come from the cache.
+#
+# Outputs (published as a snapshot next to the merged files):
+#   merged_tvt_state_miles_sa.csv   Date, Month, Year, State, <measure> SA, <measure> Seasonal Factor
+#   merged_tvt_data_sa.csv          Date, Month, Year, Total VMT (Million) SA, ... Seasonal Factor
+
+import os
+import pickle
+import uuid
+import warnings
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import tvt_frames
+import tvt_snapshot
+import tvt_profile
+from tvt_metrics import RunMetrics
+from tvt_dates import key_from_abbr, key_year, month_key, format_mdy, format_abbr
+
+BASE_DIR = os.getenv('AIRFLOW_HOME', '/opt/airflow')
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+PROCESSED_DIR = os.getenv('TVT_PROC_DIR', os.path.join(DATA_DIR, 'tvt', 'processed'))
+STATE_MILES_CSV = os.getenv('STATE_MILES_CSV', os.path.join(PROCESSED_DIR, 'merged_tvt_state_miles.csv'))
+NATIONAL_VMT_CSV = os.getenv('NATIONAL_VMT_CSV', os.path.join(PROCESSED_DIR, 'merged_tvt_data.csv'))
+STATE_SA_CSV = os.path.join(PROCESSED_DIR, 'merged_tvt_state_miles_sa.csv')
+NATIONAL_SA_CSV = os.path.join(PROCESSED_DIR, 'merged_tvt_data_sa.csv')
+CACHE_PATH = os.getenv('TVT_SEASONAL_CACHE', os.path.join(PROCESSED_DIR, 'seasonal', 'factors.pkl'))
+
+STATE_MEASURES = ['All Miles', 'Rural Arterial Miles', 'Urban Arterial Miles']
+NATIONAL_MEASURE = 'Total VMT (Million)'
+NATIONAL = ''  # State label of the national series inside the matrix
+# Older reports spell some states differently; their rows are filed under the current name
+STATE_ALIASES = {'Dist Of Columbia': 'District of Columbia'}
+# Rows of the state table that sum other rows rather than report a state
+AGGREGATE_ROWS = {'Subtotal', 'Total'}
+
+# Years on each side of a year in the seasonal filter (5-year window)
+FILTER_YEARS = 2
+# Ratios (years) a factor needs in its window; calendar months with fewer take the previous year's factor
+MIN_YEARS = 2
+# A factor depends on ratios up to FILTER_YEARS away, and each ratio on values up to 6 months away
+FACTOR_REACH = 12 * FILTER_YEARS + 6
+
+# 2×12 centred moving-average weights
+TREND_WEIGHTS = np.r_[0.5, np.ones(11), 0.5] / 12
+
+
+def state_rows(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    The rows of the state table that report a state, each under one name: aggregate rows are dropped
+    and aliases renamed. A month reported under both names keeps the current name's values, with the
+    cells it lacks filled from the alias row.
+    """
+    names = df['State'].astype(str)
+    df = df[~names.isin(AGGREGATE_ROWS)].assign(State=names.replace(STATE_ALIASES))
+    alias = names[df.index].isin(list(STATE_ALIASES))
+    if not alias.any():
+        return df
+    df = pd.concat([df[~alias], df[alias]])
+    return df.groupby(['State', 'Year', 'Month'], sort=False).first().reset_index()
+
+
+def load_matrix(state_path: str = STATE_MILES_CSV, national_path: str = NATIONAL_VMT_CSV) -> tuple:
+    """
+    (labels, keys, values): one row per (state, measure) series plus the national series, over a
+    month axis that runs from January of the first year to December of the last. Only actual states
+    are series (see state_rows).
+    """
+    state = state_rows(tvt_frames.read_csv(tvt_snapshot.resolve(state_path)))
+    state['MonthKey'] = key_from_abbr(state['Year'], state['Month'])
+    national = tvt_frames.read_csv(tvt_snapshot.resolve(national_path))
+    national['MonthKey'] = key_from_abbr(national['Year'], national['Month'])
+    national['State'] = NATIONAL
+
+    first = month_key(key_year(min(state['MonthKey'].min(), national['MonthKey'].min())), 1)
+    last = month_key(key_year(max(state['MonthKey'].max(), national['MonthKey'].max())), 12)
+    keys = np.arange(first, last + 1)
+
+    long = pd.concat([
+        state.melt(id_vars=['State', 'MonthKey'], value_vars=STATE_MEASURES, var_name='Measure'),
+        national.melt(id_vars=['State', 'MonthKey'], value_vars=[NATIONAL_MEASURE], var_name='Measure'),
+    ])
+    wide = long.pivot_table(index=['State', 'Measure'], columns='MonthKey', values='value', aggfunc='last')
+    wide = wide.reindex(columns=keys)
+    # Series with no values at all (e.g. Rural Arterial Miles of DC) are dropped
+    wide = wide[wide.notna().any(axis=1)]
+    return list(wide.index), keys, wide.to_numpy(dtype='float64')
+
+
+def seasonal_factors(values: np.ndarray) -> np.ndarray:
+    """Seasonal factors for a series × month matrix whose month axis starts in January and spans whole years."""
+    n_series, n_months = values.shape
+    # 1) Trend: 2×12 centred moving average; months without a full window stay NaN
+    padded = np.pad(values, ((0, 0), (6, 6)), constant_values=np.nan)
+    trend = np.lib.stride_tricks.sliding_window_view(padded, 13, axis=1) @ TREND_WEIGHTS
+    # 2) Seasonal-irregular ratios
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratios = np.where(trend > 0, values / trend, np.nan)
+    # 3) Moving seasonal filter: median per calendar month over a centred window of years
+    by_year = ratios.reshape(n_series, n_months // 12, 12)
+    window = 2 * FILTER_YEARS + 1
+    padded = np.pad(by_year, ((0, 0), (FILTER_YEARS, FILTER_YEARS), (0, 0)), constant_values=np.nan)
+    windows = np.lib.stride_tricks.sliding_window_view(padded, window, axis=1)
+    enough = np.sum(~np.isnan(windows), axis=-1) >= MIN_YEARS
+    with np.errstate(all='ignore'), warnings.catch_warnings():
+        # Series without data in a window give all-NaN slices; those factors stay NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        factors = np.where(enough, np.nanmedian(windows, axis=-1), np.nan)
+        # The newest months have no centred trend yet: carry each calendar month's last factor forward
+        years = np.arange(factors.shape[1])[None, :, None]
+        last_valid = np.maximum.accumulate(np.where(np.isnan(factors), 0, years), axis=1)
+        factors = np.take_along_axis(factors, last_valid, axis=1)
+        # Normalise so the factors of each year average to 1
+        factors = factors / np.nanmean(factors, axis=2, keepdims=True)
+    factors = factors.reshape(n_series, n_months)
+    # Factors are only reported for observed months
+    factors[np.isnan(values)] = np.nan
+    return factors
+
+
+def _load_cache(path: str = CACHE_PATH) -> dict | None:
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def _save_cache(cache: dict, path: str = CACHE_PATH) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.tmp-{uuid.uuid4().hex[:6]}'
+    with open(tmp, 'wb') as f:
+        pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def first_changed_month(cache: dict, labels: list, keys: np.ndarray, values: np.ndarray) -> int | None:
+    """Month key of the first value that differs from the cached inputs (None if nothing changed)."""
+    if cache['labels'] != labels or cache['keys'][0] != keys[0]:
+        return int(keys[0])
+    old = cache['values']
+    n = min(old.shape[1], values.shape[1])
+    same = (old[:, :n] == values[:, :n]) | (np.isnan(old[:, :n]) & np.isnan(values[:, :n]))
+    changed = np.flatnonzero(~same.all(axis=0))
+    if len(changed):
+        return int(keys[changed[0]])
+    if values.shape[1] != old.shape[1]:
+        return int(keys[n]) if values.shape[1] > n else int(keys[-1])
+    return None
+
+
+def update_factors(labels: list, keys: np.ndarray, values: np.ndarray,
+                   full: bool = False, metrics: RunMetrics | None = None) -> np.ndarray | None:
+    """Factors for the whole matrix, recomputing only what new or revised months can affect (None: unchanged)."""
+    cache = None if full else _load_cache()
+    changed = int(keys[0]) if cache is None else first_changed_month(cache, labels, keys, values)
+    if changed is None:
+        if metrics:
+            metrics.incr('cache_hits')
+        return None
+
+    # First year whose factors can move, and the input slice that fully determines them
+    start = month_key(key_year(max(changed - FACTOR_REACH, int(keys[0]))), 1)
+    fit_from = max(month_key(key_year(start) - FILTER_YEARS - 1, 1), int(keys[0]))
+    i_start, i_fit = start - int(keys[0]), fit_from - int(keys[0])
+
+    factors = np.full(values.shape, np.nan)
+    if cache is not None and i_start > 0:
+        factors[:, :i_start] = cache['factors'][:, :i_start]
+    factors[:, i_start:] = seasonal_factors(values[:, i_fit:])[:, i_start - i_fit:]
+
+    recomputed = values.shape[1] - i_start
+    print(f'▶ Seasonal factors: {len(labels)} series, recomputed {recomputed} of {values.shape[1]} months '
+          f'(from {format_mdy([start])[0]})')
+    if metrics:
+        metrics.incr('months_recomputed', recomputed)
+    _save_cache({'labels': labels, 'keys': keys, 'values': values, 'factors': factors})
+    return factors
+
+
+def build_outputs(labels: list, keys: np.ndarray, values: np.ndarray, factors: np.ndarray) -> tuple:
+    """State and national adjusted tables, one row per observed month."""
+    index = pd.MultiIndex.from_tuples(labels, names=['State', 'Measure'])
+    with np.errstate(invalid='ignore'):
+        adjusted = values / factors
+    long = pd.DataFrame({
+        'State': index.get_level_values('State').repeat(len(keys)),
+        'Measure': index.get_level_values('Measure').repeat(len(keys)),
+        'MonthKey': np.tile(keys, len(labels)),
+        'SA': adjusted.ravel(),
+        'Seasonal Factor': factors.ravel(),
+        'observed': ~np.isnan(values.ravel()),
+    })
+    long = long[long['observed']]
+    long['SA'] = long['SA'].round(3)
+    long['Seasonal Factor'] = long['Seasonal Factor'].round(5)
+
+    wide = long.pivot(index=['State', 'MonthKey'], columns='Measure', values=['SA', 'Seasonal Factor'])
+    wide.columns = [f'{measure} {kind}' for kind, measure in wide.columns]
+    wide = wide.reset_index().sort_values(['MonthKey', 'State'])
+    wide.insert(0, 'Date', format_mdy(wide['MonthKey']))
+    wide.insert(1, 'Month', format_abbr(wide['MonthKey']))
+    wide.insert(2, 'Year', key_year(wide['MonthKey']))
+
+    def table(df, measures, keep_state):
+        cols = ['Date', 'Month', 'Year'] + (['State'] if keep_state else [])
+        cols += [f'{m} {kind}' for m in measures for kind in ('SA', 'Seasonal Factor') if f'{m} {kind}' in df.columns]
+        return df[cols].reset_index(drop=True)
+
+    state = table(wide[wide['State'] != NATIONAL], STATE_MEASURES, True)
+    national = table(wide[wide['State'] == NATIONAL], [NATIONAL_MEASURE], False)
+    return state, national
+
+
+def main(argv: list | None = None) -> None:
+    parser = argparse.ArgumentParser(description='Seasonally adjust the state and national VMT series.')
+    parser.add_argument('--full', action='store_true', help='ignore cached factors and recompute every month')
+    args = parser.parse_args(argv)
+
+    metrics = RunMetrics('seasonal_adjust')
+    with metrics.run():
+        with metrics.phase('parse'):
+            labels, keys, values = load_matrix()
+        metrics.incr('rows_in', int(np.sum(~np.isnan(values))))
+        with metrics.phase('consolidate'):
+            factors = update_factors(labels, keys, values, full=args.full, metrics=metrics)
+        outputs_exist = all(os.path.exists(p) for p in (STATE_SA_CSV, NATIONAL_SA_CSV))
+        if factors is None and outputs_exist:
+            print('✔ Inputs unchanged since the last run; seasonal outputs are current')
+            return
+        if factors is None:
+            factors = _load_cache()['factors']
+        with metrics.phase('consolidate'):
+            state, national = build_outputs(labels, keys, values, factors)
+        with metrics.phase('write'):
+            snapshot = tvt_snapshot.publish({STATE_SA_CSV: state, NATIONAL_SA_CSV: national},
+                                            meta={'stage': 'seasonal_adjust'})
+        metrics.incr('rows_out', len(state) + len(national))
+        metrics.set_info(series=len(labels), snapshot=snapshot)
+        print(f'✅ Seasonally adjusted {len(labels)} series → {STATE_SA_CSV}, {NATIONAL_SA_CSV}')
+
+
+if __name__ == '__main__':
+    tvt_profile.run(main)
@@ -0,0 +1,258 @@
+# Versioned snapshot publishing for the processed TVT outputs.
+# Every publish writes a complete, immutable snapshot directory under data/tvt/processed/snapshots/
+# and then atomically swaps the `current` symlink to it. The legacy paths (merged_*.csv) become
+# symlinks into `current`, so readers keep opening the same file names while a rebuild is in progress.
+# Unchanged outputs are carried into the new snapshot as hard links, so a publish only costs the new files.
+# Publishes are serialized by the 'publish' lock (tvt_locks.py), so a snapshot always carries forward the
+# outputs of the one before it, even when runs overlap.
+#
+# Usage:
+#   python tvt_snapshot.py list
+#   python tvt_snapshot.py current                    # id of the current snapshot (empty before the first)
+#   python tvt_snapshot.py rollback [<snapshot_id>]   # default: parent of the current snapshot
+#   python tvt_snapshot.py prune
+
+import os
+import sys
+import json
+import shutil
+import time
+import uuid
+from datetime import datetime
+
+import tvt_locks
+from tvt_schema import widen_floats
+
+BASE_DIR = os.getenv('AIRFLOW_HOME', '/opt/airflow')
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+PROCESSED_DIR = os.getenv('TVT_PROC_DIR', os.path.join(DATA_DIR, 'tvt', 'processed'))
+SNAPSHOT_DIR = os.getenv('TVT_SNAPSHOT_DIR', os.path.join(PROCESSED_DIR, 'snapshots'))
+CURRENT_LINK = os.path.join(PROCESSED_DIR, 'current')
+# Number of published snapshots to retain (the current one is always kept)
+KEEP_SNAPSHOTS = int(os.getenv('TVT_SNAPSHOT_KEEP', '12'))
+
+MANIFEST_NAME = 'manifest.json'
+
+
+def _new_snapshot_id() -> str:
+    """Sortable, collision-free snapshot id, e.g. 20250701T120000-1a2b3c."""
+    return f"{datetime.now().strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+
+def _atomic_symlink(target: str, link_path: str) -> None:
+    """Point link_path at target, replacing whatever is there in a single rename."""
+    tmp = f'{link_path}.tmp-{uuid.uuid4().hex[:6]}'
+    os.symlink(target, tmp)
+    os.replace(tmp, link_path)
+
+
+def current_snapshot() -> str | None:
+    """Return the directory of the currently published snapshot, or None before the first publish."""
+    if not os.path.islink(CURRENT_LINK):
+        return None
+    return os.path.realpath(CURRENT_LINK)
+
+
+def list_snapshots() -> list:
+    """Published snapshot ids, oldest first."""
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return []
+    return sorted(
+        d for d in os.listdir(SNAPSHOT_DIR)
+        if not d.startswith('.') and os.path.isdir(os.path.join(SNAPSHOT_DIR, d))
+    )
+
+
+def read_manifest(snapshot_dir: str) -> dict:
+    """Load the manifest of a snapshot directory."""
+    with open(os.path.join(snapshot_dir, MANIFEST_NAME)) as f:
+        return json.load(f)
+
+
+def pin() -> str | None:
+    """
+    Pin the current snapshot for a multi-file read.
+
+    Resolve every input against the returned directory (see `resolve`) so that a
+    publish happening mid-read cannot mix files from two different builds.
+    """
+    return current_snapshot()
+
+
+def resolve(path: str, snapshot_dir: str | None = None) -> str:
+    """Map a legacy output path (e.g. merged_tvt_data.csv) to its file inside a snapshot."""
+    snapshot_dir = snapshot_dir or current_snapshot()
+    if snapshot_dir:
+        candidate = os.path.join(snapshot_dir, os.path.basename(path))
+        if os.path.exists(candidate):
+            return candidate
+    return path
+
+
+def file_info(path: str, snapshot_dir: str | None = None) -> dict:
+    """Manifest entry of an output in a snapshot (rows, producing snapshot, completeness, ...)."""
+    snapshot_dir = snapshot_dir or current_snapshot()
+    if not snapshot_dir:
+        return {}
+    return read_manifest(snapshot_dir)['files'].get(os.path.basename(path), {})
+
+
+def _legacy_files() -> list:
+    """Regular CSVs written by earlier, pre-snapshot runs that the first snapshot should adopt."""
+    if not os.path.isdir(PROCESSED_DIR):
+        return []
+    return [
+        os.path.join(PROCESSED_DIR, f) for f in sorted(os.listdir(PROCESSED_DIR))
+        if f.endswith('.csv') and not os.path.islink(os.path.join(PROCESSED_DIR, f))
+        and os.path.isfile(os.path.join(PROCESSED_DIR, f))
+    ]
+
+
+def _carry_over(src: str, dest: str) -> None:
+    """Hard-link an unchanged file into the staging snapshot, copying across filesystems."""
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copy2(src, dest)
+
+
+def publish(tables: dict, meta: dict | None = None, file_meta: dict | None = None) -> str:
+    """
+    Publish a new snapshot containing `tables` plus every other file of the current one.
+
+    `tables` maps each output's legacy path (e.g. OUTPUT_CSV) to the DataFrame to write;
+    `file_meta` optionally maps the same paths to extra manifest fields for that file
+    (e.g. its completeness flag), which are carried forward with the file.
+    Returns the new snapshot id.
+    """
+    file_meta = {os.path.basename(p): m for p, m in (file_meta or {}).items()}
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    snap_id = _new_snapshot_id()
+    staging = os.path.join(SNAPSHOT_DIR, f'.staging-{snap_id}')
+    os.makedirs(staging)
+
+    # 1) Write the new outputs (outside the lock: this is the slow part)
+    new_names = {os.path.basename(p) for p in tables}
+    written = {}
+    for path, df in tables.items():
+        name = os.path.basename(path)
+        widen_floats(df).to_csv(os.path.join(staging, name), index=False)
+        written[name] = {'snapshot': snap_id, 'rows': int(len(df)), **file_meta.get(name, {})}
+
+    with tvt_locks.lock('publish'):
+        parent_dir = current_snapshot()
+        parent = read_manifest(parent_dir) if parent_dir else {'id': None, 'files': {}}
+        files = {}
+
+        # 2) Carry forward unchanged outputs of the snapshot current at the swap
+        inherited = (
+            [os.path.join(parent_dir, f) for f in parent['files']] if parent_dir else _legacy_files()
+        )
+        for src in inherited:
+            name = os.path.basename(src)
+            if name in new_names or not os.path.exists(src):
+                continue
+            _carry_over(src, os.path.join(staging, name))
+            files[name] = parent['files'].get(name, {'snapshot': None})
+        files.update(written)
+
+        manifest = {
+            'id': snap_id,
+            'parent': parent['id'],
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'files': files,
+            'meta': meta or {},
+        }
+        with open(os.path.join(staging, MANIFEST_NAME), 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+        # 3) Seal the snapshot and swap the pointer
+        final_dir = os.path.join(SNAPSHOT_DIR, snap_id)
+        os.rename(staging, final_dir)
+        _atomic_symlink(os.path.relpath(final_dir, PROCESSED_DIR), CURRENT_LINK)
+
+        # 4) Keep legacy paths working: each output path becomes a link into `current`
+        for path in list(tables) + [os.path.join(PROCESSED_DIR, n) for n in files if n not in new_names]:
+            name = os.path.basename(path)
+            target = os.path.relpath(os.path.join(CURRENT_LINK, name), os.path.dirname(path))
+            if os.path.islink(path) and os.readlink(path) == target:
+                continue
+            _atomic_symlink(target, path)
+
+        # Under the lock, so concurrent publishers never prune the same snapshot twice
+        removed = _prune()
+    for old_id in removed:
+        print(f'⚠ Pruned snapshot {old_id}')
+    print(f'✔ Published snapshot {snap_id} ({", ".join(sorted(new_names))})')
+    return snap_id
+
+
+def rollback(snap_id: str | None = None) -> str:
+    """Re-point `current` at an earlier snapshot (default: the parent of the current one)."""
+    if snap_id is None:
+        cur = current_snapshot()
+        if cur is None:
+            raise RuntimeError('No snapshot has been published yet')
+        snap_id = read_manifest(cur)['parent']
+        if snap_id is None:
+            raise RuntimeError(f'Snapshot {os.path.basename(cur)} has no parent to roll back to')
+    target = os.path.join(SNAPSHOT_DIR, snap_id)
+    if not os.path.isdir(target):
+        raise RuntimeError(f'Snapshot {snap_id} not found (pruned?)')
+    with tvt_locks.lock('publish'):
+        _atomic_symlink(os.path.relpath(target, PROCESSED_DIR), CURRENT_LINK)
+    print(f'✔ Rolled back to snapshot {snap_id}')
+    return snap_id
+
+
+def _prune(keep: int = KEEP_SNAPSHOTS) -> list:
+    """prune() for a caller that holds the publish lock."""
+    cur = current_snapshot()
+    removed = []
+    for snap_id in list_snapshots()[:-keep] if keep > 0 else []:
+        path = os.path.join(SNAPSHOT_DIR, snap_id)
+        if cur and os.path.realpath(path) == cur:
+            continue
+        # A snapshot already gone (removed by hand or by a run without the lock) is not an error
+        shutil.rmtree(path, ignore_errors=True)
+        removed.append(snap_id)
+    # Staging dirs left behind by crashed publishers (a day old, so never a live publish)
+    if os.path.isdir(SNAPSHOT_DIR):
+        for d in os.listdir(SNAPSHOT_DIR):
+            path = os.path.join(SNAPSHOT_DIR, d)
+            if d.startswith('.staging-') and time.time() - os.path.getmtime(path) > 86400:
+                shutil.rmtree(path, ignore_errors=True)
+    return removed
+
+
+def prune(keep: int = KEEP_SNAPSHOTS) -> list:
+    """Delete all but the newest `keep` snapshots, never touching the current one."""
+    with tvt_locks.lock('publish'):
+        removed = _prune(keep)
+    for snap_id in removed:
+        print(f'⚠ Pruned snapshot {snap_id}')
+    return removed
+
+
+def main() -> None:
+    cmd = sys.argv[1] if len(sys.argv) > 1 else 'list'
+    if cmd == 'list':
+        cur = current_snapshot()
+        for snap_id in list_snapshots():
+            manifest = read_manifest(os.path.join(SNAPSHOT_DIR, snap_id))
+            marker = '*' if cur and os.path.basename(cur) == snap_id else ' '
+            print(f"{marker} {snap_id}  parent={manifest['parent']}  files={', '.join(sorted(manifest['files']))}")
+    elif cmd == 'current':
+        cur = current_snapshot()
+        print(os.path.basename(cur) if cur else '')
+    elif cmd == 'rollback':
+        rollback(sys.argv[2] if len(sys.argv) > 2 else None)
+    elif cmd == 'prune':
+        prune()
+    else:
+        print('usage: tvt_snapshot.py [list|current|rollback [<snapshot_id>]|prune]')
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+# Local stand-in for the FHWA, BLS and BEA endpoints, replaying recorded fixtures.
+# Point TVT_BASE_PAGE / BLS_API_URL / BEA_API_URL at it and the ingest scripts run without network:
+#   GET  /tvt.cfm                     sample TVT listing page linking every fixture workbook
+#   GET  /files/tvt<mon><yy>.xlsx     a workbook from the fixture raw dir, under the name FHWA publishes it
+#                                     as (the fixtures hold data_prep.py's renamed <yy><mon>tvt.xlsx copies)
+#   POST /bls/                        the recorded BLS data of the requested series and years
+#                                     (data/bls/*/*.json, matched on seriesID); like BLS, a range beyond
+#                                     the per-query limit (tvt_http.BLS_YEARS) is cut short with a message
+#   GET  /bea/                        a BEA NIPA response rebuilt from data/bea/gdp/gdp_current_bil.csv
+# Fixtures come from the repository's data/ directory (TVT_STANDIN_FIXTURES). Every response can be
+# delayed (--delay) to emulate network latency; request counts are served at /hits.
+#
+# Usage:
+#   python tvt_standin.py [--port 8000] [--years 2023:2025] [--delay 0.05]
+
+import os
+import re
+import sys
+import glob
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import pandas as pd
+
+from tvt_http import BLS_YEARS
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURE_DIR = os.getenv('TVT_STANDIN_FIXTURES', os.path.join(os.path.dirname(SCRIPTS_DIR), 'data'))
+
+WORKBOOK_RE = re.compile(r'^(?P<yy>\d{2})(?P<mon>[a-z]{3,4})tvt\.xlsx$', re.IGNORECASE)
+
+LISTING_PAGE = """<!DOCTYPE html>
+<html lang="en">
+<head><title>Traffic Volume Trends - Travel Monitoring - Policy | Federal Highway Administration</title></head>
+<body>
+<h1>Traffic Volume Trends</h1>
+<p>Traffic Volume Trends is a monthly report based on hourly traffic count data reported by the States.</p>
+<table class="datatable">
+<thead><tr><th>Report</th><th>Download</th></tr></thead>
+<tbody>
+{rows}
+</tbody>
+</table>
+</body>
+</html>
+"""
+
+
+def _year_range(text: str | None) -> tuple:
+    if not text:
+        return 0, 9999
+    first, _, last = text.partition(':')
+    return int(first), int(last or first)
+
+
+class Fixtures:
+    """Recorded responses, loaded once."""
+
+    def __init__(self, root: str = FIXTURE_DIR, years: str | None = None):
+        self.root = root
+        first, last = _year_range(years)
+        raw_dir = os.path.join(root, 'tvt', 'raw')
+        # Published name (tvtapr24.xlsx) -> fixture workbook (24aprtvt.xlsx)
+        self.workbooks = {}
+        for name in sorted(os.listdir(raw_dir)) if os.path.isdir(raw_dir) else []:
+            m = WORKBOOK_RE.match(name)
+            if m and first <= 2000 + int(m.group('yy')) <= last:
+                self.workbooks[f"tvt{m.group('mon').lower()}{m.group('yy')}.xlsx"] = os.path.join(raw_dir, name)
+        # seriesID -> {(year, period): recorded observation}
+        self.bls = {}
+        for path in glob.glob(os.path.join(root, 'bls', '*', '*.json')):
+            with open(path) as f:
+                data = json.load(f)
+            for series in data.get('Results', {}).get('series', []):
+                self.bls.setdefault(series['seriesID'], {}).update(
+                    {(r['year'], r['period']): r for r in series['data']})
+        gdp_csv = os.path.join(root, 'bea', 'gdp', 'gdp_current_bil.csv')
+        self.bea = self._bea_response(pd.read_csv(gdp_csv)) if os.path.exists(gdp_csv) else None
+
+    def bls_response(self, body: dict) -> dict:
+        """BLS v2 answer to a timeseries query, with BLS's year limit and messages."""
+        first = int(body.get('startyear') or 0)
+        last = int(body.get('endyear') or 9999)
+        limit = BLS_YEARS[bool(body.get('registrationKey'))]
+        messages, series = [], []
+        if last - first + 1 > limit:
+            last = first + limit - 1
+            messages.append(f'Year range has been reduced to the system-allowed limit of {limit} years.')
+        for sid in body.get('seriesid') or []:
+            if sid not in self.bls:
+                messages.append(f'Series does not exist for Series {sid}')
+                continue
+            data = [r for r in self.bls[sid].values() if first <= int(r['year']) <= last]
+            if not data:
+                messages.append(f'No Data Available for Series {sid} Year: {first}-{last}')
+            series.append({'seriesID': sid, 'data': data})
+        status = 'REQUEST_SUCCEEDED' if series else 'REQUEST_NOT_PROCESSED'
+        return {'status': status, 'responseTime': 1, 'message': messages, 'Results': {'series': series}}
+
+    @staticmethod
+    def _bea_response(gdp: pd.DataFrame) -> dict:
+        """A NIPA T10105 GetData response carrying the recorded quarterly GDP (in millions, as BEA sends it)."""
+        rows = [
+            {'TableName': 'T10105', 'SeriesCode': 'A191RC', 'LineNumber': '1', 'LineDescription': 'Gross domestic product',
+             'TimePeriod': q.replace(' ', ''), 'METRIC_NAME': 'Current Dollars', 'CL_UNIT': 'Level', 'UNIT_MULT': '6',
+             'DataValue': f'{round(v * 1000):,}', 'NoteRef': 'T10105'}
+            for q, v in zip(gdp['Quarter'], gdp['GDP in billions of current dollars'])
+        ]
+        return {'BEAAPI': {'Request': {'RequestParam': []}, 'Results': {'Statistic': 'NIPA Table', 'Data': rows}}}
+
+    def listing(self) -> str:
+        rows = '\n'.join(
+            f'<tr><td>{name[3:-7].capitalize()} 20{name[-7:-5]}</td>'
+            f'<td><a href="files/{name}">{name}</a></td></tr>'
+            for name in self.workbooks
+        )
+        return LISTING_PAGE.format(rows=rows)
+
+
+class StandIn:
+    """ThreadingHTTPServer serving the fixtures in a background thread."""
+
+    def __init__(self, fixtures: Fixtures, port: int = 0, delay: float = 0.0):
+        self.fixtures = fixtures
+        self.delay = delay
+        self.hits = {}
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self.port = self.server.server_address[1]
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        return f'http://127.0.0.1:{self.port}'
+
+    def env(self) -> dict:
+        """Environment that points the ingest scripts at this stand-in."""
+        return {
+            'TVT_BASE_PAGE': f'{self.base_url}/tvt.cfm',
+            'BLS_API_URL': f'{self.base_url}/bls/',
+            'BEA_API_URL': f'{self.base_url}/bea/',
+            # Any key will do; with one the BLS scripts use the registered per-query limits
+            'API_KEY_BLS': 'standin',
+        }
+
+    def start(self) -> 'StandIn':
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _count(self, path: str) -> None:
+        with self._lock:
+            self.hits[path] = self.hits.get(path, 0) + 1
+
+    def _handler(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, code: int, body: bytes, ctype: str = 'application/json') -> None:
+                self.send_response(code)
+                self.send_header('Content-Type', ctype)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                path = urlsplit(self.path).path
+                standin._count(path)
+                time.sleep(standin.delay)
+                fx = standin.fixtures
+                if path == '/tvt.cfm':
+                    return self._send(200, fx.listing().encode(), 'text/html; charset=utf-8')
+                if path.startswith('/files/') and os.path.basename(path) in fx.workbooks:
+                    with open(fx.workbooks[os.path.basename(path)], 'rb') as f:
+                        body = f.read()
+                    return self._send(200, body, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+                if path == '/bea/' and fx.bea is not None:
+                    return self._send(200, json.dumps(fx.bea).encode())
+                if path == '/hits':
+                    return self._send(200, json.dumps(standin.hits).encode())
+                self._send(404, b'{"error": "not found"}')
+
+            def do_POST(self):
+                path = urlsplit(self.path).path
+                standin._count(path)
+                time.sleep(standin.delay)
+                if path != '/bls/':
+                    return self._send(404, b'{"error": "not found"}')
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                self._send(200, json.dumps(standin.fixtures.bls_response(body)).encode())
+
+        return Handler
+
+
+def main(argv: list | None = None) -> None:
+    parser = argparse.ArgumentParser(description='Serve recorded FHWA/BLS/BEA fixtures locally.')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--years', help='only list workbooks of report years FIRST[:LAST]')
+    parser.add_argument('--delay', type=float, default=0.0, help='seconds added to every response')
+    args = parser.parse_args(argv)
+
+    fixtures = Fixtures(years=args.years)
+    standin = StandIn(fixtures, args.port, args.delay)
+    print(f'▶ Stand-in on {standin.base_url}: {len(fixtures.workbooks)} workbooks, '
+          f'BLS series {", ".join(sorted(fixtures.bls)) or "none"}, BEA {"yes" if fixtures.bea else "no"}')
+    for key, value in standin.env().items():
+        print(f'  export {key}={value}')
+    try:
+        standin.server.serve_forever()
+    except KeyboardInterrupt:
+        standin.stop()
+        sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,381 @@
+# Synthetic TVT workbooks and merged tables for scale and stress testing.
+# Workbooks are written in each historical layout the readers handle (the per-year sheet / column /
+# row-offset variants of read_state_miles and read_excel_data, including one-off months such as
+# December 2002 and April-December 2007), so they go through the real readers unchanged. Values are
+# a deterministic function of (state, measure, month): every report agrees with the others about the
+# months they share, just like the real revision chain, and `check` can verify a workbook by reading it
+# back and comparing with the expected frame.
+#
+# Knobs: number of files (beyond one per report month, further copies go to copy<NN>/ sub-directories),
+# states per sheet (up to the 51 rows a layout's read window holds), extra detail rows below the read
+# window (bigger sheets), and for the merged tables any number of states and months.
+#
+# Usage:
+#   python tvt_synth.py workbooks <dir> [--files N] [--states N] [--extra-rows N] [--seed S]
+#   python tvt_synth.py tables <dir> [--states N] [--months N] [--seed S]
+#   python tvt_synth.py check                 # one workbook per layout variant through the real readers
+
+import os
+import sys
+import zlib
+import argparse
+import tempfile
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+from tvt_dates import MONTH_ABBRS, month_key, key_year, key_month, format_mdy, format_abbr, format_iso
+
+FIRST_YEAR, LAST_YEAR = 2002, 2025
+MONTH_CODES = [m.lower() for m in MONTH_ABBRS]
+MEASURES = ('Rural', 'Urban', 'All')
+# Rows of a state sheet's read window that hold states (the rest are region headers and subtotals)
+STATE_SLOTS = 51
+
+# Real state names, in the order the TVT tables list them; further synthetic states are numbered
+STATE_NAMES = [
+    'Connecticut', 'Maine', 'Massachusetts', 'New Hampshire', 'New Jersey', 'New York', 'Pennsylvania',
+    'Rhode Island', 'Vermont', 'Delaware', 'District of Columbia', 'Florida', 'Georgia', 'Maryland',
+    'North Carolina', 'South Carolina', 'Virginia', 'West Virginia', 'Illinois', 'Indiana', 'Iowa',
+    'Kansas', 'Michigan', 'Minnesota', 'Missouri', 'Nebraska', 'North Dakota', 'Ohio', 'South Dakota',
+    'Wisconsin', 'Alabama', 'Arkansas', 'Kentucky', 'Louisiana', 'Mississippi', 'Oklahoma', 'Tennessee',
+    'Texas', 'Alaska', 'Arizona', 'California', 'Colorado', 'Hawaii', 'Idaho', 'Montana', 'Nevada',
+    'New Mexico', 'Oregon', 'Utah', 'Washington', 'Wyoming',
+]
+
+
+def state_names(n: int) -> list:
+    return STATE_NAMES[:n] + [f'State {i + 1:05d}' for i in range(len(STATE_NAMES), n)]
+
+
+# --- Layouts (mirror read_state_miles / read_excel_data; `check` catches any drift) -------------------
+
+def state_layout(year: int, month: int) -> dict:
+    """Sheets, 0-based columns and read window of the state miles tables in a report."""
+    from merge_tvt_page456 import get_excluded_rows
+    if year <= 2003:
+        cols = [1, 2, 3, 4, 6, 7, 8] if (year, month) == (2002, 12) else [2, 3, 4, 5, 7, 8, 9]
+        return {'sheets': {3: 'Rural'}, 'cols': cols, 'skiprows': 7, 'max_row': 70 if year == 2002 else 71,
+                'excluded': get_excluded_rows(year)}
+    cols = [0, 1, 2, 3, 5, 6, 7] if (year == 2007 and month >= 4) else [0, 3, 4, 5, 7, 8, 9]
+    early = year <= 2007
+    return {'sheets': {3: 'Rural', 4: 'Urban', 5: 'All'}, 'cols': cols, 'skiprows': 6 if early else 8,
+            'max_row': 65 if early else 67, 'excluded': get_excluded_rows(year)}
+
+
+def national_layout(year: int, month: int) -> dict:
+    """Sheet, 0-based columns (year, month, year-to-date[, moving]) and first row of the national table."""
+    mon = MONTH_CODES[month - 1]
+    if year == 2002:
+        return {'sheet': 'Trend', 'cols': [3, 4, 5], 'skiprows': 15, 'nrows': 33}
+    if year == 2003:
+        return {'sheet': 'Trend', 'cols': [3, 4, 5], 'skiprows': 14 if mon in ('may', 'jun') else 15, 'nrows': 34}
+    if year == 2004:
+        if mon in ('jan', 'feb', 'mar', 'apr', 'may'):
+            return {'sheet': 'Page 2', 'cols': [2, 4, 6, 8], 'skiprows': 21, 'nrows': 26}
+        if mon in ('sep', 'oct', 'nov', 'dec'):
+            return {'sheet': 'Page 2', 'cols': [4, 5, 6, 7], 'skiprows': 24, 'nrows': 26}
+        return {'sheet': 'Page 2', 'cols': [2, 3, 4, 5], 'skiprows': 24 if mon == 'aug' else 18, 'nrows': 26}
+    if year <= 2007:
+        skip = {(2005, 'apr'): 25, (2006, 'dec'): 15}.get((year, mon), 24)
+        if year == 2007:
+            skip = 16 if mon == 'jan' else 17
+        return {'sheet': 'Page 2', 'cols': [4, 5, 6, 7], 'skiprows': skip, 'nrows': 26}
+    return {'sheet': 'Data', 'cols': [0, 1, 2, 3], 'skiprows': 8, 'nrows': 26}
+
+
+def sheet_names(year: int) -> list:
+    if year <= 2003:
+        return ['Cover', 'Trend', 'Tables 1 & 2', 'Table 3', 'Table 9b']
+    return [f'Page {i}' for i in range(1, 9)] + (['Data'] if year >= 2008 else [])
+
+
+def report_months(first: int = FIRST_YEAR, last: int = LAST_YEAR) -> list:
+    """(year, month) of every report from January of `first` to December of `last`."""
+    return [(y, m) for y in range(first, last + 1) for m in range(1, 13)]
+
+
+def layout_variants() -> list:
+    """One (year, month) per distinct combination of state and national layout."""
+    seen, out = set(), []
+    for year, month in report_months():
+        s, n = state_layout(year, month), national_layout(year, month)
+        sig = (tuple(s['sheets']), tuple(s['cols']), s['skiprows'], s['max_row'], tuple(s['excluded']),
+               n['sheet'], tuple(n['cols']), n['skiprows'], n['nrows'])
+        if sig not in seen:
+            seen.add(sig)
+            out.append((year, month))
+    return out
+
+
+# --- Values ---------------------------------------------------------------------------------------------
+
+SEASON = np.array([0.86, 0.84, 0.97, 0.99, 1.04, 1.05, 1.08, 1.08, 1.00, 1.03, 0.98, 1.00])
+
+
+def _state_params(n: int, seed: int) -> tuple:
+    """Per-state level (rural, urban, other miles) and station counts."""
+    rng = np.random.default_rng(seed)
+    level = rng.lognormal(mean=6.5, sigma=0.8, size=(n, 3)).round()
+    stations = rng.integers(0, 120, size=(n, 3))
+    stations[:, 2] += stations[:, 0] + stations[:, 1]
+    return level, stations
+
+
+def state_miles(keys: np.ndarray, n_states: int, seed: int = 0) -> np.ndarray:
+    """Miles (states × months × Rural/Urban/All), whole numbers, for the given month keys."""
+    level, _ = _state_params(n_states, seed)
+    keys = np.asarray(keys)
+    growth = 1.012 ** ((keys - month_key(2000, 1)) / 12)
+    wiggle = 1 + 0.02 * np.sin(np.outer(np.arange(n_states) + 1, keys) * 0.7)
+    base = level[:, None, :] * (SEASON[(keys - 1) % 12] * growth)[None, :, None] * wiggle[:, :, None]
+    rural, urban, other = np.round(base[..., 0]), np.round(base[..., 1]), np.round(base[..., 2])
+    return np.stack([rural, urban, rural + urban + other], axis=-1)
+
+
+def national_vmt(key: int) -> float:
+    """National VMT (millions) of one month."""
+    return round(80000 * 1.025 ** ((key - month_key(1970, 1)) / 12) * SEASON[(key - 1) % 12], 3)
+
+
+def expected_state_frame(year: int, month: int, n_states: int = STATE_SLOTS, seed: int = 0) -> pd.DataFrame:
+    """What read_state_miles returns for a synthetic report (before apply_schema)."""
+    key = month_key(year, month)
+    miles = state_miles(np.array([key, key - 12, key - 1, key - 13]), n_states, seed)
+    _, stations = _state_params(n_states, seed)
+    out = pd.DataFrame({'State': state_names(n_states)})
+    for i, measure in enumerate(MEASURES if year >= 2004 else MEASURES[:1]):
+        out[f'{measure}_Stations'] = stations[:, i]
+        out[f'{measure}_Current'] = miles[:, 0, i]
+        out[f'{measure}_Previous'] = miles[:, 1, i]
+        out[f'{measure}_LastMonth_Stations'] = np.maximum(stations[:, i] - 1, 0)
+        out[f'{measure}_LastMonth_Current'] = miles[:, 2, i]
+        out[f'{measure}_LastMonth_Previous'] = miles[:, 3, i]
+    return out
+
+
+def expected_national_frame(year: int, month: int) -> pd.DataFrame:
+    """What read_excel_data returns for a synthetic report: one row per year up to the report year."""
+    nrows = national_layout(year, month)['nrows']
+    years = np.arange(year - nrows + 1, year + 1)
+    tmonth = [national_vmt(month_key(y, month)) for y in years]
+    ytd = [round(sum(national_vmt(month_key(y, m)) for m in range(1, month + 1)), 3) for y in years]
+    moving = [round(sum(national_vmt(month_key(y, month) - i) for i in range(12)), 3) for y in years]
+    return pd.DataFrame({'year_record': years, 'tmonth': tmonth, 'yearToDate': ytd, 'moving': moving})
+
+
+# --- Workbooks ------------------------------------------------------------------------------------------
+
+def _row(width: int, cells: dict) -> list:
+    row = [None] * width
+    for col, value in cells.items():
+        row[col] = value
+    return row
+
+
+def write_workbook(path: str, year: int, month: int, n_states: int = STATE_SLOTS,
+                   extra_rows: int = 0, seed: int = 0) -> None:
+    """Write one synthetic report in the layout of (year, month)."""
+    if n_states > STATE_SLOTS:
+        raise ValueError(f'A workbook holds at most {STATE_SLOTS} states; use `tables` for more')
+    s_layout, n_layout = state_layout(year, month), national_layout(year, month)
+    frame = expected_state_frame(year, month, n_states, seed)
+    slots = [i for i in range(s_layout['max_row'] - s_layout['skiprows']) if i not in s_layout['excluded']]
+    rng = np.random.default_rng(zlib.crc32(f'{seed}:{year}:{month}'.encode()))
+
+    wb = Workbook(write_only=True)
+    for index, name in enumerate(sheet_names(year)):
+        ws = wb.create_sheet(name)
+        ws.append([f'Synthetic TVT report {MONTH_ABBRS[month - 1]} {year}'])
+        if index in s_layout['sheets']:
+            measure = s_layout['sheets'][index]
+            cols, width = s_layout['cols'], max(s_layout['cols']) + 1
+            fields = ['State', 'Stations', 'Current', 'Previous', 'LastMonth_Stations',
+                      'LastMonth_Current', 'LastMonth_Previous']
+            for _ in range(1, s_layout['skiprows']):
+                ws.append([])
+            for i in range(s_layout['max_row'] - s_layout['skiprows']):
+                if i in s_layout['excluded']:
+                    ws.append(_row(width, {cols[0]: 'Subtotal'}))
+                    continue
+                pos = slots.index(i)
+                if pos >= n_states:
+                    ws.append([])
+                    continue
+                rec = frame.iloc[pos]
+                values = [rec['State']] + [rec[f'{measure}_{f}'] for f in fields[1:]]
+                ws.append(_row(width, {c: (v if isinstance(v, str) else int(v)) for c, v in zip(cols, values)}))
+            # Finer-grained detail below the read window (station-level rows)
+            for i in range(extra_rows):
+                ws.append([f'Station {i + 1:06d}', *rng.integers(0, 5000, size=width - 1).tolist()])
+        elif name == n_layout['sheet']:
+            nat = expected_national_frame(year, month)
+            cols = n_layout['cols']
+            for _ in range(1, n_layout['skiprows'] - 1):
+                ws.append([])
+            ws.append(_row(max(cols) + 1, dict(zip(cols, ['Year', MONTH_ABBRS[month - 1], 'Year to Date', 'Moving']))))
+            for rec in nat.itertuples(index=False):
+                values = [int(rec.year_record), rec.tmonth, rec.yearToDate, rec.moving][:len(cols)]
+                ws.append(_row(max(cols) + 1, dict(zip(cols, values))))
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    wb.save(path)
+
+
+def workbook_name(year: int, month: int) -> str:
+    return f'{year % 100:02d}{MONTH_CODES[month - 1]}tvt.xlsx'
+
+
+def generate(out_dir: str, files: int | None = None, n_states: int = STATE_SLOTS, extra_rows: int = 0,
+             seed: int = 0, months: list | None = None) -> list:
+    """
+    Write `files` workbooks (default: one per report month) into out_dir; returns [(path, year, month)].
+
+    Report months are cycled; the second and later rounds go to copy<NN>/ sub-directories so every
+    directory keeps the real naming scheme.
+    """
+    months = months or report_months()
+    files = files or len(months)
+    out = []
+    for i in range(files):
+        year, month = months[i % len(months)]
+        round_ = i // len(months)
+        directory = out_dir if round_ == 0 else os.path.join(out_dir, f'copy{round_:02d}')
+        path = os.path.join(directory, workbook_name(year, month))
+        write_workbook(path, year, month, n_states, extra_rows, seed)
+        out.append((path, year, month))
+    return out
+
+
+# --- Merged tables (inputs of tvt_db.py) --------------------------------------------------------------
+
+def merged_tables(out_dir: str, n_states: int = STATE_SLOTS, n_months: int = 300, seed: int = 0) -> dict:
+    """Write synthetic merged/economic CSVs; returns paths keyed like tvt_db.file_paths."""
+    os.makedirs(out_dir, exist_ok=True)
+    last = month_key(LAST_YEAR, 6)
+    keys = np.arange(last - n_months + 1, last + 1)
+    miles = state_miles(keys, n_states, seed)
+    _, stations = _state_params(n_states, seed)
+    names = state_names(n_states)
+
+    grid = pd.DataFrame({
+        'MonthKey': np.tile(keys, n_states),
+        'State': np.repeat(names, len(keys)),
+        'Rural Arterial Miles': miles[..., 0].ravel(),
+        'Urban Arterial Miles': miles[..., 1].ravel(),
+        'All Miles': miles[..., 2].ravel(),
+        'Rural Arterial Stations': np.repeat(stations[:, 0], len(keys)),
+        'Urban Arterial Stations': np.repeat(stations[:, 1], len(keys)),
+        'All Stations': np.repeat(stations[:, 2], len(keys)),
+    })
+    grid['Other Miles'] = grid['All Miles'] - grid['Rural Arterial Miles'] - grid['Urban Arterial Miles']
+    grid['Other Stations'] = grid['All Stations'] - grid['Rural Arterial Stations'] - grid['Urban Arterial Stations']
+    grid = grid.sort_values(['MonthKey', 'State'], ignore_index=True)
+    grid.insert(0, 'Date', format_mdy(grid['MonthKey']))
+    grid.insert(1, 'Month', format_abbr(grid['MonthKey']))
+    grid.insert(2, 'Year', key_year(grid['MonthKey']))
+
+    vmt = np.array([national_vmt(k) for k in keys])
+    moving = pd.Series(vmt).rolling(12).sum().to_numpy()
+    national = pd.DataFrame({
+        'Date': format_mdy(keys), 'Month': format_abbr(keys), 'Year': key_year(keys),
+        'Total VMT (Million)': vmt,
+        'Year To Date VMT (Million)': pd.Series(vmt).groupby(key_year(keys)).cumsum().to_numpy(),
+        'Moving 12-Month VMT (Million)': moving,
+        'VMT Change Rate(Monthly)': (100 * pd.Series(moving).pct_change()).round(2).to_numpy(),
+        'VMT Change Rate (Annually)': (100 * pd.Series(moving).pct_change(12)).round(2).to_numpy(),
+    })
+
+    quarters = keys[key_month(keys) % 3 == 1]
+    gdp = pd.DataFrame({
+        'Quarter': [f'{key_year(k)} Q{(key_month(k) - 1) // 3 + 1}' for k in quarters],
+        'Date': [f'{MONTH_ABBRS[key_month(k) - 1]} {key_year(k) % 100:02d}' for k in quarters],
+        'GDP in billions of current dollars': (20000 * 1.01 ** np.arange(len(quarters))).round(1),
+    })
+    bls = pd.DataFrame({'Date': format_iso(keys), 'Monthn': key_month(keys), 'Year': key_year(keys)})
+
+    paths = {
+        'state_miles': os.path.join(out_dir, 'merged_tvt_state_miles.csv'),
+        'tvt_data': os.path.join(out_dir, 'merged_tvt_data.csv'),
+        'gdp': os.path.join(out_dir, 'gdp_current_bil.csv'),
+        'lfs': os.path.join(out_dir, 'lfs_participation.csv'),
+        'cpiu': os.path.join(out_dir, 'cpiu.csv'),
+        'unemp': os.path.join(out_dir, 'unemployment_rate.csv'),
+    }
+    grid.drop(columns='MonthKey').to_csv(paths['state_miles'], index=False)
+    national.to_csv(paths['tvt_data'], index=False)
+    gdp.to_csv(paths['gdp'], index=False)
+    bls.assign(**{'Monthly Labor Participation Rate': 62.5}).to_csv(paths['lfs'], index=False)
+    bls.assign(CPI=(250 * 1.002 ** np.arange(len(keys))).round(3), Inflation=2.4).to_csv(paths['cpiu'], index=False)
+    bls.assign(**{'Monthly Unemployment rate': 4.1, 'Monthly Unemployment in tenth': 41}).to_csv(paths['unemp'], index=False)
+    return paths
+
+
+# --- Round-trip check -----------------------------------------------------------------------------------
+
+def check(months: list | None = None, n_states: int = STATE_SLOTS, extra_rows: int = 0) -> list:
+    """Write each report month, read it back with the real readers; returns [(year, month, problem)]."""
+    from merge_tvt_page456 import read_state_miles
+    from merge_tvt_data import read_excel_data
+
+    problems = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for year, month in months or layout_variants():
+            path = os.path.join(tmp, workbook_name(year, month))
+            write_workbook(path, year, month, n_states, extra_rows)
+            # From 2004 the reader outer-joins the three sheets on State, which reorders the rows
+            got = read_state_miles(path, year, month)
+            got = got[got['State'].astype(str) != 'Subtotal'].dropna(subset=['State'])
+            got = got.assign(State=got['State'].astype(str)).set_index('State')
+            want = expected_state_frame(year, month, n_states).set_index('State')
+            if sorted(got.index) != sorted(want.index):
+                problems.append((year, month, 'state names differ'))
+            elif not np.allclose(got.loc[want.index, want.columns].astype('float64'), want.astype('float64')):
+                problems.append((year, month, 'state values differ'))
+
+            got = read_excel_data(path, year).reset_index(drop=True)
+            want = expected_national_frame(year, month)
+            cols = ['year_record', 'tmonth', 'yearToDate'] + (['moving'] if year >= 2004 else [])
+            if len(got) != len(want) or not np.allclose(got[cols].astype('float64'), want[cols].astype('float64'),
+                                                        rtol=1e-6):
+                problems.append((year, month, 'national values differ'))
+    return problems
+
+
+def main(argv: list | None = None) -> None:
+    parser = argparse.ArgumentParser(description='Generate synthetic TVT workbooks and tables.')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p = sub.add_parser('workbooks', help='write synthetic workbooks in every historical layout')
+    p.add_argument('out_dir')
+    p.add_argument('--files', type=int, help='number of workbooks (default: one per report month)')
+    p.add_argument('--states', type=int, default=STATE_SLOTS, help=f'states per sheet (at most {STATE_SLOTS})')
+    p.add_argument('--extra-rows', type=int, default=0, help='detail rows below each state table')
+    p.add_argument('--seed', type=int, default=0)
+    p = sub.add_parser('tables', help='write synthetic merged tables and economic series for tvt_db.py')
+    p.add_argument('out_dir')
+    p.add_argument('--states', type=int, default=STATE_SLOTS)
+    p.add_argument('--months', type=int, default=300)
+    p.add_argument('--seed', type=int, default=0)
+    sub.add_parser('check', help='round-trip one workbook per layout variant through the readers')
+    args = parser.parse_args(argv)
+
+    if args.cmd == 'workbooks':
+        written = generate(args.out_dir, args.files, args.states, args.extra_rows, args.seed)
+        print(f'✔ Wrote {len(written)} synthetic workbooks → {args.out_dir}')
+    elif args.cmd == 'tables':
+        paths = merged_tables(args.out_dir, args.states, args.months, args.seed)
+        print(f'✔ Wrote synthetic tables ({args.states} states × {args.months} months) → {args.out_dir}')
+        for name, path in paths.items():
+            print(f'  {name:<12} {path}')
+    else:
+        variants = layout_variants()
+        problems = check(variants)
+        for year, month, problem in problems:
+            print(f'✖ {workbook_name(year, month)}: {problem}')
+        print(f'{len(problems)} of {len(variants)} layouts failed' if problems
+              else f'✔ All {len(variants)} layout variants read back as written')
+        sys.exit(1 if problems else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,400 @@
+# Warm pipeline worker: runs the DAG's script steps inside one long-lived process.
+# A cold task pays for a fresh interpreter, the pandas/numpy/openpyxl/requests imports and a re-parse of
+# the CSVs and partials the previous task just wrote. The worker imports the libraries once and keeps
+# parsed files in memory (tvt_frames, up to TVT_WORKER_CACHE_MB). Each step is still a clean run: the
+# script executes as __main__ and the pipeline modules are re-imported for it, so module state such as
+# run metrics or the raw store manifest never leaks from one step into the next and edited code is used
+# from the next step on. Output is streamed back to the thin client (`run`), which exits with the
+# step's status, so Airflow logs and retries see what they would see from `python <script>.py`.
+#
+# `run` executes the script cold instead (same output and exit code) whenever the worker cannot take the
+# step: no worker listening on TVT_WORKER_SOCKET, the worker busy with another step (parallel mapped tasks
+# keep their parallelism), a different configuration (the TVT_*/AIRFLOW_HOME/... environment the scripts
+# read at import), or the worker's own code changed since it started (it then exits; `start` replaces it).
+# Steps run one at a time; the worker exits after TVT_WORKER_IDLE seconds without a request.
+#
+# Usage:
+#   python tvt_worker.py start | stop | status | serve
+#   python tvt_worker.py run <script.py> [args ...]
+
+import os
+import io
+import sys
+import json
+import time
+import runpy
+import socket
+import logging
+import argparse
+import importlib
+import threading
+import traceback
+import subprocess
+import socketserver
+from contextlib import redirect_stdout, redirect_stderr
+
+BASE_DIR = os.getenv('AIRFLOW_HOME', '/opt/airflow')
+SOCKET_PATH = os.getenv('TVT_WORKER_SOCKET', os.path.join(BASE_DIR, 'run', 'tvt_worker.sock'))
+LOG_PATH = os.getenv('TVT_WORKER_LOG', os.path.join(BASE_DIR, 'logs', 'worker', 'tvt_worker.log'))
+# Seconds without a request after which the worker exits
+IDLE_SECONDS = float(os.getenv('TVT_WORKER_IDLE', '3600'))
+# Parsed files kept in memory between steps
+CACHE_MB = float(os.getenv('TVT_WORKER_CACHE_MB', '1024'))
+# Seconds `start` waits for a new worker to finish its imports
+START_TIMEOUT = 60
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+# Imported once at startup; importing the pipeline modules pulls in everything they use
+PRELOAD = [
+    'numpy', 'pandas', 'openpyxl', 'requests', 'tqdm',
+    'tvt_locks', 'tvt_commit', 'tvt_ingest', 'tvt_extract', 'merge_tvt_page456', 'merge_tvt_data',
+    'merge_tvt_tables', 'tvt_anomaly', 'tvt_gaps', 'tvt_seasonal', 'tvt_nowcast', 'tvt_coverage', 'tvt_db',
+    'tvt_change_feed',
+]
+# Pipeline modules that live for the whole worker instead of being re-imported for every step
+RESIDENT = {'tvt_worker', 'tvt_frames'}
+# Configuration the scripts read from the environment at import, besides TVT_* and AIRFLOW_HOME
+CONFIG_VARS = (
+    'STATE_MILES_CSV', 'NATIONAL_VMT_CSV', 'FUNCTIONAL_CLASS_CSV', 'REGIONAL_VMT_CSV', 'NOWCAST_CSV', 'DB_DIR',
+    'GDP_DIR', 'CPI_DIR', 'LFS_DIR', 'UNEMP_DIR', 'BLS_API_URL', 'BEA_API_URL',
+)
+# Airflow task context, passed through to each step (profiles and metrics are filed under it)
+CONTEXT_PREFIX = 'AIRFLOW_CTX_'
+
+
+def config_env(environ) -> dict:
+    """The part of an environment that decides what the pipeline scripts do."""
+    return {
+        k: v for k, v in environ.items()
+        if (k.startswith('TVT_') and not k.startswith('TVT_WORKER_')) or k == 'AIRFLOW_HOME' or k in CONFIG_VARS
+    }
+
+
+def _resident_code() -> dict:
+    return {name: os.stat(os.path.join(SCRIPTS_DIR, f'{name}.py')).st_mtime_ns for name in sorted(RESIDENT)}
+
+
+def _request(message: dict, timeout: float | None = 5.0) -> socket.socket:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(SOCKET_PATH)
+        sock.sendall(json.dumps(message).encode() + b'\n')
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def ping() -> dict | None:
+    """Status of the running worker, or None when none is listening."""
+    try:
+        with _request({'op': 'ping'}) as sock:
+            line = sock.makefile('rb').readline()
+        return json.loads(line) if line else None
+    except (OSError, ValueError):
+        return None
+
+
+# ---------------------------------------------------------------- server side
+
+class _Stream(io.TextIOBase):
+    """Text stream that forwards whole lines (or tqdm's \\r updates) to the client."""
+
+    def __init__(self, send):
+        self._send = send
+        self._buf = ''
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        self._buf += text
+        cut = max(self._buf.rfind('\n'), self._buf.rfind('\r'))
+        if cut >= 0 or len(self._buf) > 65536:
+            cut = cut if cut >= 0 else len(self._buf) - 1
+            self._send({'out': self._buf[:cut + 1]})
+            self._buf = self._buf[cut + 1:]
+        return len(text)
+
+    def flush(self) -> None:
+        if self._buf:
+            self._send({'out': self._buf})
+            self._buf = ''
+
+
+class Worker:
+    def __init__(self):
+        self.started = time.time()
+        self.last_request = time.monotonic()
+        self.runs = 0
+        self.cold = 0
+        self.config = config_env(os.environ)
+        self.code = _resident_code()
+        self.busy = threading.Lock()
+        self.server = None
+
+    def status(self) -> dict:
+        import tvt_frames
+        return {
+            'pid': os.getpid(), 'uptime': round(time.time() - self.started, 1), 'runs': self.runs,
+            'sent_cold': self.cold, 'busy': self.busy.locked(), 'cache': tvt_frames.stats(),
+        }
+
+    def refuse(self, request: dict) -> str | None:
+        """Why this step has to run cold, or None."""
+        script = request.get('script', '')
+        if os.path.basename(script) != script or not os.path.isfile(os.path.join(SCRIPTS_DIR, script)):
+            return f'unknown script {script!r}'
+        if _resident_code() != self.code:
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+            return 'worker code changed; worker exiting'
+        client = request.get('config', {})
+        differs = sorted(k for k in client.keys() | self.config.keys() if client.get(k) != self.config.get(k))
+        if differs:
+            return f'configuration differs ({", ".join(differs)})'
+        return None
+
+    def run(self, request: dict, send) -> None:
+        self.last_request = time.monotonic()
+        reason = self.refuse(request)
+        if reason is None and not self.busy.acquire(blocking=False):
+            reason = 'worker busy with another step'
+        if reason is not None:
+            self.cold += 1
+            return send({'cold': reason})
+        try:
+            t0 = time.perf_counter()
+            code = self._execute(request, send)
+            self.runs += 1
+            print(f"{time.strftime('%H:%M:%S')} {request['script']} {' '.join(request.get('args', []))} "
+                  f'→ exit {code} in {time.perf_counter() - t0:.2f}s', flush=True)
+            send({'exit': code, 'seconds': round(time.perf_counter() - t0, 4), 'pid': os.getpid()})
+        finally:
+            self.last_request = time.monotonic()
+            self.busy.release()
+
+    def _execute(self, request: dict, send) -> int:
+        """Run one script as __main__ with the client's argv, cwd and Airflow context."""
+        path = os.path.join(SCRIPTS_DIR, request['script'])
+        stream = _Stream(send)
+        context = {k: v for k, v in request.get('context', {}).items() if k.startswith(CONTEXT_PREFIX)}
+        saved_argv, saved_cwd = sys.argv, os.getcwd()
+        saved_env = {k: v for k, v in os.environ.items() if k.startswith(CONTEXT_PREFIX)}
+        # Fresh pipeline modules for every step: their import-time state belongs to one run
+        for name, module in list(sys.modules.items()):
+            if name not in RESIDENT and name != '__main__' \
+                    and os.path.dirname(getattr(module, '__file__', None) or '') == SCRIPTS_DIR:
+                del sys.modules[name]
+        handlers = [h for h in logging.root.handlers if type(h) is logging.StreamHandler]
+        streams = [h.setStream(stream) for h in handlers]
+        sys.argv = [path, *request.get('args', [])]
+        for k in saved_env:
+            del os.environ[k]
+        os.environ.update(context)
+        try:
+            os.chdir(request.get('cwd') or SCRIPTS_DIR)
+            with redirect_stdout(stream), redirect_stderr(stream):
+                try:
+                    runpy.run_path(path, run_name='__main__')
+                    code = 0
+                except SystemExit as e:
+                    if e.code is None or isinstance(e.code, int):
+                        code = e.code or 0
+                    else:
+                        print(e.code, file=sys.stderr)
+                        code = 1
+                except Exception:
+                    traceback.print_exc()
+                    code = 1
+                stream.flush()
+        finally:
+            sys.argv = saved_argv
+            os.chdir(saved_cwd)
+            for k in context:
+                os.environ.pop(k, None)
+            os.environ.update(saved_env)
+            for handler, old in zip(handlers, streams):
+                if old is not None:
+                    handler.setStream(old)
+        return code
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        worker = self.server.worker
+        lock = threading.Lock()
+        connected = True
+
+        def send(message: dict) -> None:
+            # A client killed mid-step (task timeout) must not break the step's own output
+            nonlocal connected
+            if not connected:
+                return
+            with lock:
+                try:
+                    self.wfile.write(json.dumps(message).encode() + b'\n')
+                    self.wfile.flush()
+                except OSError:
+                    connected = False
+
+        try:
+            request = json.loads(self.rfile.readline() or b'{}')
+        except ValueError:
+            return send({'error': 'bad request'})
+        op = request.get('op')
+        if op == 'ping':
+            send(worker.status())
+        elif op == 'stop':
+            send({'stopping': True, **worker.status()})
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+        elif op == 'run':
+            worker.run(request, send)
+        else:
+            send({'error': f'unknown op {op!r}'})
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve() -> None:
+    """Run the worker in the foreground (what `start` launches in the background)."""
+    if ping():
+        print(f'✔ A worker is already listening on {SOCKET_PATH}')
+        return
+    t0 = time.perf_counter()
+    for name in PRELOAD:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            print(f'⚠ Preloading {name} failed ({e}); steps will import it themselves')
+    import tvt_frames
+    tvt_frames.enable(CACHE_MB)
+
+    worker = Worker()
+    os.makedirs(os.path.dirname(SOCKET_PATH), exist_ok=True)
+    if os.path.exists(SOCKET_PATH):
+        os.unlink(SOCKET_PATH)  # left behind by a worker that did not exit cleanly (nothing answered ping)
+    server = _Server(SOCKET_PATH, _Handler)
+    server.worker = worker
+    worker.server = server
+    os.chmod(SOCKET_PATH, 0o600)
+
+    def watch_idle():
+        while True:
+            time.sleep(min(IDLE_SECONDS, 30))
+            if not worker.busy.locked() and time.monotonic() - worker.last_request > IDLE_SECONDS:
+                print(f'▶ Idle for {IDLE_SECONDS:g}s; exiting', flush=True)
+                server.shutdown()
+                return
+
+    threading.Thread(target=watch_idle, daemon=True).start()
+    print(f'✔ Worker {os.getpid()} ready on {SOCKET_PATH} (imports {time.perf_counter() - t0:.2f}s)', flush=True)
+    try:
+        server.serve_forever(poll_interval=0.5)
+    finally:
+        server.server_close()
+        if os.path.exists(SOCKET_PATH):
+            os.unlink(SOCKET_PATH)
+        print(f'✔ Worker {os.getpid()} stopped after {worker.runs} steps', flush=True)
+
+
+# ---------------------------------------------------------------- client side
+
+def run_cold(script: str, args: list, reason: str) -> None:
+    """Replace this process with `python <script> args` (the task's normal command)."""
+    print(f'⚠ tvt_worker: {reason}; running {script} cold', file=sys.stderr, flush=True)
+    sys.stdout.flush()
+    path = os.path.join(SCRIPTS_DIR, script)
+    os.execv(sys.executable, [sys.executable, path, *args])
+
+
+def run(script: str, args: list) -> int:
+    """Run one step in the worker, streaming its output; falls back to a cold run."""
+    t0 = time.perf_counter()
+    message = {
+        'op': 'run', 'script': script, 'args': args, 'cwd': os.getcwd(), 'config': config_env(os.environ),
+        'context': {k: v for k, v in os.environ.items() if k.startswith(CONTEXT_PREFIX)},
+    }
+    try:
+        sock = _request(message, timeout=None)
+    except OSError:
+        return run_cold(script, args, f'no worker on {SOCKET_PATH}')
+    with sock, sock.makefile('rb') as replies:
+        for line in replies:
+            reply = json.loads(line)
+            if 'out' in reply:
+                sys.stdout.write(reply['out'])
+                sys.stdout.flush()
+            elif 'cold' in reply:
+                return run_cold(script, args, reply['cold'])
+            elif 'exit' in reply:
+                print(f"▶ tvt_worker: {script} ran warm in worker {reply['pid']} "
+                      f"({reply['seconds']:.2f}s step, {time.perf_counter() - t0:.2f}s total)")
+                return reply['exit']
+    # The worker went away mid-step: its partial effects are unknown, so fail like a crashed task
+    print(f'✖ tvt_worker: worker exited while running {script}', file=sys.stderr)
+    return 1
+
+
+def start() -> None:
+    """Launch a background worker unless one is running; never fails (tasks fall back to cold runs)."""
+    status = ping()
+    if status:
+        print(f"✔ Worker {status['pid']} already running ({status['runs']} steps, up {status['uptime']:.0f}s)")
+        return
+    os.makedirs(os.path.dirname(LOG_PATH), exist_ok=True)
+    with open(LOG_PATH, 'a') as log:
+        proc = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), 'serve'], cwd=SCRIPTS_DIR,
+            stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT, start_new_session=True,
+        )
+    deadline = time.monotonic() + START_TIMEOUT
+    while time.monotonic() < deadline:
+        status = ping()
+        if status:
+            print(f"✔ Worker {status['pid']} started on {SOCKET_PATH}; log → {LOG_PATH}")
+            return
+        if proc.poll() is not None:
+            break
+        time.sleep(0.2)
+    print(f'⚠ Worker did not come up (see {LOG_PATH}); steps will run cold')
+
+
+def stop() -> None:
+    try:
+        with _request({'op': 'stop'}) as sock:
+            status = json.loads(sock.makefile('rb').readline())
+        print(f"✔ Worker {status['pid']} stopping after {status['runs']} steps")
+    except (OSError, ValueError):
+        print(f'✔ No worker listening on {SOCKET_PATH}')
+
+
+def main(argv: list | None = None) -> None:
+    parser = argparse.ArgumentParser(description='Warm worker for the pipeline steps.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('serve', help='run the worker in the foreground')
+    sub.add_parser('start', help='start a background worker unless one is running')
+    sub.add_parser('stop', help='stop the running worker')
+    sub.add_parser('status', help='show the running worker')
+    run_p = sub.add_parser('run', help='run a step in the worker (cold if it cannot take it)')
+    run_p.add_argument('script')
+    run_p.add_argument('args', nargs=argparse.REMAINDER)
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        sys.exit(run(args.script, args.args))
+    if args.command == 'serve':
+        serve()
+    elif args.command == 'start':
+        start()
+    elif args.command == 'stop':
+        stop()
+    else:
+        status = ping()
+        print(json.dumps(status, indent=1) if status else f'No worker listening on {SOCKET_PATH}')
+
+
+if __name__ == '__main__':
+    main()